@@ -0,0 +1,261 @@
+# analysis_executor.py - Concurrent, rate-limited LLM calls for email analysis
+#
+# RateLimitedClient wraps the LLM client so every chat completion (single and
+# batched classification, reply drafts, generated bodies) waits for request
+# and token budget, retries 429s with exponential backoff and carries a
+# request timeout. AnalysisExecutor runs independent analysis work on a small
+# thread pool under a shared deadline. The time left is handed to every LLM
+# request made by that work as its timeout, and retry backoff stops at it, so
+# a worker gives up when the caller does and the caller falls back to keyword
+# analysis instead of stalling the sync.
+#
+# Per-stage latency histograms are exposed through /api/health.
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+import bisect
+import os
+import threading
+import time
+
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+# Defaults match Groq's free-tier limits for llama3-8b-8192
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "30000"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "20"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", "45"))
+
+# time.monotonic() deadline of the AnalysisExecutor.map call the current worker runs for
+analysis_deadline: ContextVar[Optional[float]] = ContextVar("analysis_deadline", default=None)
+
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with bucket-resolution percentiles"""
+
+    def __init__(self, buckets_ms: tuple = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+        self.total += 1
+        self.sum_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Upper bound of the bucket holding the pct-th observation (max for the overflow bucket)"""
+        if not self.total:
+            return None
+        rank = pct * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return float(self.buckets_ms[index]) if index < len(self.buckets_ms) else round(self.max_ms, 2)
+        return round(self.max_ms, 2)
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{bound}" for bound in self.buckets_ms] + ["le_inf"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 2) if self.total else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+class StageMetrics:
+    """Latency histograms keyed by stage name"""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            self._histograms.setdefault(stage, LatencyHistogram()).observe(elapsed_ms)
+
+    def timed(self, stage: str, fn: Callable, *args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.observe(stage, (time.perf_counter() - started_at) * 1000)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {stage: histogram.snapshot() for stage, histogram in sorted(self._histograms.items())}
+
+stage_metrics = StageMetrics()
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute; acquire() blocks until both allow.
+
+    A limit of 0 turns limiting off (local and fake providers have no account limits).
+    """
+
+    def __init__(self, requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.unlimited = requests_per_minute <= 0 or tokens_per_minute <= 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int) -> float:
+        """Take one request and `tokens` tokens; returns the seconds spent waiting"""
+        if self.unlimited:
+            return 0.0
+        # A single request larger than the whole minute budget would never fit
+        tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return waited
+                delay = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute if self._requests < 1 else 0,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute if self._tokens < tokens else 0
+                )
+            time.sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds: float):
+        """Empty the request bucket after a 429 so other workers back off too"""
+        if self.unlimited:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._requests = min(self._requests, -seconds * self.requests_per_minute / 60)
+
+def is_rate_limited(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+def retry_after_seconds(error: BaseException) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+def estimate_request_tokens(kwargs: Dict) -> int:
+    """Prompt tokens (about four characters per token) plus the completion allowance"""
+    prompt_chars = sum(len(message.get("content") or "") for message in kwargs.get("messages", []))
+    return prompt_chars // 4 + int(kwargs.get("max_tokens") or 256)
+
+class RateLimitedClient:
+    """Drop-in wrapper for an LLM client (see llm_providers.py): chat.completions.create() is limited, retried and timed"""
+
+    def __init__(self, client, limiter: RateLimiter = None, metrics: StageMetrics = None,
+                 timeout: float = LLM_REQUEST_TIMEOUT_SECONDS):
+        self.client = client
+        self.limiter = limiter or RateLimiter()
+        self.timeout = timeout
+        self.metrics = metrics or stage_metrics
+        self.retries = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        tokens = estimate_request_tokens(kwargs)
+        deadline = analysis_deadline.get()
+        backoff = wait_exponential_jitter(initial=1, max=30)
+
+        def time_left() -> float:
+            return float("inf") if deadline is None else deadline - time.monotonic()
+
+        def wait(retry_state) -> float:
+            # Never back off past the caller's deadline
+            return max(0.0, min(backoff(retry_state), time_left()))
+
+        def before_sleep(retry_state):
+            self.retries += 1
+            error = retry_state.outcome.exception()
+            self.limiter.penalize(retry_after_seconds(error))
+            print(f"⏳ LLM rate limited (attempt {retry_state.attempt_number}), backing off")
+
+        @retry(retry=retry_if_exception(is_rate_limited), stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+               wait=wait, before_sleep=before_sleep, reraise=True)
+        def attempt():
+            self.metrics.observe("rate_limit_wait", self.limiter.acquire(tokens) * 1000)
+            remaining = time_left()
+            if remaining <= 0:
+                raise TimeoutError("analysis deadline passed before the LLM request was sent")
+            request = {**kwargs, "timeout": min(kwargs["timeout"], remaining)}
+            return self.metrics.timed("llm_request", self.client.chat.completions.create, **request)
+
+        return attempt()
+
+    def __getattr__(self, name):
+        # Everything other than chat completions goes straight to the wrapped client
+        return getattr(self.client, name)
+
+class AnalysisExecutor:
+    """Bounded thread pool for analysis work with per-call deadlines"""
+
+    def __init__(self, concurrency: int = ANALYSIS_CONCURRENCY, metrics: StageMetrics = None):
+        self.concurrency = concurrency
+        self.metrics = metrics or stage_metrics
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analysis")
+        self.timeouts = 0
+
+    def map(self, stage: str, fn: Callable, items: List, timeout: float = ANALYSIS_TIMEOUT_SECONDS,
+            fallback: Callable = None) -> List:
+        """fn(item) for every item, concurrently; items that fail or miss the shared
+        deadline get fallback(item) (None without a fallback)"""
+        deadline = time.monotonic() + timeout
+
+        def run(item):
+            # LLM requests made by fn cap their timeout and retries at the deadline
+            token = analysis_deadline.set(deadline)
+            try:
+                return self.metrics.timed(stage, fn, item)
+            finally:
+                analysis_deadline.reset(token)
+
+        futures = [self._pool.submit(run, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                # Work that has not started is dropped; running work stops at the
+                # same deadline through its request timeout
+                future.cancel()
+                self.timeouts += 1
+                print(f"⏱️ {stage} missed its {timeout:g}s deadline; using fallback")
+                results.append(fallback(item) if fallback else None)
+            except Exception as e:
+                print(f"⚠️ {stage} failed: {e}")
+                results.append(fallback(item) if fallback else None)
+        return results
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "timeouts": self.timeouts,
+            "stages": self.metrics.snapshot()
+        }
+
+analysis_executor = AnalysisExecutor()
@@ -0,0 +1,67 @@
+# Offline benchmark for the AI analysis pipeline (local tier, cache, batched
+# LLM classification) against the deterministic fake LLM provider.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_analysis.py [email_count] [fake_latency_ms]
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "invoice payment refund order shipping delay meeting agenda quarterly report budget proposal "
+    "contract renewal feedback complaint urgent deadline schedule problem thanks please question"
+).split()
+SENDERS = ["alice@customer.example", "bob@partner.example", "noreply@shop.example", "news@digest.example"]
+
+def synthetic_email(index: int, rng: random.Random) -> dict:
+    sender = rng.choice(SENDERS)
+    return {
+        "id": f"bench{index:06d}",
+        "from": f"{sender.split('@')[0].title()} <{sender}>",
+        "subject": " ".join(rng.choices(WORDS, k=5)).capitalize(),
+        "snippet": " ".join(rng.choices(WORDS, k=25)),
+        "internalDate": str(int(time.time() * 1000) - index * 60_000),
+        "labels": ["INBOX"],
+        "is_bulk": sender.startswith(("noreply", "news"))
+    }
+
+def main():
+    email_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    os.environ["LLM_PROVIDER"] = "fake"
+    if len(sys.argv) > 2:
+        os.environ["FAKE_LLM_LATENCY_MS"] = sys.argv[2]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["CLASSIFICATION_CACHE_PATH"] = os.path.join(tmp_dir, "bench_cache.db")
+        from analysis_executor import stage_metrics
+        from enhanced_sentiment_system import process_emails_with_enhanced_ai
+        from llm_providers import create_llm_client
+        from local_classifier import classification_tiers
+
+        client = create_llm_client()
+        rng = random.Random(42)
+        emails = [synthetic_email(i, rng) for i in range(email_count)]
+
+        for label in ("cold cache", "warm cache"):
+            batch = [dict(email_data) for email_data in emails]
+            calls_before = client.client.calls
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                process_emails_with_enhanced_ai(batch, client)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<12}{elapsed:>8.2f}s{email_count / elapsed:>10.0f} emails/s"
+                  f"{client.client.calls - calls_before:>8} LLM calls")
+
+        print(f"\nTiers: {classification_tiers.stats()}")
+        for stage, snapshot in stage_metrics.snapshot().items():
+            print(f"{stage:<20}count={snapshot['count']:<6}p50={snapshot['p50_ms']}ms p95={snapshot['p95_ms']}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Benchmark for keyword scoring: the compiled single-pass matcher against the
+# per-keyword substring scans it replaced, over synthetic subject + snippet text.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_keywords.py [email_count]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_classifier import KEYWORD_PATTERNS, RESPONSE_KEYWORDS, URGENCY_KEYWORDS, scan_keywords
+
+FILLER = (
+    "invoice payment refund order shipping delay agenda quarterly report budget contract "
+    "renewal password account security newsletter webinar discount offer feedback team "
+    "release deploy incident outage customer support ticket update the a to of and for"
+).split()
+# Words that contain a keyword; substring matching scored them, the matcher does not
+TRAPS = ["recall", "whyever", "callback", "businesses", "rescheduled", "dealer", "issues"]
+KEYWORDS = sorted({keyword for keywords in KEYWORD_PATTERNS.values() for keyword in keywords}
+                  | set(URGENCY_KEYWORDS) | set(RESPONSE_KEYWORDS))
+
+def synthetic_content(rng: random.Random) -> str:
+    words = rng.choices(FILLER, k=30) + rng.choices(KEYWORDS, k=rng.randint(0, 4))
+    if rng.random() < 0.1:
+        words.append(rng.choice(TRAPS))
+    rng.shuffle(words)
+    return " ".join(words).lower()
+
+def substring_scan(content: str) -> tuple:
+    """The previous implementation: one `in` scan per keyword per list"""
+    categories = {}
+    for category, keywords in KEYWORD_PATTERNS.items():
+        score = sum(1 for keyword in keywords if keyword in content)
+        if score > 0:
+            categories[category] = score
+    urgency = sum(1 for keyword in URGENCY_KEYWORDS if keyword in content)
+    response = sum(1 for keyword in RESPONSE_KEYWORDS if keyword in content)
+    return categories, urgency, response
+
+def run(label: str, fn, contents: list) -> list:
+    start = time.perf_counter()
+    results = [fn(content) for content in contents]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22}{elapsed:>8.2f}s{elapsed / len(contents) * 1e6:>10.2f} µs/email")
+    return results
+
+def main():
+    email_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    contents = [synthetic_content(rng) for _ in range(email_count)]
+
+    print(f"\nScoring {email_count} emails ({len(KEYWORDS)} keywords)\n")
+    old = run("substring scans", substring_scan, contents)
+    new = run("compiled matcher", scan_keywords, contents)
+
+    # Only emails with a trap word should differ
+    differing = sum(1 for before, after in zip(old, new) if before != tuple(after))
+    print(f"\n{differing} of {email_count} emails score differently (word-boundary matching)")
+
+if __name__ == "__main__":
+    main()
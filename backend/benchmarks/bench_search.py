@@ -0,0 +1,87 @@
+# Benchmark for full-text search over a synthetic 100k-message mailbox.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_search.py [message_count]
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+USER_EMAIL = "bench@example.com"
+WORDS = (
+    "invoice payment refund order shipping delay meeting agenda quarterly report "
+    "budget proposal contract renewal password reset account security alert newsletter "
+    "webinar discount offer partnership feedback complaint urgent deadline schedule "
+    "calendar review release deploy incident outage customer support ticket update"
+).split()
+SENDERS = [f"Sender {i} <sender{i}@domain{i % 50}.com>" for i in range(500)]
+QUERIES = ["invoice", "refund delay", "quarterly report", "password", "outage incident", "sched"]
+
+def synthetic_email(index: int, rng: random.Random) -> tuple:
+    subject = " ".join(rng.choices(WORDS, k=6)).capitalize()
+    snippet = " ".join(rng.choices(WORDS, k=25))
+    body = "<html><body><p>" + "</p><p>".join(
+        " ".join(rng.choices(WORDS, k=40)) for _ in range(5)
+    ) + "</p></body></html>"
+    internal_date = 1_700_000_000_000 + index * 60_000
+    return (f"msg{index:07d}", rng.choice(SENDERS), subject, snippet, internal_date, USER_EMAIL, body)
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database.DATABASE_URL = os.path.join(tmp_dir, "bench_emails.db")
+        database.create_tables()
+        database.update_database_schema_for_enhanced_sentiment()
+
+        start = time.perf_counter()
+        conn = database.get_db_connection()
+        for i in range(message_count):
+            email_row = synthetic_email(i, rng)
+            conn.execute("""
+                INSERT INTO emails (id, from_address, subject, snippet, internalDate, user_email)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, email_row[:-1])
+            database.store_email_body(conn.cursor(), email_row[0], email_row[-1])
+        conn.commit()
+        conn.close()
+        ingest_seconds = time.perf_counter() - start
+        print(f"\nIngested {message_count} emails (indexed by triggers) in {ingest_seconds:.1f}s "
+              f"({message_count / ingest_seconds:.0f} msg/s)")
+
+        print(f"\n{'query':<20}{'hits/page':>10}{'p50 ms':>10}{'p99 ms':>10}{'page 5 ms':>11}")
+        for query in QUERIES:
+            timings = []
+            for _ in range(50):
+                start = time.perf_counter()
+                page = database.search_emails(USER_EMAIL, query, limit=20)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            # Walk forward with keyset cursors to show deep pages stay cheap
+            cursor = page["next_cursor"]
+            deep_ms = 0.0
+            for _ in range(4):
+                if not cursor:
+                    break
+                start = time.perf_counter()
+                next_page = database.search_emails(USER_EMAIL, query, limit=20, cursor=cursor)
+                deep_ms = (time.perf_counter() - start) * 1000
+                cursor = next_page["next_cursor"]
+
+            print(f"{query:<20}{len(page['results']):>10}{statistics.median(timings):>10.2f}"
+                  f"{percentile(timings, 0.99):>10.2f}{deep_ms:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Benchmark for email list serialization: generic rows + normalize_email_fields +
+# the default JSON encoder vs. response-shaped rows rendered with orjson.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_serialization.py [message_count]
+
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import database
+
+USER_EMAIL = "bench@example.com"
+PAGE_SIZES = (10, 100, 1000)
+ROUNDS = 30
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def seed(message_count: int):
+    rng = random.Random(7)
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    for i in range(message_count):
+        email_id = f"msg{i:06d}"
+        cursor.execute("""
+            INSERT INTO emails (id, threadId, from_address, subject, snippet, internalDate, user_email,
+                                sentiment, sentiment_display, priority_level, priority_name, confidence)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'INFORMATIONAL', 'Informational', 4, 'Low', 80)
+        """, (email_id, f"t{i // 3}", f"Sender {i % 40} <s{i % 40}@example.com>",
+              f"Subject {i}", "snippet text " * 10, 1_700_000_000_000 + i, USER_EMAIL))
+        database.store_email_body(cursor, email_id, "<p>" + "body text " * rng.randint(200, 2000) + "</p>")
+        database.sync_email_labels(cursor, USER_EMAIL, email_id, ["INBOX", "UNREAD"] if i % 2 else ["INBOX"])
+    conn.commit()
+    conn.close()
+
+def generic_page(normalize_email_fields, limit: int) -> bytes:
+    rows = database.get_emails_from_db(user_email=USER_EMAIL, limit=limit)
+    content = {"emails": [normalize_email_fields(row) for row in rows]}
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+def shaped_page(response_class, limit: int) -> bytes:
+    rows = database.get_emails_from_db(user_email=USER_EMAIL, limit=limit, shaped=True)
+    return response_class(content={"emails": rows}).body
+
+def measure(fn) -> list:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        database.DATABASE_URL = os.path.join(tmp_dir, "bench_emails.db")
+        database.initialize_database()
+        seed(message_count)
+        from main import normalize_email_fields, OrjsonResponse
+
+        results = []
+        for limit in PAGE_SIZES:
+            before = measure(lambda: generic_page(normalize_email_fields, limit))
+            after = measure(lambda: shaped_page(OrjsonResponse, limit))
+            results.append((limit, before, after, len(generic_page(normalize_email_fields, limit)),
+                            len(shaped_page(OrjsonResponse, limit))))
+
+    print(f"\n{'page':>6}{'generic p50':>13}{'p99':>9}{'shaped p50':>12}{'p99':>9}{'bytes before':>14}{'after':>9}")
+    for limit, before, after, bytes_before, bytes_after in results:
+        print(f"{limit:>6}{statistics.median(before):>13.2f}{percentile(before, 0.99):>9.2f}"
+              f"{statistics.median(after):>12.2f}{percentile(after, 0.99):>9.2f}{bytes_before:>14}{bytes_after:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Benchmark for concurrent ingest with one database file vs. N shard files.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_shards.py [users] [emails_per_user] [shard_counts...]
+#
+# A shard count of 0 gives every user a file of its own.
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from shards import ShardRouter, ShardedSQLiteStorage
+
+def ingest(storage: ShardedSQLiteStorage, user_email: str, email_count: int):
+    for i in range(email_count):
+        storage.insert_email({
+            "id": f"{user_email}-{i}",
+            "from": f"Sender {i % 20} <sender{i % 20}@example.com>",
+            "subject": f"Quarterly report {i}",
+            "snippet": "numbers attached",
+            "full_body": "<p>" + "report figures " * 100 + "</p>",
+            "internalDate": 1_700_000_000_000 + i,
+            "labels": '["INBOX"]'
+        }, user_email)
+
+def run(shard_count: int, users: int, emails_per_user: int) -> tuple:
+    # The storage layer logs every call; keep the benchmark output readable
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        database.DATABASE_URL = os.path.join(tmp_dir, "default.db")
+        storage = ShardedSQLiteStorage(ShardRouter(os.path.join(tmp_dir, "shards"), shard_count))
+        storage.initialize()
+        user_emails = [f"user{i}@example.com" for i in range(users)]
+        for user_email in user_emails:
+            storage.get_user_email_count(user_email)  # create shard schemas up front
+        threads = [threading.Thread(target=ingest, args=(storage, user_email, emails_per_user))
+                   for user_email in user_emails]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stored = sum(storage.get_user_email_count(user_email) for user_email in user_emails)
+        database.connection_cache = None
+        return elapsed, stored
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    emails_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    shard_counts = [int(value) for value in sys.argv[3:]] or [1, 2, 4, 8]
+
+    print(f"\n{users} concurrent writers x {emails_per_user} emails")
+    print(f"{'shards':>8}{'seconds':>10}{'emails/s':>12}{'stored':>10}")
+    for shard_count in shard_counts:
+        elapsed, stored = run(shard_count, users, emails_per_user)
+        print(f"{shard_count:>8}{elapsed:>10.2f}{stored / elapsed:>12.0f}{stored:>10}")
+
+if __name__ == "__main__":
+    main()
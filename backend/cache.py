@@ -0,0 +1,75 @@
+# cache.py - In-process read-through cache for normalized email detail and list pages
+#
+# Entries are keyed by user and a per-user generation number. Every committed
+# write for a user (see database.notify_user_changed) bumps that user's
+# generation, so older entries can no longer be reached and age out through the
+# LRU bound or the TTL. A load that races with a write is stored under the old
+# generation and therefore never served.
+
+from typing import Callable, Dict, Optional
+import os
+import threading
+
+from cachetools import TTLCache
+
+import database
+
+EMAIL_CACHE_SIZE = int(os.getenv("EMAIL_CACHE_SIZE", "2048"))
+EMAIL_CACHE_TTL_SECONDS = float(os.getenv("EMAIL_CACHE_TTL_SECONDS", "60"))
+
+class EmailCache:
+    """Size-bounded TTL/LRU cache with per-user invalidation and hit/miss metrics"""
+
+    def __init__(self, maxsize: int = EMAIL_CACHE_SIZE, ttl: float = EMAIL_CACHE_TTL_SECONDS):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: Dict[str, int] = {}
+        self._global_generation = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _key(self, user_email: str, parts: tuple) -> tuple:
+        return (user_email, self._global_generation, self._generations.get(user_email, 0)) + parts
+
+    def get_or_load(self, user_email: str, parts: tuple, loader: Callable):
+        """Return the cached value for (user_email, *parts), calling loader() on a miss.
+
+        A None result from the loader is not cached.
+        """
+        with self._lock:
+            key = self._key(user_email, parts)
+            if key in self._entries:
+                self.metrics["hits"] += 1
+                return self._entries[key]
+            self.metrics["misses"] += 1
+        value = loader()
+        if value is not None:
+            with self._lock:
+                self._entries[key] = value
+        return value
+
+    def invalidate_user(self, user_email: Optional[str] = None):
+        """Drop every entry of one user, or of all users when user_email is None"""
+        with self._lock:
+            if user_email is None:
+                self._global_generation += 1
+            else:
+                self._generations[user_email] = self._generations.get(user_email, 0) + 1
+            self.metrics["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": round(self.metrics["hits"] / lookups * 100, 2) if lookups else 0,
+                "entries": len(self._entries),
+                "max_entries": self._entries.maxsize,
+                "ttl_seconds": self._entries.ttl
+            }
+
+email_cache = EmailCache()
+database.user_change_listeners.append(email_cache.invalidate_user)
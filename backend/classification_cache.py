@@ -0,0 +1,130 @@
+# classification_cache.py - Persistent cache of LLM classification results
+#
+# Keyed by a hash of exactly what goes into the classification prompt (from,
+# subject, snippet, thread digest) plus the model and prompt version, so re-syncs, reloads and
+# repeated newsletters/notifications reuse an earlier answer instead of calling
+# the LLM again. Changing the prompt or model just bumps the version and old
+# entries stop matching; they age out through LRU eviction.
+#
+# The cache lives in its own SQLite file, shared by every user and by every
+# storage backend.
+
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from side_database import SideDatabase
+
+CLASSIFICATION_CACHE_PATH = os.getenv("CLASSIFICATION_CACHE_PATH", "classification_cache.db")
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "50000"))
+
+# A hit refreshes last_used at most this often, so hot keys do not turn every read into a write
+TOUCH_INTERVAL_SECONDS = 60.0
+
+def classification_key(email_data: Dict, model: str, prompt_version: int) -> str:
+    """Hash of the prompt inputs; mirrors the fields (and truncation) used in the prompt"""
+    parts = [
+        prompt_version,
+        model,
+        email_data.get('from', ''),
+        email_data.get('subject', ''),
+        (email_data.get('snippet') or '')[:500]
+    ]
+    if email_data.get('thread_context'):
+        parts.append(email_data['thread_context'])
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class ClassificationCache(SideDatabase):
+    """SQLite-backed LRU cache of classification results with hit-rate metrics"""
+
+    def __init__(self, path: str = CLASSIFICATION_CACHE_PATH, max_entries: int = CLASSIFICATION_CACHE_MAX_ENTRIES):
+        super().__init__(path, ("hits", "misses", "stores", "evictions", "errors"))
+        self.max_entries = max_entries
+        self._entries = 0
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS classification_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_classification_cache_last_used ON classification_cache(last_used)")
+        self._entries = conn.execute("SELECT COUNT(*) FROM classification_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT result, last_used FROM classification_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.metrics["misses"] += 1
+                    return None
+                now = time.time()
+                if now - row[1] >= TOUCH_INTERVAL_SECONDS:
+                    conn.execute("UPDATE classification_cache SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?",
+                                 (now, key))
+                self.metrics["hits"] += 1
+                return json.loads(row[0])
+            except sqlite3.Error as e:
+                # A broken cache must never break analysis; treat it as a miss
+                self.metrics["errors"] += 1
+                print(f"⚠️ Classification cache read failed: {e}")
+                return None
+
+    def put(self, key: str, model: str, prompt_version: int, result: Dict):
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                inserted = conn.execute("""
+                    INSERT INTO classification_cache (key, model, prompt_version, result, created_at, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET result = excluded.result, last_used = excluded.last_used
+                    RETURNING created_at = last_used
+                """, (key, model, prompt_version, json.dumps(result), now, now)).fetchone()[0]
+                self.metrics["stores"] += 1
+                if inserted:
+                    self._entries += 1
+                if self._entries > self.max_entries:
+                    self._evict(conn)
+            except sqlite3.Error as e:
+                self.metrics["errors"] += 1
+                print(f"⚠️ Classification cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        # Trim to 90% of the bound in one statement so eviction is not paid on every put
+        target = int(self.max_entries * 0.9)
+        deleted = conn.execute("""
+            DELETE FROM classification_cache WHERE key IN (
+                SELECT key FROM classification_cache ORDER BY last_used LIMIT ?
+            )
+        """, (self._entries - target,)).rowcount
+        self._entries -= deleted
+        self.metrics["evictions"] += deleted
+        print(f"🧹 Evicted {deleted} least recently used classification cache entries")
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM classification_cache")
+            self._entries = 0
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(
+            hit_rate=round(stats["hits"] / lookups * 100, 2) if lookups else 0,
+            entries=self._entries,
+            max_entries=self.max_entries
+        )
+        return stats
+
+classification_cache = ClassificationCache()
@@ -1,17 +1,86 @@
 # /home/rick110/RickDrive/email_automation/backend/database.py
 
 import sqlite3
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
+import contextvars
+import html
+import itertools
 import json
+import re
+import threading
 import time
+import zlib
 from enhanced_sentiment_system import SENTIMENT_CATEGORIES, PRIORITY_LEVELS
+from priority_scoring import (SETTLED_BUCKET, age_bucket_sql, bucket_for_time_factor, priority_level_sql,
+                              priority_name_sql, static_score_tenths)
+from gmail_utils import EmailProtocolHelper
+from repository import EmailRecord, EMAIL_UPSERT_SQL
 
 DATABASE_URL = "emails.db"  # This will create a file in your backend directory
 
+# Stored in PRAGMA user_version once the schema steps have run. Bump it whenever
+# create_tables() or update_database_schema_for_enhanced_sentiment() changes so
+# existing databases pick the change up on their next start.
+SCHEMA_VERSION = 3
+
+_SCRIPT_STYLE_RE = re.compile(r"<(script|style)[^>]*>.*?</\1>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def html_to_text(body: Optional[str]) -> str:
+    """Reduce an HTML (or plain text) email body to searchable plain text"""
+    if not body:
+        return ""
+    text = _SCRIPT_STYLE_RE.sub(" ", body)
+    text = _TAG_RE.sub(" ", text)
+    text = html.unescape(text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def compress_text(text: Optional[str]) -> Optional[bytes]:
+    """Compress a large text column for storage in email_bodies"""
+    if text is None:
+        return None
+    return zlib.compress(text.encode("utf-8"), 6)
+
+def decompress_text(blob: Optional[bytes]) -> Optional[str]:
+    """Inverse of compress_text"""
+    if blob is None:
+        return None
+    return zlib.decompress(blob).decode("utf-8")
+
+def body_text(blob: Optional[bytes]) -> Optional[str]:
+    """Searchable plain text of a compressed email body"""
+    if blob is None:
+        return None
+    return html_to_text(decompress_text(blob))
+
+# Sharded deployments (see shards.py) point this at the current user's shard file
+# and install a connection cache; otherwise every connection opens DATABASE_URL.
+active_database: contextvars.ContextVar = contextvars.ContextVar("active_database", default=None)
+connection_cache = None
+
+# Called with a user_email (None = every user) after each committed write, so
+# read caches (see cache.py) never serve rows older than that write
+user_change_listeners: List[Callable] = []
+
+def notify_user_changed(user_email: Optional[str]):
+    for listener in user_change_listeners:
+        listener(user_email)
+
 def get_db_connection():
     """Get database connection with row factory for named access"""
-    conn = sqlite3.connect(DATABASE_URL)
+    database_url = active_database.get() or DATABASE_URL
+    if connection_cache is not None:
+        return connection_cache.acquire(database_url)
+    return open_db_connection(database_url)
+
+def open_db_connection(database_url: str):
+    """Open a new SQLite connection with the row factory and SQL functions registered"""
+    conn = sqlite3.connect(database_url)
     conn.row_factory = sqlite3.Row  # This allows access to columns by name
+    # Used by the full-text search triggers, so every connection must register them
+    conn.create_function("html_to_text", 1, html_to_text, deterministic=True)
+    conn.create_function("body_text", 1, body_text, deterministic=True)
     return conn
 
 def create_tables():
@@ -19,6 +88,10 @@ def create_tables():
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Only takes effect on a brand-new database file; lets maintenance hand freed
+    # pages back with incremental_vacuum instead of a full VACUUM
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    
     # Create emails table with all required fields
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS emails (
@@ -37,11 +110,44 @@ def create_tables():
             is_replied INTEGER DEFAULT 0,
             user_email TEXT,
             labels TEXT,
+            sender_id INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """)
     
+    # Senders parsed once at ingest; emails reference them through sender_id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS senders (
+            id INTEGER PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            address TEXT NOT NULL,
+            display_name TEXT,
+            domain TEXT,
+            message_count INTEGER DEFAULT 0,
+            last_seen INTEGER,
+            UNIQUE (user_email, address)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_senders_user_domain ON senders(user_email, domain);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_senders_user_count ON senders(user_email, message_count DESC);")
+    
+    # Gmail labelIds, one row per (email, label), so label filters are index lookups
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_labels (
+            user_email TEXT NOT NULL,
+            email_id TEXT NOT NULL,
+            label_id TEXT NOT NULL,
+            PRIMARY KEY (user_email, email_id, label_id)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_labels_label ON email_labels(user_email, label_id, email_id);")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS email_labels_cleanup AFTER DELETE ON emails BEGIN
+            DELETE FROM email_labels WHERE user_email = old.user_email AND email_id = old.id;
+        END;
+    """)
+    
     # Create user_sync_metadata table for tracking sync status
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS user_sync_metadata (
@@ -56,6 +162,21 @@ def create_tables():
         );
     """)
     
+    # Large per-email payloads live outside the emails row, zlib-compressed, so
+    # list queries never page them in. Keyed by emails.id.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_bodies (
+            id TEXT PRIMARY KEY,
+            full_body BLOB,
+            analysis_details BLOB
+        );
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS email_bodies_cleanup AFTER DELETE ON emails BEGIN
+            DELETE FROM email_bodies WHERE id = old.id;
+        END;
+    """)
+    
     # Create indexes for better performance
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_user_email ON emails(user_email);")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_sentiment ON emails(sentiment);")
@@ -63,11 +184,482 @@ def create_tables():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_internal_date ON emails(internalDate);")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_is_read ON emails(is_read);")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_is_replied ON emails(is_replied);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_user_date ON emails(user_email, internalDate);")
+    
+    create_search_index(cursor)
     
     conn.commit()
     conn.close()
     print("✅ Database tables created successfully")
 
+def create_search_index(cursor):
+    """Create the FTS5 search table and the triggers that keep it in sync with emails.
+
+    The FTS rowid mirrors emails.rowid. A full VACUUM may renumber emails.rowid,
+    so run rebuild_search_index() after one.
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='emails_fts'")
+    existing = cursor.fetchone()
+    index_exists = existing is not None
+    if index_exists and "user_email" not in existing[0]:
+        # Built before user_email was indexed: recreate it empty, the
+        # search_user_email_v1 data migration refills it in the background
+        cursor.execute("DROP TABLE emails_fts")
+        print("🔎 Recreating the search index with user_email")
+    
+    # user_email is UNINDEXED: stored with each row so searches filter on the
+    # FTS row itself, without joining other users' hits back to emails
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+            subject, sender, snippet, body, user_email UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """)
+    
+    cursor.execute("DROP TRIGGER IF EXISTS emails_fts_insert")
+    cursor.execute("""
+        CREATE TRIGGER emails_fts_insert AFTER INSERT ON emails BEGIN
+            INSERT INTO emails_fts(rowid, subject, sender, snippet, body, user_email)
+            VALUES (new.rowid, new.subject, new.from_address, new.snippet, html_to_text(new.full_body), new.user_email);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+            DELETE FROM emails_fts WHERE rowid = old.rowid;
+        END;
+    """)
+    # Bodies are kept in email_bodies, so only the header columns are synced here
+    cursor.execute("DROP TRIGGER IF EXISTS emails_fts_update")
+    cursor.execute("""
+        CREATE TRIGGER emails_fts_update
+        AFTER UPDATE OF subject, from_address, snippet, user_email ON emails BEGIN
+            UPDATE emails_fts
+            SET subject = new.subject, sender = new.from_address, snippet = new.snippet, user_email = new.user_email
+            WHERE rowid = new.rowid;
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS email_bodies_fts_insert AFTER INSERT ON email_bodies BEGIN
+            UPDATE emails_fts SET body = body_text(new.full_body)
+            WHERE rowid = (SELECT rowid FROM emails WHERE id = new.id);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS email_bodies_fts_update
+        AFTER UPDATE OF full_body ON email_bodies BEGIN
+            UPDATE emails_fts SET body = body_text(new.full_body)
+            WHERE rowid = (SELECT rowid FROM emails WHERE id = new.id);
+        END;
+    """)
+    
+    if not index_exists:
+        # Backfill emails stored before the search index existed
+        cursor.execute(SEARCH_INDEX_BACKFILL_SQL)
+        print(f"🔎 Indexed {cursor.rowcount} existing emails for search")
+
+# Prefers the compressed body, falling back to rows not yet moved to email_bodies
+SEARCH_INDEX_BACKFILL_SQL = """
+    INSERT INTO emails_fts(rowid, subject, sender, snippet, body, user_email)
+    SELECT e.rowid, e.subject, e.from_address, e.snippet,
+           COALESCE(body_text(b.full_body), html_to_text(e.full_body)), e.user_email
+    FROM emails e
+    LEFT JOIN email_bodies b ON b.id = e.id
+"""
+
+def backfill_search_index(batch_size: int = 1000, pause_seconds: float = 0.01) -> int:
+    """Index emails that are missing from emails_fts, one batch per transaction"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    indexed_count = 0
+    last_rowid = 0
+    try:
+        while True:
+            cursor.execute("SELECT rowid FROM emails WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size))
+            rowids = [row[0] for row in cursor.fetchall()]
+            if not rowids:
+                break
+            last_rowid = rowids[-1]
+            placeholders = ','.join('?' for _ in rowids)
+            # Rows the triggers indexed in the meantime are skipped
+            cursor.execute(SEARCH_INDEX_BACKFILL_SQL + f"""
+                WHERE e.rowid IN ({placeholders})
+                  AND NOT EXISTS (SELECT 1 FROM emails_fts f WHERE f.rowid = e.rowid)
+            """, rowids)
+            indexed_count += cursor.rowcount
+            conn.commit()
+            time.sleep(pause_seconds)
+        if indexed_count:
+            print(f"🔎 Indexed {indexed_count} emails for search")
+        return indexed_count
+    except Exception as e:
+        print(f"❌ Search index backfill failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def rebuild_search_index() -> int:
+    """Rebuild the full-text search index from the emails table"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("DELETE FROM emails_fts")
+        cursor.execute(SEARCH_INDEX_BACKFILL_SQL)
+        indexed_count = cursor.rowcount
+        cursor.execute("INSERT INTO emails_fts(emails_fts) VALUES ('optimize')")
+        conn.commit()
+        
+        print(f"🔎 Rebuilt search index with {indexed_count} emails")
+        return indexed_count
+        
+    except Exception as e:
+        print(f"❌ Error rebuilding search index: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+# Columns returned by list queries. full_body and analysis_details live in
+# email_bodies and are only loaded for a single-email (detail) fetch.
+EMAIL_LIST_COLUMNS = (
+    "id", "threadId", "historyId", "from_address", "subject", "snippet", "internalDate",
+    "sentiment", "sentiment_display", "priority_level", "priority_name", "confidence",
+    "requires_immediate_attention", "auto_reply_suggested", "priority_static", "priority_bucket",
+    "reply_status", "suggested_reply_body", "is_read", "is_replied", "user_email", "labels",
+    "created_at", "updated_at"
+)
+
+def email_list_projection(alias: str = "") -> str:
+    """Explicit column list for list queries, optionally qualified by a table alias"""
+    prefix = f"{alias}." if alias else ""
+    table = alias or "emails"
+    columns = []
+    for column in EMAIL_LIST_COLUMNS:
+        if column == "labels":
+            # Labels live in email_labels; return them as the JSON array clients expect
+            columns.append(
+                f"(SELECT json_group_array(l.label_id) FROM email_labels l "
+                f"WHERE l.user_email = {table}.user_email AND l.email_id = {table}.id) AS labels"
+            )
+        else:
+            columns.append(f"{prefix}{column}")
+    return ", ".join(columns)
+
+# Detail fetches add the compressed payloads plus any legacy uncompressed values
+EMAIL_DETAIL_PROJECTION = email_list_projection("e") + """,
+    e.full_body AS legacy_full_body, e.analysis_details AS legacy_analysis_details,
+    b.full_body AS full_body_blob, b.analysis_details AS analysis_details_blob"""
+
+# List rows already in the API response shape (the keys normalize_email_fields
+# produces in main.py), minus full_body and payload, which list pages never show
+EMAIL_RESPONSE_COLUMNS = (
+    ("id", "e.id"), ("threadId", "e.threadId"), ("from", "COALESCE(e.from_address, '')"),
+    ("subject", "e.subject"), ("snippet", "e.snippet"), ("sentiment", "e.sentiment"),
+    ("sentiment_display", "e.sentiment_display"), ("priority_level", "e.priority_level"),
+    ("priority_name", "e.priority_name"), ("confidence", "e.confidence"),
+    ("reply_status", "e.reply_status"), ("suggested_reply_body", "e.suggested_reply_body"),
+    ("internalDate", "e.internalDate"), ("is_read", "e.is_read"), ("is_replied", "e.is_replied"),
+    ("user_email", "e.user_email"),
+    ("labels", "(SELECT json_group_array(l.label_id) FROM email_labels l "
+               "WHERE l.user_email = e.user_email AND l.email_id = e.id)")
+)
+EMAIL_RESPONSE_PROJECTION = ", ".join(f'{expression} AS "{name}"' for name, expression in EMAIL_RESPONSE_COLUMNS)
+
+def inflate_email_detail(row) -> Dict:
+    """Turn a detail-projection row into an email dict with decompressed payloads"""
+    email_data = dict(row)
+    full_body_blob = email_data.pop("full_body_blob")
+    analysis_blob = email_data.pop("analysis_details_blob")
+    legacy_full_body = email_data.pop("legacy_full_body")
+    legacy_analysis = email_data.pop("legacy_analysis_details")
+    email_data["full_body"] = decompress_text(full_body_blob) if full_body_blob is not None else legacy_full_body
+    email_data["analysis_details"] = decompress_text(analysis_blob) if analysis_blob is not None else legacy_analysis
+    return email_data
+
+def store_email_body(cursor, email_id: str, full_body: Optional[str], analysis_details=None):
+    """Upsert the compressed body/analysis payload of an email.
+
+    A missing full_body or analysis_details keeps whatever was stored before.
+    """
+    if isinstance(analysis_details, dict):
+        analysis_details = json.dumps(analysis_details)
+    cursor.execute("""
+        INSERT INTO email_bodies (id, full_body, analysis_details)
+        VALUES (?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            full_body = COALESCE(excluded.full_body, email_bodies.full_body),
+            analysis_details = COALESCE(excluded.analysis_details, email_bodies.analysis_details)
+    """, (email_id, compress_text(full_body), compress_text(analysis_details)))
+
+def sync_email_labels(cursor, user_email: str, email_id: str, labels) -> None:
+    """Make email_labels match the full label set of an email (JSON string or list).
+
+    Only the difference is written; None leaves the stored labels untouched.
+    """
+    if labels is None:
+        return
+    if isinstance(labels, str):
+        labels = json.loads(labels) if labels else []
+    wanted = set(labels)
+    cursor.execute("SELECT label_id FROM email_labels WHERE user_email = ? AND email_id = ?",
+                   (user_email, email_id))
+    current = {row[0] for row in cursor.fetchall()}
+    if wanted - current:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO email_labels (user_email, email_id, label_id) VALUES (?, ?, ?)",
+            [(user_email, email_id, label_id) for label_id in wanted - current]
+        )
+    if current - wanted:
+        cursor.executemany(
+            "DELETE FROM email_labels WHERE user_email = ? AND email_id = ? AND label_id = ?",
+            [(user_email, email_id, label_id) for label_id in current - wanted]
+        )
+
+def apply_label_changes(
+    user_email: str,
+    email_id: str,
+    added: List[str] = None,
+    removed: List[str] = None
+) -> bool:
+    """Apply a Gmail label delta without rewriting the stored email.
+
+    UNREAD is mirrored into emails.is_read, since the read filters depend on it.
+    """
+    added = list(added or [])
+    removed = list(removed or [])
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM emails WHERE id = ? AND user_email = ?", (email_id, user_email))
+        if not cursor.fetchone():
+            print(f"⚠️ Email {email_id} not found for user {user_email}")
+            return False
+        
+        cursor.executemany(
+            "INSERT OR IGNORE INTO email_labels (user_email, email_id, label_id) VALUES (?, ?, ?)",
+            [(user_email, email_id, label_id) for label_id in added]
+        )
+        cursor.executemany(
+            "DELETE FROM email_labels WHERE user_email = ? AND email_id = ? AND label_id = ?",
+            [(user_email, email_id, label_id) for label_id in removed]
+        )
+        if "UNREAD" in added or "UNREAD" in removed:
+            cursor.execute("UPDATE emails SET is_read = ? WHERE id = ? AND user_email = ?",
+                           (0 if "UNREAD" in added else 1, email_id, user_email))
+        conn.commit()
+        notify_user_changed(user_email)
+        print(f"🏷️ Labels updated for email {email_id}: +{added} -{removed}")
+        return True
+    except Exception as e:
+        print(f"❌ Error applying label changes to email {email_id}: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def backfill_email_labels(batch_size: int = 1000, pause_seconds: float = 0.01) -> int:
+    """Move legacy JSON emails.labels values into email_labels, one batch per transaction"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    label_count = 0
+    try:
+        while True:
+            cursor.execute("SELECT rowid FROM emails WHERE labels IS NOT NULL LIMIT ?", (batch_size,))
+            rowids = [row[0] for row in cursor.fetchall()]
+            if not rowids:
+                break
+            placeholders = ','.join('?' for _ in rowids)
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO email_labels (user_email, email_id, label_id)
+                SELECT e.user_email, e.id, j.value
+                FROM emails e, json_each(e.labels) j
+                WHERE e.rowid IN ({placeholders}) AND json_valid(e.labels) AND e.user_email IS NOT NULL
+            """, rowids)
+            label_count += cursor.rowcount
+            cursor.execute(f"UPDATE emails SET labels = NULL WHERE rowid IN ({placeholders})", rowids)
+            conn.commit()
+            time.sleep(pause_seconds)
+        if label_count:
+            print(f"🏷️ Moved {label_count} email labels to email_labels")
+        return label_count
+    except Exception as e:
+        print(f"❌ Label backfill failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backfill_priority_scores(batch_size: int = 500, pause_seconds: float = 0.01) -> int:
+    """Derive priority_static/priority_bucket of emails analyzed before they were stored.
+
+    The bucket is the one the email was scored in (from its time_factor), so the
+    next rescore_priorities run brings the level up to date.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    backfilled_count = 0
+    last_id = ""
+    try:
+        while True:
+            cursor.execute("""
+                SELECT e.id, e.analysis_details AS legacy_analysis_details, b.analysis_details AS analysis_details_blob
+                FROM emails e LEFT JOIN email_bodies b ON b.id = e.id
+                WHERE e.priority_static IS NULL AND e.id > ?
+                ORDER BY e.id
+                LIMIT ?
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            updates = []
+            for row in rows:
+                blob = row["analysis_details_blob"]
+                try:
+                    details = json.loads((decompress_text(blob) if blob is not None else row["legacy_analysis_details"]) or "{}")
+                    factors = details.get("priority_factors") if isinstance(details, dict) else None
+                    if factors:
+                        updates.append((static_score_tenths(factors),
+                                        bucket_for_time_factor(factors.get("time_factor", 0)), row["id"]))
+                except (ValueError, TypeError, KeyError):
+                    continue
+            cursor.executemany("UPDATE emails SET priority_static = ?, priority_bucket = ? WHERE id = ?", updates)
+            backfilled_count += len(updates)
+            conn.commit()
+            time.sleep(pause_seconds)
+        if backfilled_count:
+            print(f"⚡ Backfilled priority scores of {backfilled_count} emails")
+        return backfilled_count
+    except Exception as e:
+        print(f"❌ Priority score backfill failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def parse_sender(from_value: str) -> tuple:
+    """Split a raw From header into (address, display_name, domain)"""
+    address = EmailProtocolHelper.extract_email_address(from_value).lower()
+    display_name = EmailProtocolHelper.extract_display_name(from_value)
+    domain = address.rsplit("@", 1)[1] if "@" in address else ""
+    return address, display_name, domain
+
+def resolve_sender_id(cursor, user_email: str, from_value: str) -> Optional[int]:
+    """Get (or create) the senders row for a From header within a user's mailbox"""
+    if not from_value:
+        return None
+    address, display_name, domain = parse_sender(from_value)
+    cursor.execute("""
+        INSERT INTO senders (user_email, address, display_name, domain)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_email, address) DO UPDATE SET display_name = excluded.display_name
+        RETURNING id
+    """, (user_email, address, display_name, domain))
+    return cursor.fetchone()[0]
+
+def create_sender_triggers(cursor):
+    """Keep senders.message_count and last_seen in step with emails.sender_id"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_user_sender ON emails(user_email, sender_id);")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS senders_count_insert
+        AFTER INSERT ON emails WHEN new.sender_id IS NOT NULL BEGIN
+            UPDATE senders
+            SET message_count = message_count + 1,
+                last_seen = MAX(COALESCE(last_seen, 0), COALESCE(new.internalDate, 0))
+            WHERE id = new.sender_id;
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS senders_count_delete
+        AFTER DELETE ON emails WHEN old.sender_id IS NOT NULL BEGIN
+            UPDATE senders SET message_count = message_count - 1 WHERE id = old.sender_id;
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS senders_count_update
+        AFTER UPDATE OF sender_id, internalDate ON emails
+        WHEN old.sender_id IS NOT new.sender_id OR old.internalDate IS NOT new.internalDate BEGIN
+            UPDATE senders SET message_count = message_count - 1 WHERE id = old.sender_id;
+            UPDATE senders
+            SET message_count = message_count + 1,
+                last_seen = MAX(COALESCE(last_seen, 0), COALESCE(new.internalDate, 0))
+            WHERE id = new.sender_id;
+        END;
+    """)
+
+def backfill_sender_ids(batch_size: int = 500, pause_seconds: float = 0.01) -> int:
+    """Parse the senders of emails stored before the senders table existed"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    linked_count = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT DISTINCT user_email, from_address FROM emails
+                WHERE sender_id IS NULL AND from_address != '' AND user_email IS NOT NULL
+                LIMIT ?
+            """, (batch_size,))
+            pairs = cursor.fetchall()
+            if not pairs:
+                break
+            for user_email, from_address in pairs:
+                sender_id = resolve_sender_id(cursor, user_email, from_address)
+                cursor.execute("""
+                    UPDATE emails SET sender_id = ?
+                    WHERE user_email = ? AND from_address = ? AND sender_id IS NULL
+                """, (sender_id, user_email, from_address))
+                linked_count += cursor.rowcount
+            conn.commit()
+            time.sleep(pause_seconds)
+        if linked_count:
+            print(f"👤 Linked {linked_count} emails to parsed senders")
+        return linked_count
+    except Exception as e:
+        print(f"❌ Sender backfill failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_top_senders(user_email: str, limit: int = 10, domain: str = None) -> List[Dict]:
+    """Most frequent senders of a user's mailbox, optionally within one domain"""
+    conn = get_db_connection()
+    try:
+        query = """
+            SELECT id, address, display_name, domain, message_count, last_seen
+            FROM senders
+            WHERE user_email = ? AND message_count > 0
+        """
+        params = [user_email]
+        if domain:
+            query += " AND domain = ?"
+            params.append(domain.lower())
+        query += " ORDER BY message_count DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+    finally:
+        conn.close()
+
+def get_priority_by_domain(user_email: str, limit: int = 10) -> List[Dict]:
+    """Sender domains ranked by how much high-priority mail they send"""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("""
+            SELECT s.domain, COUNT(*) AS count,
+                   AVG(e.priority_level) AS avg_priority,
+                   SUM(e.priority_level <= 2) AS high_priority_count
+            FROM emails e
+            JOIN senders s ON s.id = e.sender_id
+            WHERE e.user_email = ?
+            GROUP BY s.domain
+            ORDER BY high_priority_count DESC, count DESC
+            LIMIT ?
+        """, (user_email, limit)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
 def get_emails_from_db(
     user_email: str = None,
     limit: int = 10,
@@ -76,48 +668,80 @@ def get_emails_from_db(
     reply_status: str = None,
     is_read: bool = None,
     is_replied: bool = None,
-    email_id: str = None
+    email_id: str = None,
+    sender: str = None,
+    label: str = None,
+    shaped: bool = False
 ) -> List[Dict]:
-    """Get emails from database with comprehensive filtering"""
+    """Get emails from database with comprehensive filtering.
+
+    List queries skip the large body columns; a specific email_id lookup
+    also returns the decompressed full_body and analysis_details. With
+    shaped=True list rows come back as API response dicts (EMAIL_RESPONSE_COLUMNS).
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Build query dynamically based on parameters
-    query = "SELECT * FROM emails WHERE 1=1"
+    if email_id:
+        query = f"SELECT {EMAIL_DETAIL_PROJECTION} FROM emails e LEFT JOIN email_bodies b ON b.id = e.id WHERE 1=1"
+    elif shaped:
+        query = f"SELECT {EMAIL_RESPONSE_PROJECTION} FROM emails e WHERE 1=1"
+    else:
+        query = f"SELECT {email_list_projection('e')} FROM emails e WHERE 1=1"
     params = []
 
     # User filtering (most important for multi-user support)
     if user_email:
-        query += " AND user_email = ?"
+        query += " AND e.user_email = ?"
         params.append(user_email)
         
     # Specific email lookup
     if email_id:
-        query += " AND id = ?"
+        query += " AND e.id = ?"
         params.append(email_id)
 
+    # Filter by sender address (resolved through the senders table)
+    if sender:
+        query += " AND e.sender_id IN (SELECT id FROM senders WHERE address = ?"
+        params.append(EmailProtocolHelper.extract_email_address(sender).lower())
+        if user_email:
+            query += " AND user_email = ?"
+            params.append(user_email)
+        query += ")"
+
+    # Filter by Gmail label (INBOX, IMPORTANT, custom labels)
+    if label:
+        if user_email:
+            query += " AND e.id IN (SELECT email_id FROM email_labels WHERE user_email = ? AND label_id = ?)"
+            params.extend([user_email, label])
+        else:
+            query += (" AND EXISTS (SELECT 1 FROM email_labels l WHERE l.user_email = e.user_email"
+                      " AND l.email_id = e.id AND l.label_id = ?)")
+            params.append(label)
+
     # Filter by sentiment
     if sentiment:
-        query += " AND sentiment = ?"
+        query += " AND e.sentiment = ?"
         params.append(sentiment.upper())
         
     # Filter by reply status
     if reply_status:
-        query += " AND reply_status = ?"
+        query += " AND e.reply_status = ?"
         params.append(reply_status)
         
     # Filter by read status
     if is_read is not None:
-        query += " AND is_read = ?"
+        query += " AND e.is_read = ?"
         params.append(1 if is_read else 0)
         
     # Filter by replied status
     if is_replied is not None:
-        query += " AND is_replied = ?"
+        query += " AND e.is_replied = ?"
         params.append(1 if is_replied else 0)
 
     # Order by most recent first
-    query += " ORDER BY internalDate DESC"
+    query += " ORDER BY e.internalDate DESC"
     
     # Add pagination (only if not searching for specific email)
     if not email_id:
@@ -125,10 +749,23 @@ def get_emails_from_db(
         params.extend([limit, offset])
 
     try:
+        if shaped and not email_id:
+            # Plain tuples zipped with the aliases skip the sqlite3.Row -> dict hop
+            cursor.row_factory = None
+            cursor.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            emails = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            conn.close()
+            print(f"📊 Database query returned {len(emails)} emails for user: {user_email}")
+            return emails
+        
         cursor.execute(query, params)
         rows = cursor.fetchall()
         # Convert rows to dictionaries for easier handling
-        emails = [dict(row) for row in rows]
+        if email_id:
+            emails = [inflate_email_detail(row) for row in rows]
+        else:
+            emails = [dict(row) for row in rows]
         conn.close()
         
         print(f"📊 Database query returned {len(emails)} emails for user: {user_email}")
@@ -139,79 +776,114 @@ def get_emails_from_db(
         print(f"❌ Database query error: {e}")
         return []
 
+_SEARCH_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def build_fts_query(text: str) -> Optional[str]:
+    """Turn free-form user input into a safe FTS5 MATCH expression.
+
+    Every word must match (implicit AND) and the last word is treated as a
+    prefix so results update while the user is still typing.
+    """
+    tokens = _SEARCH_TOKEN_RE.findall(text or "")
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+def encode_search_cursor(score: float, rowid: int) -> str:
+    """Encode the keyset position of the last search hit on a page"""
+    return f"{score!r}:{rowid}"
+
+def decode_search_cursor(cursor_value: str) -> Optional[tuple]:
+    """Decode a cursor produced by encode_search_cursor, None if malformed"""
+    try:
+        score, rowid = cursor_value.rsplit(":", 1)
+        return float(score), int(rowid)
+    except (AttributeError, ValueError):
+        return None
+
+def search_emails(
+    user_email: str,
+    query: str,
+    limit: int = 20,
+    cursor: str = None
+) -> Dict:
+    """Full-text search over a user's emails ranked by BM25 with keyset pagination"""
+    match_expression = build_fts_query(query)
+    if not match_expression:
+        return {"results": [], "next_cursor": None, "has_more": False}
+
+    sql = """
+        SELECT e.id, e.threadId, e.from_address, e.subject, e.snippet, e.internalDate,
+               e.sentiment, e.sentiment_display, e.priority_level, e.priority_name,
+               e.reply_status, e.is_read, e.is_replied,
+               emails_fts.rowid AS search_rowid,
+               bm25(emails_fts, 10.0, 4.0, 2.0, 1.0) AS score,
+               snippet(emails_fts, -1, '<mark>', '</mark>', '…', 12) AS match_snippet
+        FROM emails_fts
+        JOIN emails e ON e.rowid = emails_fts.rowid
+        WHERE emails_fts MATCH ? AND emails_fts.user_email = ?
+    """
+    params = [match_expression, user_email]
+
+    # Keyset pagination: continue strictly after the last (score, rowid) returned
+    if cursor:
+        position = decode_search_cursor(cursor)
+        if position is None:
+            raise ValueError(f"Invalid search cursor: {cursor}")
+        last_score, last_rowid = position
+        sql += " AND (score > ? OR (score = ? AND search_rowid > ?))"
+        params.extend([last_score, last_score, last_rowid])
+
+    sql += " ORDER BY score ASC, search_rowid ASC LIMIT ?"
+    params.append(limit + 1)
+
+    conn = get_db_connection()
+    try:
+        rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_search_cursor(rows[-1]["score"], rows[-1]["search_rowid"])
+
+    print(f"🔎 Search '{query}' returned {len(rows)} emails for user: {user_email}")
+    return {"results": rows, "next_cursor": next_cursor, "has_more": has_more}
+
 def insert_email(email_data: Dict, user_email: str = None):
-    """Insert or update email with comprehensive error handling"""
+    """Insert or update an email and every analysis field through one upsert"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         # Ensure user_email is set
-        if user_email:
-            email_data['user_email'] = user_email
-        elif not email_data.get('user_email'):
+        if not user_email:
+            user_email = email_data.get('user_email')
+        if not user_email:
             print("⚠️ Warning: No user_email provided for email insertion")
-            email_data['user_email'] = 'unknown'
+            user_email = 'unknown'
+        email_data['user_email'] = user_email
         
-        # Check if email already exists for this user
-        cursor.execute("SELECT id FROM emails WHERE id = ? AND user_email = ?", 
-                       (email_data['id'], email_data.get('user_email')))
-        existing_email = cursor.fetchone()
-
-        if existing_email:
-            print(f"📝 Updating existing email {email_data['id']} for user {email_data.get('user_email')}")
-            # Update existing email with all fields
-            cursor.execute("""
-                UPDATE emails
-                SET from_address = ?, subject = ?, snippet = ?, sentiment = ?,
-                    reply_status = ?, suggested_reply_body = ?, full_body = ?,
-                    is_read = ?, is_replied = ?, threadId = ?, historyId = ?,
-                    internalDate = ?, labels = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ? AND user_email = ?
-            """, (
-                email_data.get('from', ''),
-                email_data.get('subject', ''),
-                email_data.get('snippet', ''),
-                email_data.get('sentiment', 'N/A'),
-                email_data.get('reply_status', 'Not Replied'),
-                email_data.get('suggested_reply_body'),
-                email_data.get('full_body'),
-                int(email_data.get('is_read', 0)),
-                int(email_data.get('is_replied', 0)),
-                email_data.get('threadId'),
-                email_data.get('historyId'),
-                email_data.get('internalDate'),
-                email_data.get('labels'),
-                email_data['id'],
-                email_data.get('user_email')
-            ))
-        else:
-            print(f"📥 Inserting new email {email_data['id']} for user {email_data.get('user_email')}")
-            # Insert new email with all fields
-            cursor.execute("""
-                INSERT INTO emails (id, threadId, historyId, from_address, subject, snippet, 
-                                  internalDate, sentiment, reply_status, suggested_reply_body, 
-                                  full_body, is_read, is_replied, user_email, labels)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                email_data['id'],
-                email_data.get('threadId'),
-                email_data.get('historyId'),
-                email_data.get('from', ''),
-                email_data.get('subject', ''),
-                email_data.get('snippet', ''),
-                email_data.get('internalDate'),
-                email_data.get('sentiment', 'N/A'),
-                email_data.get('reply_status', 'Not Replied'),
-                email_data.get('suggested_reply_body'),
-                email_data.get('full_body'),
-                int(email_data.get('is_read', 0)),
-                int(email_data.get('is_replied', 0)),
-                email_data.get('user_email'),
-                email_data.get('labels')
-            ))
+        record = EmailRecord.from_email_data(email_data, user_email)
+        params = record.column_values()
+        params.update(id=record.id, user_email=user_email,
+                      sender_id=resolve_sender_id(cursor, user_email, record.from_address))
+        cursor.execute(EMAIL_UPSERT_SQL, params)
+        if cursor.rowcount == 0:
+            print(f"⚠️ Email {record.id} belongs to another user; not saved for {user_email}")
+            conn.rollback()
+            return
+        
+        store_email_body(cursor, record.id, record.full_body, record.analysis_details)
+        sync_email_labels(cursor, user_email, record.id, record.labels)
         
         conn.commit()
-        print(f"✅ Email {email_data['id']} saved successfully")
+        notify_user_changed(user_email)
+        print(f"✅ Email {record.id} saved successfully")
         
     except Exception as e:
         print(f"❌ Error saving email {email_data.get('id', 'unknown')}: {e}")
@@ -224,9 +896,10 @@ def update_email_status(
     user_email: str,
     is_read: bool = None,
     is_replied: bool = None,
-    reply_status: str = None
+    reply_status: str = None,
+    suggested_reply_body: str = None
 ) -> bool:
-    """Update email status with user verification"""
+    """Update email status (or the drafted reply) with user verification"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -246,6 +919,13 @@ def update_email_status(
         if is_read is not None:
             update_fields.append("is_read = ?")
             params.append(1 if is_read else 0)
+            # Keep the UNREAD label in step with the read flag
+            if is_read:
+                cursor.execute("DELETE FROM email_labels WHERE user_email = ? AND email_id = ? AND label_id = 'UNREAD'",
+                               (user_email, email_id))
+            else:
+                cursor.execute("INSERT OR IGNORE INTO email_labels (user_email, email_id, label_id) VALUES (?, ?, 'UNREAD')",
+                               (user_email, email_id))
             
         if is_replied is not None:
             update_fields.append("is_replied = ?")
@@ -254,6 +934,10 @@ def update_email_status(
         if reply_status is not None:
             update_fields.append("reply_status = ?")
             params.append(reply_status)
+            
+        if suggested_reply_body is not None:
+            update_fields.append("suggested_reply_body = ?")
+            params.append(suggested_reply_body)
         
         if not update_fields:
             print("⚠️ No fields to update")
@@ -272,6 +956,7 @@ def update_email_status(
         conn.commit()
         
         if success:
+            notify_user_changed(user_email)
             print(f"✅ Email {email_id} status updated for user {user_email}")
         else:
             print(f"⚠️ No changes made to email {email_id}")
@@ -291,8 +976,12 @@ def get_user_email_count(user_email: str) -> int:
     cursor = conn.cursor()
     
     try:
-        cursor.execute("SELECT COUNT(*) FROM emails WHERE user_email = ?", (user_email,))
-        count = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT value FROM user_email_stats
+            WHERE user_email = ? AND metric = 'total' AND bucket = ''
+        """, (user_email,))
+        row = cursor.fetchone()
+        count = row[0] if row else 0
         print(f"📊 User {user_email} has {count} emails in database")
         return count
     except Exception as e:
@@ -397,6 +1086,7 @@ def update_user_sync_metadata(
             print(f"📥 Created sync metadata for {user_email}")
         
         conn.commit()
+        notify_user_changed(user_email)
         
     except Exception as e:
         print(f"❌ Error updating sync metadata for {user_email}: {e}")
@@ -405,24 +1095,13 @@ def update_user_sync_metadata(
         conn.close()
 
 def delete_user_emails(user_email: str) -> int:
-    """Delete all emails for a specific user (for testing/cleanup)"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute("DELETE FROM emails WHERE user_email = ?", (user_email,))
-        deleted_count = cursor.rowcount
-        conn.commit()
-        
-        print(f"🗑️ Deleted {deleted_count} emails for user {user_email}")
-        return deleted_count
-        
-    except Exception as e:
-        print(f"❌ Error deleting emails for user {user_email}: {e}")
-        conn.rollback()
-        return 0
-    finally:
-        conn.close()
+    """Delete all emails for a specific user (for testing/cleanup), in bounded batches"""
+    job = run_maintenance_job("delete_user_emails", "user_email = ?", (user_email,), changed_user=user_email)
+    if job["state"] == "failed":
+        print(f"❌ Error deleting emails for user {user_email}: {job['error']}")
+    else:
+        print(f"🗑️ Deleted {job['deleted']} emails for user {user_email}")
+    return job["deleted"]
 
 def delete_user_sync_metadata(user_email: str) -> bool:
     """Delete sync metadata for a specific user"""
@@ -435,6 +1114,7 @@ def delete_user_sync_metadata(user_email: str) -> bool:
         conn.commit()
         
         if deleted:
+            notify_user_changed(user_email)
             print(f"🗑️ Deleted sync metadata for user {user_email}")
         else:
             print(f"⚠️ No sync metadata found for user {user_email}")
@@ -449,32 +1129,35 @@ def delete_user_sync_metadata(user_email: str) -> bool:
         conn.close()
 
 def get_database_stats() -> Dict:
-    """Get overall database statistics"""
+    """Get overall database statistics (read from the per-user counters)"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Get total emails count
-        cursor.execute("SELECT COUNT(*) FROM emails")
-        total_emails = cursor.fetchone()[0]
-        
-        # Get unique users count
-        cursor.execute("SELECT COUNT(DISTINCT user_email) FROM emails WHERE user_email IS NOT NULL")
-        unique_users = cursor.fetchone()[0]
+        # Get total emails count and unique users count
+        cursor.execute("""
+            SELECT COALESCE(SUM(value), 0),
+                   COUNT(CASE WHEN user_email != '' AND value > 0 THEN 1 END)
+            FROM user_email_stats
+            WHERE metric = 'total' AND bucket = ''
+        """)
+        total_emails, unique_users = cursor.fetchone()
         
         # Get emails by sentiment
         cursor.execute("""
-            SELECT sentiment, COUNT(*) as count 
-            FROM emails 
-            GROUP BY sentiment
+            SELECT bucket, SUM(value) as count 
+            FROM user_email_stats 
+            WHERE metric = 'sentiment'
+            GROUP BY bucket HAVING SUM(value) > 0
         """)
         sentiment_stats = dict(cursor.fetchall())
         
         # Get emails by reply status
         cursor.execute("""
-            SELECT reply_status, COUNT(*) as count 
-            FROM emails 
-            GROUP BY reply_status
+            SELECT bucket, SUM(value) as count 
+            FROM user_email_stats 
+            WHERE metric = 'reply_status'
+            GROUP BY bucket HAVING SUM(value) > 0
         """)
         reply_stats = dict(cursor.fetchall())
         
@@ -495,32 +1178,176 @@ def get_database_stats() -> Dict:
         conn.close()
 
 def cleanup_old_emails(days_old: int = 30) -> int:
-    """Clean up emails older than specified days (for maintenance)"""
+    """Clean up emails older than specified days (for maintenance), in bounded batches"""
+    # Calculate timestamp for cutoff (30 days ago)
+    cutoff_timestamp = int(time.time() - (days_old * 24 * 60 * 60)) * 1000  # Convert to milliseconds
+    
+    job = run_maintenance_job("cleanup_old_emails", "internalDate < ? AND is_replied = 1", (cutoff_timestamp,))
+    if job["state"] == "failed":
+        print(f"❌ Error cleaning up old emails: {job['error']}")
+    else:
+        print(f"🧹 Cleaned up {job['deleted']} old emails (older than {days_old} days)")
+    return job["deleted"]
+
+# Maintenance runner: large deletes run as many short transactions so syncs and
+# reads can take the write lock between batches. Every deleted row still fires
+# the FTS, body, label, sender and counter triggers, which is why a single
+# mailbox-sized DELETE used to hold the lock for so long.
+MAINTENANCE_BATCH_SIZE = 500
+MAINTENANCE_PAUSE_SECONDS = 0.05
+MAINTENANCE_VACUUM_PAGES = 2000
+MAX_MAINTENANCE_JOBS = 50
+
+maintenance_jobs: Dict[str, Dict] = {}
+_maintenance_job_ids = itertools.count(int(time.time()))
+_maintenance_lock = threading.Lock()
+
+def _new_maintenance_job(kind: str) -> Dict:
+    job = {
+        "id": f"{kind}-{next(_maintenance_job_ids)}",
+        "kind": kind,
+        "state": "pending",
+        "total": None,
+        "deleted": 0,
+        "batches": 0,
+        "rows_per_second": 0.0,
+        "vacuumed_pages": 0,
+        "started_at": None,
+        "finished_at": None,
+        "error": None
+    }
+    with _maintenance_lock:
+        maintenance_jobs[job["id"]] = job
+        # Keep only the most recent jobs around for the status endpoints
+        while len(maintenance_jobs) > MAX_MAINTENANCE_JOBS:
+            maintenance_jobs.pop(next(iter(maintenance_jobs)))
+    return job
+
+def delete_emails_in_batches(
+    where: str,
+    params: tuple = (),
+    job: Dict = None,
+    batch_size: int = MAINTENANCE_BATCH_SIZE,
+    pause_seconds: float = MAINTENANCE_PAUSE_SECONDS,
+    changed_user: Optional[str] = None
+) -> int:
+    """Delete emails matching `where`, committing every batch_size rows and yielding in between.
+
+    changed_user is the only user the delete can touch (None = any user).
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
-    
+    deleted_count = 0
+    started_at = time.time()
     try:
-        # Calculate timestamp for cutoff (30 days ago)
-        cutoff_timestamp = int(time.time() - (days_old * 24 * 60 * 60)) * 1000  # Convert to milliseconds
-        
-        cursor.execute("""
-            DELETE FROM emails 
-            WHERE internalDate < ? AND is_replied = 1
-        """, (cutoff_timestamp,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        
-        print(f"🧹 Cleaned up {deleted_count} old emails (older than {days_old} days)")
+        if job is not None:
+            cursor.execute(f"SELECT COUNT(*) FROM emails WHERE {where}", params)
+            job["total"] = cursor.fetchone()[0]
+        while True:
+            cursor.execute(f"""
+                DELETE FROM emails
+                WHERE rowid IN (SELECT rowid FROM emails WHERE {where} LIMIT ?)
+            """, (*params, batch_size))
+            batch_count = cursor.rowcount
+            conn.commit()
+            if batch_count <= 0:
+                break
+            notify_user_changed(changed_user)
+            deleted_count += batch_count
+            if job is not None:
+                job["deleted"] = deleted_count
+                job["batches"] += 1
+                job["rows_per_second"] = round(deleted_count / max(time.time() - started_at, 1e-6), 1)
+            time.sleep(pause_seconds)
         return deleted_count
-        
-    except Exception as e:
-        print(f"❌ Error cleaning up old emails: {e}")
+    except Exception:
         conn.rollback()
-        return 0
+        raise
+    finally:
+        conn.close()
+
+def run_incremental_vacuum(max_pages: int = MAINTENANCE_VACUUM_PAGES) -> int:
+    """Release up to max_pages free pages back to the filesystem and refresh planner stats.
+
+    Never runs a full VACUUM: that can renumber emails rowids, which emails_fts
+    relies on. Databases created before auto_vacuum=INCREMENTAL was set keep
+    their free pages for reuse instead.
+    """
+    conn = get_db_connection()
+    try:
+        freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+        return freelist_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
     finally:
         conn.close()
 
+def run_maintenance_job(
+    kind: str,
+    where: str,
+    params: tuple = (),
+    job: Dict = None,
+    after: Callable = None,
+    **batch_options
+) -> Dict:
+    """Run a batched delete followed by incremental vacuum and PRAGMA optimize; returns the job record.
+
+    `after` runs once all matching emails are gone, before the vacuum.
+    """
+    job = job or _new_maintenance_job(kind)
+    job.update(state="running", started_at=time.time())
+    try:
+        delete_emails_in_batches(where, params, job=job, **batch_options)
+        if after is not None:
+            after()
+        job["vacuumed_pages"] = run_incremental_vacuum()
+        job["state"] = "completed"
+    except Exception as e:
+        job.update(state="failed", error=str(e))
+    finally:
+        job["finished_at"] = time.time()
+    return job
+
+def start_maintenance_job(
+    kind: str,
+    where: str,
+    params: tuple = (),
+    after: Callable = None,
+    **batch_options
+) -> Dict:
+    """Start run_maintenance_job on a daemon thread and return its job record immediately"""
+    job = _new_maintenance_job(kind)
+    # copy_context keeps the caller's shard routing on the worker thread
+    threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(run_maintenance_job, kind, where, params, job, after),
+        kwargs=batch_options,
+        name=f"maintenance-{job['id']}",
+        daemon=True
+    ).start()
+    return job
+
+def start_cleanup_old_emails(days_old: int = 30) -> Dict:
+    """Background variant of cleanup_old_emails"""
+    cutoff_timestamp = int(time.time() - (days_old * 24 * 60 * 60)) * 1000
+    return start_maintenance_job("cleanup_old_emails", "internalDate < ? AND is_replied = 1", (cutoff_timestamp,))
+
+def start_reset_user_data(user_email: str) -> Dict:
+    """Delete a user's emails in the background, then their sync metadata"""
+    return start_maintenance_job(
+        "reset_user_data", "user_email = ?", (user_email,),
+        after=lambda: delete_user_sync_metadata(user_email), changed_user=user_email
+    )
+
+def get_maintenance_job(job_id: str) -> Optional[Dict]:
+    return maintenance_jobs.get(job_id)
+
+def list_maintenance_jobs() -> List[Dict]:
+    return list(maintenance_jobs.values())
+
 # Utility function for database health check
 def check_database_health() -> bool:
     """Check if database is accessible and tables exist"""
@@ -555,8 +1382,8 @@ def check_database_health() -> bool:
         print(f"❌ Database health check failed: {e}")
         return False
 
-def update_database_schema_for_enhanced_sentiment():
-    """Update database schema to support enhanced sentiment analysis"""
+def update_database_schema_for_enhanced_sentiment() -> bool:
+    """Update database schema to support enhanced sentiment analysis; False (rolled back) on failure"""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
@@ -570,7 +1397,10 @@ def update_database_schema_for_enhanced_sentiment():
             ("confidence", "INTEGER DEFAULT 0"),
             ("requires_immediate_attention", "BOOLEAN DEFAULT FALSE"),
             ("analysis_details", "TEXT DEFAULT '{}'"),
-            ("auto_reply_suggested", "BOOLEAN DEFAULT FALSE")
+            ("auto_reply_suggested", "BOOLEAN DEFAULT FALSE"),
+            ("sender_id", "INTEGER"),
+            ("priority_static", "INTEGER"),
+            ("priority_bucket", "INTEGER")
         ]
         for column_name, column_definition in new_columns:
             if column_name not in existing_columns:
@@ -580,7 +1410,10 @@ def update_database_schema_for_enhanced_sentiment():
             "CREATE INDEX IF NOT EXISTS idx_emails_priority_level ON emails(priority_level);",
             "CREATE INDEX IF NOT EXISTS idx_emails_immediate_attention ON emails(requires_immediate_attention);",
             "CREATE INDEX IF NOT EXISTS idx_emails_priority_user ON emails(priority_level, user_email);",
-            "CREATE INDEX IF NOT EXISTS idx_emails_sentiment_priority ON emails(sentiment, priority_level);"
+            "CREATE INDEX IF NOT EXISTS idx_emails_sentiment_priority ON emails(sentiment, priority_level);",
+            # Only emails young enough to change bucket; see rescore_priorities
+            f"CREATE INDEX IF NOT EXISTS idx_emails_priority_rescore ON emails(internalDate) "
+            f"WHERE priority_bucket < {SETTLED_BUCKET};"
         ]
         for index_sql in indexes:
             cursor.execute(index_sql)
@@ -597,21 +1430,200 @@ def update_database_schema_for_enhanced_sentiment():
             ORDER BY priority_level ASC, internalDate DESC
         """)
         print("📋 Created priority_emails view")
+        create_user_email_stats(cursor)
+        create_sender_triggers(cursor)
         conn.commit()
         print("✅ Database schema update completed successfully")
+        return True
     except Exception as e:
         print(f"❌ Database schema update failed: {e}")
         conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+# --- Materialized per-user counters ---
+# Each entry is (metric, bucket expression, value expression) evaluated against a
+# single emails row ("{row}" is new/old inside triggers, emails during a rebuild).
+# user_email_stats holds the running SUM of every value per (user, metric, bucket).
+USER_STATS_CONTRIBUTIONS = [
+    ("total", "''", "1"),
+    ("unread", "''", "{row}.is_read = 0"),
+    ("replied", "''", "{row}.is_replied = 1"),
+    ("sentiment", "COALESCE({row}.sentiment, '')", "1"),
+    ("sentiment_priority_sum", "COALESCE({row}.sentiment, '')", "COALESCE({row}.priority_level, 0)"),
+    ("sentiment_urgent", "COALESCE({row}.sentiment, '')", "{row}.requires_immediate_attention = 1"),
+    ("priority", "COALESCE(CAST({row}.priority_level AS TEXT), '')", "1"),
+    ("reply_status", "COALESCE({row}.reply_status, '')", "1"),
+    ("urgent_unreplied", "''", "{row}.requires_immediate_attention = 1 AND {row}.is_replied = 0"),
+    ("high_priority_pending", "''", "{row}.priority_level <= 2 AND {row}.is_replied = 0"),
+    # Sum and count of high-priority timestamps give the average age without a scan
+    ("high_priority_dated", "''", "{row}.priority_level <= 2 AND {row}.internalDate IS NOT NULL"),
+    ("high_priority_date_sum", "''",
+     "CASE WHEN {row}.priority_level <= 2 THEN COALESCE({row}.internalDate, 0) ELSE 0 END"),
+]
+
+# Columns whose change can move a row between counters
+USER_STATS_COLUMNS = (
+    "user_email", "is_read", "is_replied", "sentiment", "priority_level",
+    "reply_status", "requires_immediate_attention", "internalDate"
+)
+
+def _user_stats_contributions_sql(row: str, sign: int) -> str:
+    """UNION ALL of one row's (user_email, metric, bucket, value) contributions"""
+    return "\n            UNION ALL ".join(
+        f"SELECT COALESCE({row}.user_email, '') AS user_email, '{metric}' AS metric, "
+        f"{bucket.format(row=row)} AS bucket, {sign} * ({value.format(row=row)}) AS value"
+        for metric, bucket, value in USER_STATS_CONTRIBUTIONS
+    )
+
+def _user_stats_apply_sql(row: str, sign: int) -> str:
+    """Statement that adds (sign=1) or removes (sign=-1) one row from the counters"""
+    return f"""
+        INSERT INTO user_email_stats (user_email, metric, bucket, value)
+        SELECT user_email, metric, bucket, value FROM (
+            {_user_stats_contributions_sql(row, sign)}
+        ) WHERE value != 0
+        ON CONFLICT(user_email, metric, bucket) DO UPDATE SET value = value + excluded.value;
+    """
+
+def _user_stats_expected_sql(user_email: str = None) -> tuple:
+    """Query computing the counters from scratch, optionally for one user"""
+    where = "WHERE user_email = ?" if user_email else ""
+    parts = "\n        UNION ALL ".join(
+        f"SELECT COALESCE(user_email, '') AS user_email, '{metric}' AS metric, "
+        f"{bucket.format(row='emails')} AS bucket, ({value.format(row='emails')}) AS value "
+        f"FROM emails {where}"
+        for metric, bucket, value in USER_STATS_CONTRIBUTIONS
+    )
+    sql = f"""
+        SELECT user_email, metric, bucket, SUM(value) AS value FROM (
+            {parts}
+        ) GROUP BY user_email, metric, bucket HAVING SUM(value) != 0
+    """
+    params = [user_email] * len(USER_STATS_CONTRIBUTIONS) if user_email else []
+    return sql, params
+
+def create_user_email_stats(cursor):
+    """Create user_email_stats and the triggers that keep it current.
+
+    Needs the enhanced sentiment columns, so it runs after they are added.
+    Triggers are recreated every time so changes to USER_STATS_CONTRIBUTIONS apply.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_email_stats'")
+    stats_exist = cursor.fetchone() is not None
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_email_stats (
+            user_email TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            bucket TEXT NOT NULL DEFAULT '',
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_email, metric, bucket)
+        ) WITHOUT ROWID;
+    """)
+    
+    changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in USER_STATS_COLUMNS)
+    for trigger in ("user_email_stats_insert", "user_email_stats_delete", "user_email_stats_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"""
+        CREATE TRIGGER user_email_stats_insert AFTER INSERT ON emails BEGIN
+            {_user_stats_apply_sql('new', 1)}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER user_email_stats_delete AFTER DELETE ON emails BEGIN
+            {_user_stats_apply_sql('old', -1)}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER user_email_stats_update
+        AFTER UPDATE OF {', '.join(USER_STATS_COLUMNS)} ON emails
+        WHEN {changed} BEGIN
+            {_user_stats_apply_sql('old', -1)}
+            {_user_stats_apply_sql('new', 1)}
+        END;
+    """)
+    
+    if not stats_exist:
+        sql, params = _user_stats_expected_sql()
+        cursor.execute(f"INSERT INTO user_email_stats (user_email, metric, bucket, value) {sql}", params)
+        print(f"📈 Built email counters ({cursor.rowcount} rows)")
+
+def rebuild_user_email_stats(user_email: str = None) -> int:
+    """Recompute user_email_stats from the emails table (all users by default)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if user_email:
+            cursor.execute("DELETE FROM user_email_stats WHERE user_email = ?", (user_email,))
+        else:
+            cursor.execute("DELETE FROM user_email_stats")
+        sql, params = _user_stats_expected_sql(user_email)
+        cursor.execute(f"INSERT INTO user_email_stats (user_email, metric, bucket, value) {sql}", params)
+        rebuilt_count = cursor.rowcount
+        conn.commit()
+        print(f"📈 Rebuilt {rebuilt_count} email counters for {user_email or 'all users'}")
+        return rebuilt_count
+    except Exception as e:
+        print(f"❌ Error rebuilding email counters: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+def check_user_email_stats(user_email: str = None) -> List[Dict]:
+    """Compare stored counters with a full recount; returns the mismatching counters"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        sql, params = _user_stats_expected_sql(user_email)
+        cursor.execute(sql, params)
+        expected = {(row[0], row[1], row[2]): row[3] for row in cursor.fetchall()}
+        
+        if user_email:
+            cursor.execute("SELECT user_email, metric, bucket, value FROM user_email_stats "
+                           "WHERE user_email = ? AND value != 0", (user_email,))
+        else:
+            cursor.execute("SELECT user_email, metric, bucket, value FROM user_email_stats WHERE value != 0")
+        stored = {(row[0], row[1], row[2]): row[3] for row in cursor.fetchall()}
+        
+        mismatches = [
+            {"user_email": key[0], "metric": key[1], "bucket": key[2],
+             "stored": stored.get(key, 0), "expected": expected.get(key, 0)}
+            for key in sorted(set(expected) | set(stored))
+            if stored.get(key, 0) != expected.get(key, 0)
+        ]
+        if mismatches:
+            print(f"⚠️ {len(mismatches)} email counters out of sync for {user_email or 'all users'}")
+        else:
+            print(f"✅ Email counters consistent for {user_email or 'all users'}")
+        return mismatches
+    finally:
+        conn.close()
+
+def get_user_email_stats(user_email: str) -> Dict[str, Dict[str, int]]:
+    """Load all counters of a user as {metric: {bucket: value}}"""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            "SELECT metric, bucket, value FROM user_email_stats WHERE user_email = ? AND value != 0",
+            (user_email,)
+        ).fetchall()
     finally:
         conn.close()
+    stats = {}
+    for metric, bucket, value in rows:
+        stats.setdefault(metric, {})[bucket] = value
+    return stats
 
 def get_priority_emails(user_email: str, priority_threshold: int = 3) -> List[Dict]:
     """Get high-priority emails for a user"""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT * FROM emails 
+        cursor.execute(f"""
+            SELECT {email_list_projection()} FROM emails 
             WHERE user_email = ? AND priority_level <= ?
             ORDER BY priority_level ASC, internalDate DESC
             LIMIT 20
@@ -626,6 +1638,48 @@ def get_priority_emails(user_email: str, priority_threshold: int = 3) -> List[Di
     finally:
         conn.close()
 
+def rescore_priorities(now_ms: int = None) -> Dict:
+    """Re-apply the age factor to analyzed emails whose age bucket moved (see priority_scoring.py).
+
+    One UPDATE over the rows still in a moving bucket (idx_emails_priority_rescore);
+    rows whose bucket is unchanged are not written. Returns the updated row count
+    overall and per user.
+    """
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(f"""
+            UPDATE emails SET
+                priority_bucket = r.bucket,
+                priority_level = r.level,
+                priority_name = {priority_name_sql('r.level')},
+                requires_immediate_attention = CASE WHEN r.level <= 2 THEN 1 ELSE 0 END,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT id, bucket, {priority_level_sql('priority_static', 'bucket')} AS level
+                FROM (
+                    SELECT id, priority_static, priority_bucket,
+                           {age_bucket_sql('internalDate', ':now')} AS bucket
+                    FROM emails
+                    WHERE priority_bucket < {SETTLED_BUCKET} AND priority_static IS NOT NULL
+                )
+                WHERE bucket != priority_bucket
+            ) AS r
+            WHERE emails.id = r.id
+            RETURNING emails.user_email
+        """, {"now": now_ms}).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    users: Dict[str, int] = {}
+    for (user_email,) in rows:
+        users[user_email] = users.get(user_email, 0) + 1
+    for user_email in users:
+        notify_user_changed(user_email)
+    if rows:
+        print(f"⏱️ Re-scored priority of {len(rows)} emails for {len(users)} users")
+    return {"updated": len(rows), "users": users}
+
 def get_emails_by_sentiment_category(user_email: str, categories: List[str]) -> List[Dict]:
     """Get emails filtered by sentiment categories"""
     conn = get_db_connection()
@@ -633,7 +1687,7 @@ def get_emails_by_sentiment_category(user_email: str, categories: List[str]) ->
     try:
         placeholders = ','.join(['?' for _ in categories])
         query = f"""
-            SELECT * FROM emails 
+            SELECT {email_list_projection()} FROM emails 
             WHERE user_email = ? AND sentiment IN ({placeholders})
             ORDER BY priority_level ASC, internalDate DESC
         """
@@ -649,61 +1703,156 @@ def get_emails_by_sentiment_category(user_email: str, categories: List[str]) ->
         conn.close()
 
 def get_sentiment_analytics(user_email: str) -> Dict:
-    """Get detailed sentiment analytics for a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """Get detailed sentiment analytics for a user (read from the per-user counters)"""
     try:
-        cursor.execute("""
-            SELECT sentiment, sentiment_display, COUNT(*) as count,
-                   AVG(priority_level) as avg_priority,
-                   SUM(CASE WHEN requires_immediate_attention = 1 THEN 1 ELSE 0 END) as urgent_count
-            FROM emails 
-            WHERE user_email = ?
-            GROUP BY sentiment, sentiment_display
-            ORDER BY count DESC
-        """, (user_email,))
-        sentiment_distribution = [dict(row) for row in cursor.fetchall()]
-        cursor.execute("""
-            SELECT priority_level, priority_name, COUNT(*) as count
-            FROM emails 
-            WHERE user_email = ?
-            GROUP BY priority_level, priority_name
-            ORDER BY priority_level ASC
-        """, (user_email,))
-        priority_distribution = [dict(row) for row in cursor.fetchall()]
-        cursor.execute("""
-            SELECT COUNT(*) as urgent_count
-            FROM emails 
-            WHERE user_email = ? AND requires_immediate_attention = 1 AND is_replied = 0
-        """, (user_email,))
-        urgent_unreplied = cursor.fetchone()[0]
-        cursor.execute("""
-            SELECT 
-                AVG(CASE WHEN priority_level <= 2 THEN 
-                    (julianday('now') - julianday(datetime(internalDate/1000, 'unixepoch'))) * 24 
-                END) as avg_high_priority_response_hours,
-                COUNT(CASE WHEN priority_level <= 2 AND is_replied = 0 THEN 1 END) as high_priority_pending
-            FROM emails 
-            WHERE user_email = ?
-        """, (user_email,))
-        response_analytics = dict(cursor.fetchone())
+        stats = get_user_email_stats(user_email)
+        sentiment_counts = stats.get("sentiment", {})
+        priority_sums = stats.get("sentiment_priority_sum", {})
+        urgent_counts = stats.get("sentiment_urgent", {})
+        sentiment_distribution = sorted(
+            (
+                {
+                    "sentiment": sentiment,
+                    "sentiment_display": SENTIMENT_CATEGORIES.get(sentiment, {}).get("display_name", sentiment),
+                    "count": count,
+                    "avg_priority": priority_sums.get(sentiment, 0) / count,
+                    "urgent_count": urgent_counts.get(sentiment, 0)
+                }
+                for sentiment, count in sentiment_counts.items() if count > 0
+            ),
+            key=lambda item: item["count"],
+            reverse=True
+        )
+        priority_distribution = [
+            {
+                "priority_level": int(level) if level else None,
+                "priority_name": PRIORITY_LEVELS.get(int(level), {}).get("name") if level else None,
+                "count": count
+            }
+            for level, count in sorted(stats.get("priority", {}).items()) if count > 0
+        ]
+        # Average age of high-priority mail = now - mean(internalDate)
+        dated_count = stats.get("high_priority_dated", {}).get("", 0)
+        date_sum = stats.get("high_priority_date_sum", {}).get("", 0)
+        avg_hours = None
+        if dated_count:
+            avg_hours = (time.time() * 1000 - date_sum / dated_count) / (1000 * 60 * 60)
+        response_analytics = {
+            "avg_high_priority_response_hours": avg_hours,
+            "high_priority_pending": stats.get("high_priority_pending", {}).get("", 0)
+        }
         analytics = {
             "sentiment_distribution": sentiment_distribution,
             "priority_distribution": priority_distribution,
-            "urgent_unreplied": urgent_unreplied,
+            "urgent_unreplied": stats.get("urgent_unreplied", {}).get("", 0),
             "response_analytics": response_analytics,
-            "total_emails": sum(item["count"] for item in sentiment_distribution)
+            "total_emails": stats.get("total", {}).get("", 0)
         }
         print(f"📈 Generated sentiment analytics for {user_email}")
         return analytics
     except Exception as e:
         print(f"❌ Error generating sentiment analytics: {e}")
         return {}
+
+# Coarse grouping of sentiment categories, including the pre-migration labels
+POSITIVE_SENTIMENTS = ("APPRECIATION", "OPPORTUNITY", "POSITIVE")
+NEGATIVE_SENTIMENTS = ("URGENT_COMPLAINT", "COMPLAINT", "NEGATIVE")
+
+# SQL expressions mapping internalDate (ms) to the start of its period (UTC)
+ANALYTICS_BUCKETS = {
+    "day": "date(internalDate / 1000, 'unixepoch')",
+    "week": "date(internalDate / 1000, 'unixepoch', 'weekday 0', '-6 days')"
+}
+
+def get_email_analytics(user_email: str, days: int = 30, bucket: str = "day", top_senders: int = 10) -> Dict:
+    """Aggregate email analytics in SQL over the last `days` days (0 = whole mailbox)"""
+    if bucket not in ANALYTICS_BUCKETS:
+        raise ValueError(f"Unsupported bucket '{bucket}', expected one of {list(ANALYTICS_BUCKETS)}")
+    
+    where = "e.user_email = ?"
+    params = [user_email]
+    if days and days > 0:
+        where += " AND e.internalDate >= ?"
+        params.append(int((time.time() - days * 24 * 60 * 60) * 1000))
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if days and days > 0:
+            cursor.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM(is_replied = 1), 0), COALESCE(SUM(is_read = 0), 0)
+                FROM emails e WHERE {where}
+            """, params)
+            total_emails, replied_emails, unread_emails = cursor.fetchone()
+            # Keys match the user_email_stats buckets, where NULL is counted under ''
+            cursor.execute(f"SELECT COALESCE(sentiment, ''), COUNT(*) FROM emails e WHERE {where} GROUP BY 1", params)
+            category_breakdown = dict(cursor.fetchall())
+            cursor.execute(f"""
+                SELECT COALESCE(CAST(priority_level AS TEXT), ''), COUNT(*) FROM emails e WHERE {where} GROUP BY 1
+            """, params)
+            priority_breakdown = dict(cursor.fetchall())
+        else:
+            # The whole mailbox is already counted in user_email_stats
+            stats = get_user_email_stats(user_email)
+            total_emails = stats.get("total", {}).get("", 0)
+            replied_emails = stats.get("replied", {}).get("", 0)
+            unread_emails = stats.get("unread", {}).get("", 0)
+            category_breakdown = stats.get("sentiment", {})
+            priority_breakdown = stats.get("priority", {})
+        
+        if days and days > 0:
+            cursor.execute(f"""
+                SELECT s.address, COUNT(*) AS count FROM emails e
+                JOIN senders s ON s.id = e.sender_id
+                WHERE {where}
+                GROUP BY e.sender_id
+                ORDER BY count DESC
+                LIMIT ?
+            """, params + [top_senders])
+            sender_counts = [[row[0], row[1]] for row in cursor.fetchall()]
+        else:
+            sender_counts = [[sender["address"], sender["message_count"]]
+                             for sender in get_top_senders(user_email, top_senders)]
+        
+        period = ANALYTICS_BUCKETS[bucket]
+        cursor.execute(f"""
+            SELECT {period} AS period, COUNT(*) AS total,
+                   SUM(is_replied = 1) AS replied,
+                   SUM(priority_level <= 2) AS high_priority
+            FROM emails e
+            WHERE {where} AND internalDate IS NOT NULL
+            GROUP BY period
+            ORDER BY period ASC
+        """, params)
+        timeline = [dict(row) for row in cursor.fetchall()]
     finally:
         conn.close()
+    
+    positive = sum(count for category, count in category_breakdown.items() if category in POSITIVE_SENTIMENTS)
+    negative = sum(count for category, count in category_breakdown.items() if category in NEGATIVE_SENTIMENTS)
+    
+    analytics = {
+        "total_emails": total_emails,
+        "replied_emails": replied_emails,
+        "unread_emails": unread_emails,
+        "reply_rate": round(replied_emails / total_emails * 100, 2) if total_emails else 0,
+        "sentiment_breakdown": {
+            "positive": positive,
+            "negative": negative,
+            "neutral": total_emails - positive - negative
+        },
+        "negative_rate": round(negative / total_emails * 100, 2) if total_emails else 0,
+        "category_breakdown": category_breakdown,
+        "priority_breakdown": priority_breakdown,
+        "top_senders": sender_counts,
+        "timeline": timeline,
+        "bucket": bucket
+    }
+    print(f"📈 Aggregated analytics for {user_email}: {total_emails} emails in window")
+    return analytics
 
-def migrate_existing_sentiment_data():
-    """Migrate existing POSITIVE/NEGATIVE/NEUTRAL data to new categories"""
+def migrate_existing_sentiment_data(batch_size: int = 1000, pause_seconds: float = 0.01):
+    """Migrate existing POSITIVE/NEGATIVE/NEUTRAL data to new categories in small batches"""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
@@ -716,46 +1865,213 @@ def migrate_existing_sentiment_data():
         }
         for old_sentiment, new_category in migration_map.items():
             category_info = SENTIMENT_CATEGORIES.get(new_category, {})
-            cursor.execute("""
-                UPDATE emails 
-                SET sentiment = ?, 
-                    sentiment_display = ?,
-                    priority_level = ?,
-                    priority_name = ?,
-                    requires_immediate_attention = ?
-                WHERE sentiment = ?
-            """, (
-                new_category,
-                category_info.get('display_name', new_category),
-                category_info.get('priority', 5),
-                'Medium' if category_info.get('priority', 5) == 3 else 'Low',
-                int(category_info.get('priority', 5) <= 2),
-                old_sentiment
-            ))
-            updated_count = cursor.rowcount
+            updated_count = 0
+            while True:
+                cursor.execute("""
+                    UPDATE emails 
+                    SET sentiment = ?, 
+                        sentiment_display = ?,
+                        priority_level = ?,
+                        priority_name = ?,
+                        requires_immediate_attention = ?
+                    WHERE rowid IN (SELECT rowid FROM emails WHERE sentiment = ? LIMIT ?)
+                """, (
+                    new_category,
+                    category_info.get('display_name', new_category),
+                    category_info.get('priority', 5),
+                    'Medium' if category_info.get('priority', 5) == 3 else 'Low',
+                    int(category_info.get('priority', 5) <= 2),
+                    old_sentiment,
+                    batch_size
+                ))
+                batch_count = cursor.rowcount
+                conn.commit()
+                if batch_count <= 0:
+                    break
+                updated_count += batch_count
+                time.sleep(pause_seconds)
             print(f"📝 Migrated {updated_count} emails from {old_sentiment} to {new_category}")
-        conn.commit()
         print("✅ Sentiment data migration completed")
     except Exception as e:
         print(f"❌ Migration failed: {e}")
         conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def migrate_bodies_to_blob_table(batch_size: int = 500, pause_seconds: float = 0.01) -> int:
+    """Move legacy full_body/analysis_details values into compressed email_bodies rows"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    moved_count = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id, full_body, analysis_details FROM emails
+                WHERE full_body IS NOT NULL
+                   OR (analysis_details IS NOT NULL AND analysis_details != '{}')
+                LIMIT ?
+            """, (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for row in rows:
+                store_email_body(cursor, row["id"], row["full_body"], row["analysis_details"])
+            cursor.executemany(
+                "UPDATE emails SET full_body = NULL, analysis_details = NULL WHERE id = ?",
+                [(row["id"],) for row in rows]
+            )
+            conn.commit()
+            moved_count += len(rows)
+            time.sleep(pause_seconds)
+        if moved_count:
+            print(f"🗜️ Moved {moved_count} email bodies to compressed storage")
+        return moved_count
+    except Exception as e:
+        print(f"❌ Email body migration failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def ensure_user_email_column():
+    """Add user_email to emails tables created before multi-user support"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA table_info(emails)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if columns and 'user_email' not in columns:
+            print("📝 Adding user_email column to emails table...")
+            cursor.execute("ALTER TABLE emails ADD COLUMN user_email TEXT")
+            conn.commit()
+            print("✅ user_email column added successfully")
+    finally:
+        conn.close()
+
+# One-off data rewrites, recorded in schema_migrations once they finish.
+# They run in batches on a background thread so startup never waits for them.
+DATA_MIGRATIONS = [
+    ("sentiment_categories_v1", migrate_existing_sentiment_data),
+    ("email_bodies_v1", migrate_bodies_to_blob_table),
+    ("sender_ids_v1", backfill_sender_ids),
+    ("email_labels_v1", backfill_email_labels),
+    ("priority_scores_v1", backfill_priority_scores),
+    ("search_user_email_v1", backfill_search_index)
+]
+
+migration_status = {"state": "idle", "pending": [], "completed": [], "error": None, "duration_seconds": None}
+
+def get_schema_version() -> int:
+    """Schema version recorded in PRAGMA user_version"""
+    conn = get_db_connection()
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+def get_pending_data_migrations() -> List[str]:
+    """Names of DATA_MIGRATIONS that have not completed yet"""
+    conn = get_db_connection()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        completed = {row[0] for row in conn.execute("SELECT name FROM schema_migrations").fetchall()}
     finally:
         conn.close()
+    return [name for name, _ in DATA_MIGRATIONS if name not in completed]
 
-def initialize_enhanced_sentiment_system():
-    """Initialize the enhanced sentiment system"""
+def run_data_migrations(names: List[str] = None) -> bool:
+    """Run pending data migrations in order, recording each one as it completes"""
+    pending = names if names is not None else get_pending_data_migrations()
+    migration_status.update(state="running", pending=list(pending), error=None)
+    started_at = time.time()
     try:
-        print("🚀 Initializing Enhanced Sentiment System...")
-        update_database_schema_for_enhanced_sentiment()
-        migrate_existing_sentiment_data()
-        print("✅ Enhanced Sentiment System initialized successfully!")
+        for name, migration in DATA_MIGRATIONS:
+            if name not in pending:
+                continue
+            print(f"🔄 Running data migration {name}...")
+            migration()
+            conn = get_db_connection()
+            try:
+                conn.execute("INSERT OR IGNORE INTO schema_migrations (name) VALUES (?)", (name,))
+                conn.commit()
+            finally:
+                conn.close()
+            notify_user_changed(None)
+            migration_status["pending"].remove(name)
+            migration_status["completed"].append(name)
+        migration_status["state"] = "completed"
         return True
     except Exception as e:
-        print(f"❌ Failed to initialize enhanced sentiment system: {e}")
+        print(f"❌ Data migration failed: {e}")
+        migration_status.update(state="failed", error=str(e))
         return False
+    finally:
+        migration_status["duration_seconds"] = round(time.time() - started_at, 3)
+
+def start_background_migrations() -> Optional[threading.Thread]:
+    """Run pending data migrations on a daemon thread; None if nothing is pending"""
+    pending = get_pending_data_migrations()
+    if not pending:
+        migration_status.update(state="completed", pending=[])
+        return None
+    print(f"🧵 Starting background data migrations: {pending}")
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run_data_migrations, pending),
+                              name="data-migrations", daemon=True)
+    thread.start()
+    return thread
 
-# Initialize database on import
+def initialize_database() -> Dict:
+    """Bring the schema up to SCHEMA_VERSION, skipping all schema work when it already is.
+
+    Returns per-step timings in milliseconds. Data migrations are not run here,
+    see start_background_migrations().
+    """
+    timings = {}
+    started_at = time.perf_counter()
+    current_version = get_schema_version()
+    timings["version_check_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+    
+    if current_version >= SCHEMA_VERSION:
+        print(f"⚡ Database schema v{current_version} is current, skipping schema setup")
+        timings["schema_version"] = current_version
+        return timings
+    
+    print(f"🔧 Upgrading database schema v{current_version} -> v{SCHEMA_VERSION}...")
+    step_started = time.perf_counter()
+    ensure_user_email_column()
+    create_tables()
+    if not update_database_schema_for_enhanced_sentiment():
+        # Leave user_version behind so the next start retries the upgrade
+        raise RuntimeError(f"Schema upgrade v{current_version} -> v{SCHEMA_VERSION} failed")
+    timings["schema_setup_ms"] = round((time.perf_counter() - step_started) * 1000, 2)
+    
+    conn = get_db_connection()
+    try:
+        conn.execute(f"PRAGMA user_version = {int(SCHEMA_VERSION)}")
+        conn.commit()
+    finally:
+        conn.close()
+    timings["schema_version"] = SCHEMA_VERSION
+    return timings
+
+# Maintenance commands: python database.py check-stats | rebuild-stats [user_email]
 if __name__ == "__main__":
+    import sys
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    target_user = sys.argv[2] if len(sys.argv) > 2 else None
+    if command == "check-stats":
+        sys.exit(1 if check_user_email_stats(target_user) else 0)
+    if command == "rebuild-stats":
+        rebuild_user_email_stats(target_user)
+        sys.exit(0)
+    
     print("🔧 Initializing database...")
     create_tables()
     health_ok = check_database_health()
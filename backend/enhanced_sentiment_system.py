@@ -1,7 +1,15 @@
 import time
-from datetime import datetime, timedelta
 from typing import Dict, Tuple, Optional, List
 import json
+import os
+
+from analysis_executor import analysis_executor, stage_metrics
+from classification_cache import classification_cache, classification_key
+from llm_providers import LLM_MODEL
+from thread_summaries import attach_thread_context, remember_thread_messages
+from local_classifier import classification_tiers, confident_local_classification, keyword_scores, scan_keywords
+from priority_scoring import PRIORITY_LEVELS, age_bucket, level_for_score, static_score_tenths, time_factor
+from repository import EMAIL_UPSERT_COLUMNS
 
 # Enhanced sentiment categories that are user-friendly
 SENTIMENT_CATEGORIES = {
@@ -79,19 +87,18 @@ SENTIMENT_CATEGORIES = {
     }
 }
 
-# Priority levels for better organization
-PRIORITY_LEVELS = {
-    1: {"name": "Critical", "color": "text-red-600", "urgent": True},
-    2: {"name": "High", "color": "text-orange-600", "urgent": True},
-    3: {"name": "Medium", "color": "text-blue-600", "urgent": False},
-    4: {"name": "Low", "color": "text-green-600", "urgent": False},
-    5: {"name": "Very Low", "color": "text-gray-600", "urgent": False}
-}
+# Bump CLASSIFICATION_PROMPT_VERSION whenever the classification prompt changes,
+# so cached results from the old prompt are no longer reused
+CLASSIFICATION_MODEL = LLM_MODEL
+CLASSIFICATION_PROMPT_VERSION = 1
 
-def calculate_email_priority_score(email_data: dict, sentiment_category: str) -> Tuple[int, dict]:
+def calculate_email_priority_score(email_data: dict, sentiment_category: str, now_ms: int = None) -> Tuple[int, dict]:
     """
     Calculate comprehensive priority score based on multiple factors
     Returns: (priority_score, priority_details)
+    
+    Only time_factor depends on when this runs; priority_scoring re-applies it
+    as the email ages (see rescore_priorities in the storage backends).
     """
     base_priority = SENTIMENT_CATEGORIES.get(sentiment_category, {}).get("priority", 5)
     priority_factors = {
@@ -103,45 +110,48 @@ def calculate_email_priority_score(email_data: dict, sentiment_category: str) ->
     }
     
     # Time-based urgency (recent emails get slight priority boost)
-    if email_data.get('internalDate'):
-        email_time = datetime.fromtimestamp(int(email_data['internalDate']) / 1000)
-        time_diff = datetime.now() - email_time
-        
-        if time_diff < timedelta(hours=2):
-            priority_factors["time_factor"] = -0.5  # Boost priority
-        elif time_diff < timedelta(hours=24):
-            priority_factors["time_factor"] = -0.2
+    bucket = age_bucket(email_data.get('internalDate'), now_ms)
+    priority_factors["time_factor"] = time_factor(bucket)
     
     # Sender importance (basic domain analysis)
     sender = email_data.get('from', '').lower()
     if any(domain in sender for domain in ['@gmail.com', '@company.com', '@important-client.com']):
         priority_factors["sender_importance"] = -0.3
     
-    # Keyword-based urgency detection
+    # Keyword-based urgency and response expectation, found in one scan
     content = f"{email_data.get('subject', '')} {email_data.get('snippet', '')}".lower()
-    urgent_keywords = ['urgent', 'asap', 'emergency', 'critical', 'immediate', 'deadline']
+    keywords = scan_keywords(content)
     
-    urgent_count = sum(1 for keyword in urgent_keywords if keyword in content)
-    if urgent_count > 0:
-        priority_factors["keyword_urgency"] = min(-1.0, -0.3 * urgent_count)
+    if keywords.urgency > 0:
+        priority_factors["keyword_urgency"] = min(-1.0, -0.3 * keywords.urgency)
     
-    # Response expectation keywords
-    response_keywords = ['please reply', 'need response', 'waiting for', 'follow up']
-    if any(keyword in content for keyword in response_keywords):
+    if keywords.response > 0:
         priority_factors["response_expectation"] = -0.5
     
-    # Calculate final priority
-    final_priority = base_priority + sum(priority_factors.values())
-    final_priority = max(1, min(5, round(final_priority)))
+    # Calculate final priority (base + all factors, in tenths so re-scoring in SQL matches)
+    final_priority = level_for_score(static_score_tenths(priority_factors), bucket)
     
-    return int(final_priority), priority_factors
+    return final_priority, priority_factors
 
-def analyze_email_sentiment_enhanced(email_data: dict, groq_client) -> dict:
-    """
-    Enhanced sentiment analysis with user-friendly categories and prioritization
-    """
-    # Default values
-    default_result = {
+CATEGORY_PROMPT_LIST = """Available categories:
+    - URGENT_COMPLAINT: Angry customer, serious issue, escalated problem
+    - COMPLAINT: Customer dissatisfaction, problem report, negative feedback
+    - QUESTION: Request for information, asking for help, inquiry
+    - REQUEST: Action item, task request, asking for something specific
+    - APPRECIATION: Thank you, praise, positive feedback, gratitude
+    - INFORMATIONAL: Updates, news, announcements, FYI content
+    - OPPORTUNITY: Business opportunity, potential deal, sales lead
+    - MEETING_INVITE: Meeting invitation, calendar invite, scheduling"""
+
+# Categories whose high-priority emails get a drafted reply (see reply_drafts.py)
+REPLY_DRAFT_CATEGORIES = ("URGENT_COMPLAINT", "COMPLAINT")
+REPLY_ELIGIBLE_STATUS = "Reply Needed"  # one of repository.ANALYSIS_REPLY_STATUSES
+REPLY_DRAFTED_STATUS = "AI Reply Suggested"
+
+CLASSIFIER_SYSTEM_PROMPT = "You are an expert email analyst. Categorize emails accurately based on content and tone. Always respond with valid JSON only."
+
+def default_analysis_result() -> dict:
+    return {
         "sentiment_category": "INFORMATIONAL",
         "sentiment_display": SENTIMENT_CATEGORIES["INFORMATIONAL"]["display_name"],
         "priority_level": 5,
@@ -153,160 +163,389 @@ def analyze_email_sentiment_enhanced(email_data: dict, groq_client) -> dict:
         "requires_immediate_attention": False,
         "auto_reply_suggested": False
     }
+
+def keyword_classification(email_data: dict) -> Tuple[str, int, str]:
+    content_lower = f"{email_data.get('subject', '')} {email_data.get('snippet', '')}".lower()
+    return fallback_keyword_analysis(content_lower), 30, "Fallback keyword analysis"
+
+def cached_classification(email_data: dict) -> Optional[Tuple[str, int, str]]:
+    cached = classification_cache.get(
+        classification_key(email_data, CLASSIFICATION_MODEL, CLASSIFICATION_PROMPT_VERSION)
+    )
+    if not cached:
+        return None
+    return cached["category"], cached["confidence"], cached["reasoning"]
+
+def remember_classification(email_data: dict, classification: Tuple[str, int, str]):
+    category, confidence, reasoning = classification
+    classification_cache.put(
+        classification_key(email_data, CLASSIFICATION_MODEL, CLASSIFICATION_PROMPT_VERSION),
+        CLASSIFICATION_MODEL, CLASSIFICATION_PROMPT_VERSION,
+        {"category": category, "confidence": confidence, "reasoning": reasoning}
+    )
+
+def build_analysis_result(email_data: dict, classification: Tuple[str, int, str], source: str) -> dict:
+    """Turn a (category, confidence, reasoning) classification into the full analysis result.
+
+    No reply is drafted here: emails that deserve one are marked REPLY_ELIGIBLE_STATUS and
+    drafted later by reply_drafts (on first open or in the background).
+    """
+    category, confidence, reasoning = classification
     
-    if not groq_client:
-        print("⚠️ Groq client not available, using default categorization")
-        return default_result
+    # Validate category exists
+    if category not in SENTIMENT_CATEGORIES:
+        print(f"⚠️ Unknown category '{category}', defaulting to INFORMATIONAL")
+        category = "INFORMATIONAL"
+    
+    # Calculate priority
+    now_ms = int(time.time() * 1000)
+    priority_level, priority_factors = calculate_email_priority_score(email_data, category, now_ms)
+    
+    # Get category details
+    category_info = SENTIMENT_CATEGORIES[category]
+    priority_info = PRIORITY_LEVELS[priority_level]
     
+    # Build result
+    result = {
+        "sentiment_category": category,
+        "sentiment_display": category_info["display_name"],
+        "priority_level": priority_level,
+        "priority_name": priority_info["name"],
+        "confidence": confidence,
+        "analysis_details": {
+            "reasoning": reasoning,
+            "classification_source": source,
+            "priority_factors": priority_factors,
+            "auto_reply_enabled": category_info["auto_reply"],
+            "notification_enabled": category_info["notification"]
+        },
+        "requires_immediate_attention": priority_level <= 2,
+        "auto_reply_suggested": category_info["auto_reply"] and priority_level <= 2,
+        # Inputs of the periodic re-scoring (priority_scoring.py)
+        "priority_static": static_score_tenths(priority_factors),
+        "priority_bucket": age_bucket(email_data.get('internalDate'), now_ms)
+    }
+    
+    # Complaints and urgent issues get a reply draft once someone needs it
+    if category in REPLY_DRAFT_CATEGORIES and priority_level <= 2:
+        result["reply_status"] = REPLY_ELIGIBLE_STATUS
+    else:
+        result["reply_status"] = "Not Replied"
+    
+    print(f"✅ Enhanced analysis complete: {category} (Priority: {priority_level})")
+    return result
+
+def is_reply_eligible(email_data: dict) -> bool:
+    """True for an analyzed email that is waiting for its reply draft"""
+    return (email_data.get("reply_status") == REPLY_ELIGIBLE_STATUS
+            and email_data.get("sentiment") in REPLY_DRAFT_CATEGORIES
+            and not email_data.get("suggested_reply_body"))
+
+def generate_reply_draft(email_data: dict, groq_client) -> Optional[str]:
+    """Draft a reply for a reply-eligible email; None when the LLM is unavailable or fails"""
+    if not groq_client:
+        return None
     try:
-        print(f"🤖 Enhanced AI analysis for email: {email_data.get('id', 'Unknown')}")
-        
-        # Enhanced prompt for better categorization
-        analysis_prompt = f"""
-        Analyze this email and categorize it. Respond with ONLY a JSON object in this exact format:
-        {{"category": "CATEGORY_NAME", "confidence": 85, "reasoning": "brief explanation"}}
-        
-        Available categories:
-        - URGENT_COMPLAINT: Angry customer, serious issue, escalated problem
-        - COMPLAINT: Customer dissatisfaction, problem report, negative feedback
-        - QUESTION: Request for information, asking for help, inquiry
-        - REQUEST: Action item, task request, asking for something specific
-        - APPRECIATION: Thank you, praise, positive feedback, gratitude
-        - INFORMATIONAL: Updates, news, announcements, FYI content
-        - OPPORTUNITY: Business opportunity, potential deal, sales lead
-        - MEETING_INVITE: Meeting invitation, calendar invite, scheduling
-        
-        Email details:
-        From: {email_data.get('from', '')}
-        Subject: {email_data.get('subject', '')}
-        Content: {email_data.get('snippet', '')[:500]}
-        
-        Consider urgency indicators like: urgent, ASAP, deadline, emergency, critical, angry tone, complaint words.
-        """
-        
-        completion = groq_client.chat.completions.create(
+        # Stored rows carry the sender as from_address
+        sender = email_data.get("from") or email_data.get("from_address", "")
+        reply_prompt = get_reply_prompt_for_category(email_data.get("sentiment"), {**email_data, "from": sender})
+        reply_completion = stage_metrics.timed("reply_generation", groq_client.chat.completions.create,
             messages=[
                 {
-                    "role": "system", 
-                    "content": "You are an expert email analyst. Categorize emails accurately based on content and tone. Always respond with valid JSON only."
+                    "role": "system",
+                    "content": reply_prompt["system"]
                 },
                 {
-                    "role": "user", 
-                    "content": analysis_prompt
+                    "role": "user",
+                    "content": reply_prompt["user"]
                 }
             ],
-            model="llama3-8b-8192",
-            temperature=0.2,
-            max_tokens=150
+            model=LLM_MODEL,
+            temperature=0.7,
+            max_tokens=300
         )
+        print(f"✅ Generated reply suggestion for {email_data.get('id')}")
+        return reply_completion.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"⚠️ Reply generation failed: {e}")
+        return None
+
+def analyze_email_sentiment_enhanced(email_data: dict, groq_client) -> dict:
+    """
+    Enhanced sentiment analysis with user-friendly categories and prioritization
+    """
+    if not groq_client:
+        print("⚠️ Groq client not available, using default categorization")
+        return default_analysis_result()
+    
+    try:
+        print(f"🤖 Enhanced AI analysis for email: {email_data.get('id', 'Unknown')}")
         
-        # Parse AI response
-        ai_response = completion.choices[0].message.content.strip()
-        print(f"📋 Raw AI response: {ai_response}")
-        
-        # Clean and parse JSON response
-        if ai_response.startswith('```json'):
-            ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-        
-        try:
-            parsed_response = json.loads(ai_response)
-            category = parsed_response.get("category", "INFORMATIONAL")
-            confidence = parsed_response.get("confidence", 50)
-            reasoning = parsed_response.get("reasoning", "AI analysis")
-        except json.JSONDecodeError:
-            print(f"⚠️ Failed to parse AI JSON response: {ai_response}")
-            # Fallback to keyword-based analysis
-            content_lower = f"{email_data.get('subject', '')} {email_data.get('snippet', '')}".lower()
-            category = fallback_keyword_analysis(content_lower)
-            confidence = 30
-            reasoning = "Fallback keyword analysis"
-        
-        # Validate category exists
-        if category not in SENTIMENT_CATEGORIES:
-            print(f"⚠️ Unknown category '{category}', defaulting to INFORMATIONAL")
-            category = "INFORMATIONAL"
-        
-        # Calculate priority
-        priority_level, priority_factors = calculate_email_priority_score(email_data, category)
-        
-        # Get category details
-        category_info = SENTIMENT_CATEGORIES[category]
-        priority_info = PRIORITY_LEVELS[priority_level]
-        
-        # Build result
-        result = {
-            "sentiment_category": category,
-            "sentiment_display": category_info["display_name"],
-            "priority_level": priority_level,
-            "priority_name": priority_info["name"],
-            "confidence": confidence,
-            "analysis_details": {
-                "reasoning": reasoning,
-                "priority_factors": priority_factors,
-                "auto_reply_enabled": category_info["auto_reply"],
-                "notification_enabled": category_info["notification"]
-            },
-            "requires_immediate_attention": priority_level <= 2,
-            "auto_reply_suggested": category_info["auto_reply"] and priority_level <= 2
-        }
+        # Cheapest tier first: confident local scores never reach the cache or the LLM
+        classification, source = confident_local_classification(email_data), "local"
+        if classification:
+            print(f"⚡ Local classification: {classification[0]} ({classification[1]}%)")
+        else:
+            classification, source = cached_classification(email_data), "cache"
+            if classification:
+                print(f"♻️ Reusing cached classification: {classification[0]}")
         
-        # Generate reply for complaints and urgent issues
-        if category in ["URGENT_COMPLAINT", "COMPLAINT"] and priority_level <= 2:
+        if not classification:
             try:
-                reply_prompt = get_reply_prompt_for_category(category, email_data)
-                reply_completion = groq_client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": reply_prompt["system"]
-                        },
-                        {
-                            "role": "user",
-                            "content": reply_prompt["user"]
-                        }
-                    ],
-                    model="llama3-8b-8192",
-                    temperature=0.7,
-                    max_tokens=300
-                )
-                
-                result["suggested_reply_body"] = reply_completion.choices[0].message.content.strip()
-                result["reply_status"] = "AI Reply Suggested"
-                print(f"✅ Generated reply suggestion for {category}")
-                
+                classification = stage_metrics.timed("classify_single", classify_email_with_llm, email_data, groq_client)
             except Exception as e:
-                print(f"⚠️ Reply generation failed: {e}")
-                result["reply_status"] = "Reply Needed"
-        else:
-            result["reply_status"] = "Not Replied"
+                # Timeouts and exhausted 429 retries must not stall the caller
+                print(f"⚠️ LLM classification failed: {e}")
+                classification = None
+            if classification:
+                source = "llm"
+                remember_classification(email_data, classification)
+            else:
+                # Fallback to keyword-based analysis
+                classification = keyword_classification(email_data)
+                source = "keywords"
         
-        print(f"✅ Enhanced analysis complete: {category} (Priority: {priority_level})")
-        return result
+        classification_tiers.record(source)
+        return build_analysis_result(email_data, classification, source)
         
     except Exception as e:
         print(f"⚠️ Enhanced AI analysis failed: {e}")
-        return default_result
+        return default_analysis_result()
 
-def fallback_keyword_analysis(content: str) -> str:
-    """Fallback keyword-based categorization when AI fails"""
+def parse_llm_json(ai_response: str):
+    """Parse a JSON reply, tolerating markdown code fences and surrounding prose"""
+    ai_response = ai_response.strip()
+    if ai_response.startswith('```'):
+        ai_response = ai_response.strip('`').strip()
+        if ai_response.startswith('json'):
+            ai_response = ai_response[4:].strip()
+    try:
+        return json.loads(ai_response)
+    except json.JSONDecodeError:
+        pass
+    # Models sometimes wrap the array in a sentence; retry on the outermost brackets
+    start, end = ai_response.find('['), ai_response.rfind(']')
+    if start != -1 and end > start:
+        try:
+            return json.loads(ai_response[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+    return None
+
+def thread_context_block(email_data: dict) -> str:
+    """Prompt lines with the thread digest set by thread_summaries.attach_thread_context, if any"""
+    context = email_data.get('thread_context')
+    if not context:
+        return ""
+    return f"Earlier in this thread (context only; categorize the message above):\n{context}\n"
+
+def classify_email_with_llm(email_data: dict, groq_client) -> Optional[Tuple[str, int, str]]:
+    """Ask the LLM for (category, confidence, reasoning); None if the reply is not valid JSON"""
+    # Enhanced prompt for better categorization
+    analysis_prompt = f"""
+    Analyze this email and categorize it. Respond with ONLY a JSON object in this exact format:
+    {{"category": "CATEGORY_NAME", "confidence": 85, "reasoning": "brief explanation"}}
     
-    # Define keyword patterns for each category
-    keyword_patterns = {
-        "URGENT_COMPLAINT": ["angry", "furious", "unacceptable", "terrible", "worst", "hate", "disgusted", "urgent complaint"],
-        "COMPLAINT": ["disappointed", "unsatisfied", "problem", "issue", "wrong", "error", "complaint", "not working"],
-        "QUESTION": ["?", "how to", "can you", "could you", "what is", "why", "when", "where", "help me"],
-        "REQUEST": ["please", "can you please", "need you to", "request", "asking for", "require"],
-        "APPRECIATION": ["thank you", "thanks", "grateful", "appreciate", "excellent", "great job", "well done"],
-        "OPPORTUNITY": ["opportunity", "deal", "proposal", "partnership", "collaboration", "business"],
-        "MEETING_INVITE": ["meeting", "calendar", "schedule", "invite", "appointment", "call"]
-    }
+    {CATEGORY_PROMPT_LIST}
+    
+    Email details:
+    From: {email_data.get('from', '')}
+    Subject: {email_data.get('subject', '')}
+    Content: {email_data.get('snippet', '')[:500]}
+    {thread_context_block(email_data)}
+    Consider urgency indicators like: urgent, ASAP, deadline, emergency, critical, angry tone, complaint words.
+    """
+    
+    completion = groq_client.chat.completions.create(
+        messages=[
+            {
+                "role": "system", 
+                "content": CLASSIFIER_SYSTEM_PROMPT
+            },
+            {
+                "role": "user", 
+                "content": analysis_prompt
+            }
+        ],
+        model=CLASSIFICATION_MODEL,
+        temperature=0.2,
+        max_tokens=150
+    )
+    
+    # Parse AI response
+    ai_response = completion.choices[0].message.content.strip()
+    print(f"📋 Raw AI response: {ai_response}")
+    
+    parsed_response = parse_llm_json(ai_response)
+    if not isinstance(parsed_response, dict):
+        print(f"⚠️ Failed to parse AI JSON response: {ai_response}")
+        return None
+    return (
+        parsed_response.get("category", "INFORMATIONAL"),
+        parsed_response.get("confidence", 50),
+        parsed_response.get("reasoning", "AI analysis")
+    )
+
+# --- Batched classification ---
+# One completion classifies several emails: the instructions and category list
+# are sent once per batch instead of once per email. Emails are referenced by
+# their position in the batch, which keeps ids short and unambiguous.
+
+BATCH_PROMPT_TOKEN_BUDGET = int(os.getenv("BATCH_PROMPT_TOKEN_BUDGET", "3000"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_CLASSIFICATION_BATCH_SIZE", "20"))
+BATCH_OUTPUT_TOKENS_PER_EMAIL = 60
+BATCH_RETRY_ROUNDS = 1
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)"""
+    return len(text) // 4 + 1
+
+def batch_email_block(position: int, email_data: dict) -> str:
+    return (f"[{position}]\nFrom: {email_data.get('from', '')}\n"
+            f"Subject: {email_data.get('subject', '')}\n"
+            f"Content: {(email_data.get('snippet') or '')[:500]}\n"
+            f"{thread_context_block(email_data)}")
+
+def build_batch_prompt(email_blocks: List[str]) -> str:
+    return f"""
+    Analyze each email below and categorize it. Respond with ONLY a JSON array holding one object per email, in this exact format:
+    [{{"id": 1, "category": "CATEGORY_NAME", "confidence": 85, "reasoning": "brief explanation"}}]
+    
+    {CATEGORY_PROMPT_LIST}
+    
+    Consider urgency indicators like: urgent, ASAP, deadline, emergency, critical, angry tone, complaint words.
+    
+    Emails:
+    """ + "\n".join(email_blocks)
+
+BATCH_PROMPT_OVERHEAD_TOKENS = estimate_tokens(CLASSIFIER_SYSTEM_PROMPT + build_batch_prompt([]))
+
+def plan_classification_batches(emails: List[dict], token_budget: int = BATCH_PROMPT_TOKEN_BUDGET,
+                                max_batch_size: int = MAX_BATCH_SIZE) -> List[List[int]]:
+    """Greedily pack email indexes into batches whose prompt fits the token budget"""
+    batches, current, used = [], [], BATCH_PROMPT_OVERHEAD_TOKENS
+    for index, email_data in enumerate(emails):
+        cost = estimate_tokens(batch_email_block(len(current) + 1, email_data))
+        if current and (used + cost > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], BATCH_PROMPT_OVERHEAD_TOKENS
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def validate_batch_item(item, batch_size: int) -> Optional[Tuple[int, Tuple[str, int, str]]]:
+    """(position, classification) for a well-formed answer, None otherwise"""
+    if not isinstance(item, dict):
+        return None
+    try:
+        position = int(item.get("id"))
+        confidence = int(item.get("confidence", 50))
+    except (TypeError, ValueError):
+        return None
+    category = str(item.get("category", "")).upper()
+    if not 1 <= position <= batch_size or category not in SENTIMENT_CATEGORIES:
+        return None
+    return position, (category, max(0, min(100, confidence)), str(item.get("reasoning") or "AI analysis"))
+
+def classify_batch_with_llm(batch: List[dict], groq_client) -> Dict[int, Tuple[str, int, str]]:
+    """Classify up to MAX_BATCH_SIZE emails in one call; returns the valid answers by batch index"""
+    prompt = build_batch_prompt([batch_email_block(position, email_data)
+                                 for position, email_data in enumerate(batch, start=1)])
+    completion = groq_client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": CLASSIFIER_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model=CLASSIFICATION_MODEL,
+        temperature=0.2,
+        max_tokens=BATCH_OUTPUT_TOKENS_PER_EMAIL * len(batch) + 50
+    )
+    ai_response = completion.choices[0].message.content.strip()
+    parsed = parse_llm_json(ai_response)
+    if isinstance(parsed, dict):
+        # Tolerate {"results": [...]} style wrappers
+        parsed = next((value for value in parsed.values() if isinstance(value, list)), None)
+    if not isinstance(parsed, list):
+        print(f"⚠️ Failed to parse batch AI JSON response: {ai_response[:200]}")
+        return {}
+    
+    results = {}
+    for item in parsed:
+        validated = validate_batch_item(item, len(batch))
+        if validated and validated[0] - 1 not in results:
+            results[validated[0] - 1] = validated[1]
+    return results
+
+def classify_emails_batched(emails: List[dict], groq_client) -> List[Tuple[Tuple[str, int, str], str]]:
+    """(classification, source) for every email: confident local scores, then the cache,
+    then batched LLM calls re-asking only for items that came back missing or
+    invalid, then keywords"""
+    outcomes: List[Optional[Tuple[Tuple[str, int, str], str]]] = [None] * len(emails)
+    pending = []
+    for index, email_data in enumerate(emails):
+        local = confident_local_classification(email_data)
+        cached = None if local else cached_classification(email_data)
+        if local:
+            outcomes[index] = (local, "local")
+        elif cached:
+            outcomes[index] = (cached, "cache")
+        else:
+            pending.append(index)
+    
+    calls = 0
+    for _ in range(1 + BATCH_RETRY_ROUNDS):
+        if not pending or not groq_client:
+            break
+        batches = [[pending[position] for position in batch]
+                   for batch in plan_classification_batches([emails[index] for index in pending])]
+        calls += len(batches)
+        # Batches run concurrently; a failed or timed-out batch (None) goes straight to keywords
+        answers_per_batch = analysis_executor.map(
+            "classify_batch",
+            lambda batch_indexes: classify_batch_with_llm([emails[index] for index in batch_indexes], groq_client),
+            batches
+        )
+        still_pending, gave_up = [], []
+        for batch_indexes, answers in zip(batches, answers_per_batch):
+            for position, index in enumerate(batch_indexes):
+                if answers is None:
+                    gave_up.append(index)
+                elif position in answers:
+                    outcomes[index] = (answers[position], "llm")
+                    remember_classification(emails[index], answers[position])
+                else:
+                    still_pending.append(index)
+        for index in gave_up:
+            outcomes[index] = (keyword_classification(emails[index]), "keywords")
+        pending = still_pending
+    
+    for index in pending:
+        outcomes[index] = (keyword_classification(emails[index]), "keywords")
+    
+    tier_counts = {}
+    for _, source in outcomes:
+        tier_counts[source] = tier_counts.get(source, 0) + 1
+    for source, count in tier_counts.items():
+        classification_tiers.record(source, count)
+    print(f"📦 Classified {len(emails)} emails with {calls} LLM calls {tier_counts}")
+    return outcomes
+
+def analyze_emails_batched(emails: List[dict], groq_client) -> List[dict]:
+    """Batch counterpart of analyze_email_sentiment_enhanced, one result per email in order"""
+    if not groq_client:
+        print("⚠️ Groq client not available, using default categorization")
+        return [default_analysis_result() for _ in emails]
     
-    # Score each category
-    category_scores = {}
-    for category, keywords in keyword_patterns.items():
-        score = sum(1 for keyword in keywords if keyword in content)
-        if score > 0:
-            category_scores[category] = score
+    outcomes = classify_emails_batched(emails, groq_client)
+    return [build_analysis_result(email_data, classification, source)
+            for email_data, (classification, source) in zip(emails, outcomes)]
+
+def fallback_keyword_analysis(content: str) -> str:
+    """Fallback keyword-based categorization when AI fails"""
+    # Score each category (keyword lists live in local_classifier.KEYWORD_PATTERNS)
+    category_scores = keyword_scores(content)
     
     # Return highest scoring category or default
     if category_scores:
@@ -330,7 +569,23 @@ def get_reply_prompt_for_category(category: str, email_data: dict) -> dict:
     
     return prompts.get(category, prompts["COMPLAINT"])
 
-def process_email_with_enhanced_ai(email_data: dict, groq_client) -> dict:
+# Analysis result keys that differ from the emails column they are stored in
+ANALYSIS_RESULT_KEYS = {"sentiment": "sentiment_category"}
+
+def apply_analysis_result(email_data: dict, analysis_result: dict) -> dict:
+    """Copy an analysis result onto the email dict in the shape the database expects.
+
+    Walks EMAIL_UPSERT_COLUMNS, so every column the result carries is written
+    and a column added to EmailRecord cannot be dropped here.
+    """
+    for column in EMAIL_UPSERT_COLUMNS:
+        key = ANALYSIS_RESULT_KEYS.get(column, column)
+        if key in analysis_result:
+            email_data[column] = analysis_result[key]
+    email_data['analysis_details'] = json.dumps(analysis_result['analysis_details'])
+    return email_data
+
+def process_email_with_enhanced_ai(email_data: dict, groq_client, user_email: str = None) -> dict:
     """
     Main function to replace the existing process_email_with_ai function
     """
@@ -338,23 +593,31 @@ def process_email_with_enhanced_ai(email_data: dict, groq_client) -> dict:
     email_data.setdefault('sentiment', 'INFORMATIONAL')
     email_data.setdefault('reply_status', 'Not Replied')
     
-    # Perform enhanced analysis
+    # Perform enhanced analysis, with the thread digest when the owner is known
+    if user_email:
+        attach_thread_context([email_data], user_email)
     analysis_result = analyze_email_sentiment_enhanced(email_data, groq_client)
+    if user_email:
+        remember_thread_messages([email_data], user_email)
+    email_data.pop('thread_context', None)
     
     # Update email data with enhanced analysis
-    email_data.update({
-        'sentiment': analysis_result['sentiment_category'],
-        'sentiment_display': analysis_result['sentiment_display'],
-        'priority_level': analysis_result['priority_level'],
-        'priority_name': analysis_result['priority_name'],
-        'confidence': analysis_result['confidence'],
-        'reply_status': analysis_result['reply_status'],
-        'suggested_reply_body': analysis_result.get('suggested_reply_body'),
-        'requires_immediate_attention': analysis_result['requires_immediate_attention'],
-        'analysis_details': json.dumps(analysis_result['analysis_details'])
-    })
-    
-    return email_data
+    return apply_analysis_result(email_data, analysis_result)
+
+def process_emails_with_enhanced_ai(emails: List[dict], groq_client, user_email: str = None) -> List[dict]:
+    """Batched process_email_with_enhanced_ai for a page of synced emails"""
+    for email_data in emails:
+        email_data.setdefault('sentiment', 'INFORMATIONAL')
+        email_data.setdefault('reply_status', 'Not Replied')
+    if user_email:
+        attach_thread_context(emails, user_email)
+    analysis_results = stage_metrics.timed("analysis_batch", analyze_emails_batched, emails, groq_client)
+    if user_email:
+        remember_thread_messages(emails, user_email)
+    for email_data, analysis_result in zip(emails, analysis_results):
+        email_data.pop('thread_context', None)
+        apply_analysis_result(email_data, analysis_result)
+    return emails
 
 # Usage example and testing function
 def test_enhanced_sentiment_analysis():
@@ -0,0 +1,126 @@
+# events.py - In-process pub/sub feeding the per-user server-sent events stream
+#
+# Publishers (the sync pipeline, the analysis stage, status updates) call
+# event_bus.publish() from any thread and never block. Each subscriber owns a
+# bounded asyncio queue; a subscriber whose queue is full has fallen too far
+# behind and is evicted instead of slowing down the publisher. The evicted
+# client gets a final "evicted" event and is expected to reconnect and refetch.
+
+from typing import Dict, List
+import asyncio
+import itertools
+import threading
+import time
+
+import orjson
+
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15.0
+
+class Subscriber:
+    def __init__(self, user_email: str, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.user_email = user_email
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.evicted = False
+        self.connected_at = time.time()
+
+class EventBus:
+    """Per-user fan-out with bounded queues and slow-consumer eviction"""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._lock = threading.Lock()
+        self._event_ids = itertools.count(1)
+        self.metrics = {"published": 0, "delivered": 0, "evicted": 0}
+
+    def subscribe(self, user_email: str) -> Subscriber:
+        subscriber = Subscriber(user_email, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_email, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_email, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(subscriber.user_email, None)
+
+    def publish(self, user_email: str, event_type: str, data: Dict):
+        """Queue an event for every subscriber of user_email; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_email, []))
+        if not subscribers:
+            return
+        event = {"id": next(self._event_ids), "type": event_type, "data": data}
+        self.metrics["published"] += 1
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(self._deliver, subscriber, event)
+
+    def _deliver(self, subscriber: Subscriber, event: Dict):
+        # Runs on the subscriber's event loop, so the queue is only touched there
+        if subscriber.evicted:
+            return
+        try:
+            subscriber.queue.put_nowait(event)
+            self.metrics["delivered"] += 1
+        except asyncio.QueueFull:
+            subscriber.evicted = True
+            self.metrics["evicted"] += 1
+            self.unsubscribe(subscriber)
+            print(f"⚠️ Evicted slow event subscriber for {subscriber.user_email}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            subscriber_count = sum(len(subscribers) for subscribers in self._subscribers.values())
+        return {**self.metrics, "subscribers": subscriber_count}
+
+def format_sse(event: Dict) -> bytes:
+    return (f"id: {event['id']}\nevent: {event['type']}\ndata: ".encode("utf-8")
+            + orjson.dumps(event["data"]) + b"\n\n")
+
+async def stream_events(subscriber: Subscriber, is_disconnected, heartbeat_seconds: float = HEARTBEAT_SECONDS):
+    """SSE byte stream for one subscriber; ends on disconnect or eviction"""
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            if subscriber.evicted:
+                yield format_sse({"id": 0, "type": "evicted", "data": {"reason": "slow consumer"}})
+                return
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield b": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        event_bus.unsubscribe(subscriber)
+
+def email_event_data(email_data: Dict) -> Dict:
+    """The slice of an email the UI needs to render a new or updated list row"""
+    return {
+        "id": email_data.get("id"),
+        "threadId": email_data.get("threadId"),
+        "from": email_data.get("from") or email_data.get("from_address", ""),
+        "subject": email_data.get("subject", ""),
+        "snippet": email_data.get("snippet", ""),
+        "internalDate": email_data.get("internalDate"),
+        "is_read": email_data.get("is_read", 0)
+    }
+
+def analysis_event_data(email_data: Dict) -> Dict:
+    return {
+        "id": email_data.get("id"),
+        "sentiment": email_data.get("sentiment"),
+        "sentiment_display": email_data.get("sentiment_display"),
+        "priority_level": email_data.get("priority_level"),
+        "priority_name": email_data.get("priority_name"),
+        "requires_immediate_attention": email_data.get("requires_immediate_attention")
+    }
+
+event_bus = EventBus()
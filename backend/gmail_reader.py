@@ -139,7 +139,10 @@ def parse_gmail_message(data: Dict) -> Optional[Dict]:
             "full_body": full_body,
             "labels": json.dumps(labels),  # Store as JSON string
             "is_read": 1 if "UNREAD" not in labels else 0,
-            "is_replied": 0
+            "is_replied": 0,
+            # Mailing-list headers mark bulk mail; used by the local classifier, not stored
+            "is_bulk": bool(headers_dict.get("list-unsubscribe") or headers_dict.get("list-id")
+                            or headers_dict.get("precedence", "").lower() in ("bulk", "list"))
         }
     except Exception as e:
         print(f"Error parsing message: {e}")
@@ -0,0 +1,190 @@
+# llm_providers.py - Pluggable chat-completion backends behind one client shape
+#
+# Every provider exposes the Groq/OpenAI call the pipeline already makes,
+# client.chat.completions.create(messages=..., model=..., stream=...), and
+# returns objects with the same .choices[0].message.content /
+# .choices[0].delta.content shape. create_llm_client() picks the provider from
+# LLM_PROVIDER and wraps it in RateLimitedClient for limits, retries and timing:
+#
+#   groq    Groq cloud API (GROQ_API_KEY); rate limited to the account's RPM/TPM
+#   openai  Any local OpenAI-compatible server, e.g. llama.cpp's llama-server
+#           (LLM_BASE_URL, optional LLM_API_KEY); no account limits
+#   fake    Deterministic offline answers with configurable latency, for
+#           benchmarks and load tests (FAKE_LLM_LATENCY_MS, FAKE_LLM_TOKEN_MS)
+#
+# Each provider keeps one pooled HTTP client for its lifetime, and the request
+# timeout defaults per provider (local inference is slower than Groq).
+
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+import hashlib
+import json
+import os
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from analysis_executor import ANALYSIS_CONCURRENCY, RateLimitedClient, RateLimiter
+from local_classifier import keyword_scores
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+
+DEFAULT_MODELS = {"groq": "llama3-8b-8192", "openai": "local-model", "fake": "fake-llm"}
+DEFAULT_TIMEOUTS_SECONDS = {"groq": 20.0, "openai": 120.0, "fake": 20.0}
+
+LLM_MODEL = os.getenv("LLM_MODEL") or DEFAULT_MODELS.get(LLM_PROVIDER, DEFAULT_MODELS["groq"])
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://127.0.0.1:8080/v1")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "200"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "10"))
+
+class LLMProviderError(Exception):
+    """HTTP failure from a provider; status_code 429 is retried by RateLimitedClient"""
+
+    def __init__(self, message: str, status_code: int = None, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+def completion_result(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")])
+
+def completion_chunk(text: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class OpenAICompatibleClient:
+    """Chat completions against an OpenAI-compatible HTTP server over a pooled session"""
+
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: str = None, pool_size: int = ANALYSIS_CONCURRENCY + 2):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self.chat = self
+        self.completions = self
+
+    def create(self, messages: List[Dict], model: str, timeout: float = None, stream: bool = False, **params):
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            json={"messages": messages, "model": model, "stream": stream, **params},
+            timeout=timeout,
+            stream=stream
+        )
+        if response.status_code >= 400:
+            detail = response.text[:200]
+            response.close()
+            raise LLMProviderError(f"LLM server error {response.status_code}: {detail}",
+                                   response.status_code, response)
+        if stream:
+            return OpenAICompatibleStream(response)
+        return completion_result(response.json()["choices"][0]["message"]["content"] or "")
+
+class OpenAICompatibleStream:
+    """Iterates the server-sent chunks of a streamed completion; close() drops the connection"""
+
+    def __init__(self, response: requests.Response):
+        self.response = response
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        for line in self.response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            choices = json.loads(data).get("choices") or [{}]
+            text = (choices[0].get("delta") or {}).get("content")
+            if text:
+                yield completion_chunk(text)
+
+    def close(self):
+        self.response.close()
+
+BATCH_EMAIL_RE = re.compile(r"\[(\d+)\]\nFrom: .*\nSubject: (.*)\nContent: (.*)$", re.MULTILINE)
+SINGLE_EMAIL_RE = re.compile(r"Subject: (.*)\n\s*Content: (.*)")
+
+class FakeLLMClient:
+    """Deterministic stand-in: the same prompt always gets the same answer after a fixed latency.
+
+    Classification prompts get well-formed JSON from the keyword scores, anything
+    else gets a short canned reply, so the whole pipeline runs without a network.
+    """
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS, token_ms: float = FAKE_LLM_TOKEN_MS):
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, messages: List[Dict], model: str, stream: bool = False, **params):
+        self.calls += 1
+        content = self.answer(messages[-1]["content"])
+        time.sleep(self.latency_ms / 1000)
+        if stream:
+            return FakeStream(content, self.token_ms)
+        return completion_result(content)
+
+    def answer(self, prompt: str) -> str:
+        if "JSON array" in prompt:
+            return json.dumps([
+                {"id": int(position), **fake_classification(subject, content)}
+                for position, subject, content in BATCH_EMAIL_RE.findall(prompt)
+            ])
+        if "JSON object" in prompt:
+            match = SINGLE_EMAIL_RE.search(prompt)
+            return json.dumps(fake_classification(*(match.groups() if match else ("", ""))))
+        subject = re.search(r"Subject: (.*)", prompt)
+        return (f"Thank you for your message about {subject.group(1).strip() if subject else 'this'}. "
+                "I have looked into it and will follow up with the details shortly.\n\nBest regards")
+
+def fake_classification(subject: str, content: str) -> Dict:
+    scores = keyword_scores(f"{subject} {content}".lower())
+    category = max(scores, key=scores.get) if scores else "INFORMATIONAL"
+    digest = hashlib.sha256(f"{subject}\n{content}".encode("utf-8")).digest()
+    return {"category": category, "confidence": 60 + digest[0] % 36, "reasoning": "Fake provider keyword match"}
+
+class FakeStream:
+    def __init__(self, content: str, token_ms: float):
+        self.tokens = re.findall(r"\s*\S+", content)
+        self.token_ms = token_ms
+        self.closed = False
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        for token in self.tokens:
+            if self.closed:
+                return
+            time.sleep(self.token_ms / 1000)
+            yield completion_chunk(token)
+
+    def close(self):
+        self.closed = True
+
+def request_timeout(provider: str) -> float:
+    return float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS") or DEFAULT_TIMEOUTS_SECONDS.get(provider, 20.0))
+
+def create_llm_client(provider: str = LLM_PROVIDER) -> Optional[RateLimitedClient]:
+    """The configured provider wrapped in RateLimitedClient, or None when AI features are unavailable"""
+    try:
+        if provider == "groq":
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                print("🔴 WARNING: GROQ_API_KEY is not set. AI features will be disabled.")
+                return None
+            import groq
+            # RateLimitedClient owns retries, so the SDK's own are turned off
+            client, limiter = groq.Client(api_key=api_key, max_retries=0), RateLimiter()
+        elif provider == "openai":
+            client, limiter = OpenAICompatibleClient(LLM_BASE_URL, os.getenv("LLM_API_KEY")), RateLimiter(0, 0)
+        elif provider == "fake":
+            client, limiter = FakeLLMClient(), RateLimiter(0, 0)
+        else:
+            print(f"🔴 WARNING: Unknown LLM_PROVIDER '{provider}'. AI features will be disabled.")
+            return None
+    except Exception as e:
+        print(f"🔴 WARNING: Failed to initialize LLM provider '{provider}'. AI features disabled. Error: {e}")
+        return None
+    print(f"✅ LLM provider initialized: {provider} ({LLM_MODEL})")
+    return RateLimitedClient(client, limiter, timeout=request_timeout(provider))
@@ -1,9 +1,13 @@
 # /home/rick110/RickDrive/email_automation/backend/main.py
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+import orjson
 from pydantic import BaseModel, EmailStr
 from fastapi.middleware.cors import CORSMiddleware
-import groq
+import asyncio
+import threading
 import time
 from typing import Optional, List
 import base64
@@ -14,38 +18,59 @@ import json
 import requests
 import os
 from dotenv import load_dotenv
-from enhanced_sentiment_system import process_email_with_enhanced_ai
 
-# Load environment variables
+# Load environment variables (before the modules below read their settings)
 load_dotenv()
 
-# Import enhanced database and Gmail reader functions
-from database import (
-    get_emails_from_db, insert_email, update_email_status, 
-    get_user_email_count, update_user_sync_metadata, 
-    get_user_sync_metadata, create_tables, get_db_connection, initialize_enhanced_sentiment_system
+from enhanced_sentiment_system import (
+    process_email_with_enhanced_ai, process_emails_with_enhanced_ai, is_reply_eligible, MAX_BATCH_SIZE
 )
+from analysis_executor import analysis_executor, stage_metrics, ANALYSIS_CONCURRENCY
+from llm_providers import create_llm_client, LLM_MODEL, LLM_PROVIDER
+
+# Every email read and write goes through the configured storage backend
+from storage import get_storage
+from cache import email_cache
+from classification_cache import classification_cache
+from thread_summaries import thread_summaries
+from local_classifier import classification_tiers
+from versions import change_versions
+from events import event_bus, stream_events, format_sse, email_event_data, analysis_event_data
+from reply_drafts import ReplyDrafter
+from priority_scoring import PriorityRescorer
 from gmail_reader import (
     sync_latest_emails, get_older_emails, send_email, 
     get_gmail_profile, get_gmail_messages
 )
 
-# --- Groq Client Initialization ---
-# Paste your Groq API key below. Do NOT use .env or environment variables for this key.
-GROQ_API_KEY = "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"  # <-- Paste your Groq API key here (e.g., gsk_xxx...)
+# --- LLM client (LLM_PROVIDER=groq|openai|fake, see llm_providers.py) ---
+# The Groq key is read from GROQ_API_KEY (environment or .env)
+llm_client = create_llm_client()
 
-try:
-    if not GROQ_API_KEY or GROQ_API_KEY == "YOUR_GROQ_API_KEY_HERE":
-        print("🔴 WARNING: Groq API key is not set. AI features will be disabled.")
-        groq_client = None
-    else:
-        groq_client = groq.Client(api_key=GROQ_API_KEY)
-        print("✅ Groq client initialized successfully.")
-except Exception as e:
-    print(f"🔴 WARNING: Failed to initialize Groq client. AI features disabled. Error: {e}")
-    groq_client = None
+# --- Storage backend (STORAGE_BACKEND=sqlite|sharded|postgres) ---
+storage = get_storage()
+
+# Reply drafts are generated on first open or in the background, never during sync
+reply_drafter = ReplyDrafter(storage, llm_client)
 
-app = FastAPI()
+def publish_rescored_priorities(result: dict):
+    for user_email, count in result["users"].items():
+        event_bus.publish(user_email, "priorities_updated", {"count": count})
+
+# Priorities move as emails age; re-scored in SQL without re-running the analysis
+priority_rescorer = PriorityRescorer(storage, on_updated=publish_rescored_priorities)
+
+class OrjsonResponse(JSONResponse):
+    """JSON response rendered with orjson, several times faster than json.dumps on large pages"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(default_response_class=OrjsonResponse)
+
+if storage.name == "sharded":
+    from shards import ShardRoutingMiddleware
+    app.add_middleware(ShardRoutingMiddleware, router=storage.router)
 
 # --- CORS Middleware ---
 origins = ["http://localhost:3000"]
@@ -89,32 +114,48 @@ def normalize_email_fields(email_data: dict) -> dict:
         "payload": data.get("payload")
     }
 
-def process_email_with_ai(email_data: dict) -> dict:
+async def check_not_modified(request: Request, user_email: str, view: tuple, wait: int) -> tuple:
+    """Return (etag, 304 response or None) for a per-user view.
+
+    The ETag is derived from the user's change version, so a matching
+    If-None-Match is answered without touching the database. With wait > 0
+    the request long-polls up to `wait` seconds for the next change first.
+    """
+    version = change_versions.version(user_email)
+    etag = change_versions.etag(version, view)
+    if request.headers.get("if-none-match") != etag:
+        return etag, None
+    if wait > 0 and await change_versions.wait_for_change(user_email, version, wait):
+        return change_versions.etag(change_versions.version(user_email), view), None
+    return etag, Response(status_code=304, headers={"ETag": etag})
+
+def process_email_with_ai(email_data: dict, user_email: str = None) -> dict:
     """Process email with enhanced AI for sentiment and reply suggestion (ENHANCED)"""
-    # You may need to pass the groq_client if it's a global or context variable
-    global groq_client
-    return process_email_with_enhanced_ai(email_data, groq_client)
+    return process_email_with_enhanced_ai(email_data, llm_client, user_email)
 
-def update_database_schema():
-    """Add user_email column if it doesn't exist"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Check if user_email column exists
-        cursor.execute("PRAGMA table_info(emails)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'user_email' not in columns:
-            print("📝 Adding user_email column to emails table...")
-            cursor.execute("ALTER TABLE emails ADD COLUMN user_email TEXT")
-            conn.commit()
-            print("✅ user_email column added successfully")
-    
-    except Exception as e:
-        print(f"Schema update error: {e}")
-    finally:
-        conn.close()
+def process_emails_with_ai(emails: List[dict], user_email: str = None) -> List[dict]:
+    """Batched process_email_with_ai: several emails share each classification call"""
+    return process_emails_with_enhanced_ai(emails, llm_client, user_email)
+
+def store_synced_emails(emails: List[dict], user_email: str, stage: str) -> None:
+    """Analyze and store fetched emails, streaming each step to the user's event subscribers"""
+    processed = 0
+    # Analyze enough emails per chunk to keep every analysis worker busy with one
+    # batch, and no more, so progress keeps streaming during long syncs
+    chunk_size = MAX_BATCH_SIZE * ANALYSIS_CONCURRENCY
+    for start in range(0, len(emails), chunk_size):
+        analyzed = process_emails_with_ai(emails[start:start + chunk_size], user_email)
+        # One write per chunk (a single COPY + merge on Postgres)
+        storage.insert_emails_bulk(analyzed, user_email)
+        for email_data in analyzed:
+            processed += 1
+            event_bus.publish(user_email, "email_stored", email_event_data(email_data))
+            event_bus.publish(user_email, "analysis_updated", analysis_event_data(email_data))
+            # The drafter re-reads the stored row, so a re-synced email that is
+            # already drafted or replied is skipped there
+            if is_reply_eligible(email_data):
+                reply_drafter.enqueue(user_email, email_data['id'])
+            event_bus.publish(user_email, "sync_progress", {"stage": stage, "processed": processed, "total": len(emails)})
 
 # Helper functions for Gmail API operations
 def send_email_with_gmail_api(access_token: str, raw_message: str, thread_id: Optional[str] = None):
@@ -169,147 +210,26 @@ def modify_gmail_labels(access_token: str, message_id: str, add_labels: List[str
     
     return response.json()
 
-# Enhanced database functions
-def get_emails_from_db_enhanced(
-    user_email: str = None,
-    limit: int = 10,
-    offset: int = 0,
-    sentiment: str = None,
-    reply_status: str = None,
-    is_read: bool = None,
-    is_replied: bool = None,
-    email_id: str = None
-) -> List[dict]:
-    """Get emails from database with proper filtering"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Build query dynamically
-    query = "SELECT * FROM emails WHERE 1=1"
-    params = []
-
-    if user_email:
-        query += " AND user_email = ?"
-        params.append(user_email)
-        
-    if email_id:
-        query += " AND id = ?"
-        params.append(email_id)
-
-    if sentiment:
-        query += " AND sentiment = ?"
-        params.append(sentiment.upper())
-    if reply_status:
-        query += " AND reply_status = ?"
-        params.append(reply_status)
-    if is_read is not None:
-        query += " AND is_read = ?"
-        params.append(1 if is_read else 0)
-    if is_replied is not None:
-        query += " AND is_replied = ?"
-        params.append(1 if is_replied else 0)
-
-    # Order by most recent first
-    query += " ORDER BY internalDate DESC"
-    
-    # Add limit and offset for pagination (only if not searching for specific email)
-    if not email_id:
-        query += " LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
-
-    try:
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        emails = [dict(row) for row in rows]
-        conn.close()
-        
-        print(f"📊 Database query returned {len(emails)} emails")
-        return emails
-        
-    except Exception as e:
-        conn.close()
-        print(f"❌ Database query error: {e}")
-        return []
-
-def insert_email_enhanced(email_data: dict, user_email: str):
-    """Insert or update email with user_email"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Add user_email to the data
-    email_data['user_email'] = user_email
-    
-    try:
-        # Check if email already exists for this user
-        cursor.execute("SELECT id FROM emails WHERE id = ? AND user_email = ?", 
-                       (email_data['id'], user_email))
-        existing_email = cursor.fetchone()
-
-        if existing_email:
-            print(f"📝 Updating existing email {email_data['id']} for user {user_email}")
-            cursor.execute("""
-                UPDATE emails
-                SET from_address = ?, subject = ?, snippet = ?, sentiment = ?,
-                    reply_status = ?, suggested_reply_body = ?, full_body = ?,
-                    is_read = ?, is_replied = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ? AND user_email = ?
-            """, (
-                email_data.get('from', ''),
-                email_data.get('subject', ''),
-                email_data.get('snippet', ''),
-                email_data.get('sentiment', 'N/A'),
-                email_data.get('reply_status', 'Not Replied'),
-                email_data.get('suggested_reply_body'),
-                email_data.get('full_body'),
-                int(email_data.get('is_read', 0)),
-                int(email_data.get('is_replied', 0)),
-                email_data['id'],
-                user_email
-            ))
-        else:
-            print(f"📥 Inserting new email {email_data['id']} for user {user_email}")
-            cursor.execute("""
-                INSERT INTO emails (id, threadId, historyId, from_address, subject, snippet, 
-                                  internalDate, sentiment, reply_status, suggested_reply_body, 
-                                  full_body, is_read, is_replied, user_email)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                email_data['id'],
-                email_data.get('threadId'),
-                email_data.get('historyId'),
-                email_data.get('from', ''),
-                email_data.get('subject', ''),
-                email_data.get('snippet', ''),
-                email_data.get('internalDate'),
-                email_data.get('sentiment', 'N/A'),
-                email_data.get('reply_status', 'Not Replied'),
-                email_data.get('suggested_reply_body'),
-                email_data.get('full_body'),
-                int(email_data.get('is_read', 0)),
-                int(email_data.get('is_replied', 0)),
-                user_email
-            ))
-        
-        conn.commit()
-        print(f"✅ Email {email_data['id']} saved successfully")
-        
-    except Exception as e:
-        print(f"❌ Database save error: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+startup_info = {"duration_ms": None, "timings": {}}
 
 @app.on_event("startup")
 async def enhanced_startup_event():
-    """Enhanced startup to initialize sentiment system"""
+    """Enhanced startup: schema setup only when the stored version is behind, data migrations in the background"""
+    started_at = time.perf_counter()
     try:
-        create_tables()
-        update_database_schema()
-        # Initialize enhanced sentiment system
-        initialize_enhanced_sentiment_system()
+        startup_info["timings"] = storage.initialize()
+        priority_rescorer.start()
         print("✅ Enhanced Email Automation System initialized successfully!")
     except Exception as e:
         print(f"❌ Enhanced system initialization failed: {e}")
+    finally:
+        startup_info["duration_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+        print(f"⏱️ Startup completed in {startup_info['duration_ms']} ms")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the storage backend (Postgres pool, shard connection cache)"""
+    storage.close()
 
 # --- Pydantic Models ---
 class TokenPayload(BaseModel):
@@ -363,15 +283,35 @@ class EmailHeaders(BaseModel):
 async def read_root():
     return {"message": "Enhanced FastAPI Email Automation Backend is running!"}
 
+@app.get("/api/events/{user_email}")
+async def email_events(user_email: str, request: Request):
+    """Server-sent events: email_stored, analysis_updated, sync_progress, sync_status, email_updated, labels_updated"""
+    subscriber = event_bus.subscribe(user_email)
+    return StreamingResponse(
+        stream_events(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/cache-stats")
+async def cache_stats_endpoint():
+    """Hit/miss metrics of the in-process email cache and the LLM classification cache"""
+    return {"email_cache": email_cache.stats(), "classification_cache": classification_cache.stats()}
+
+@app.get("/api/admin/database-stats")
+async def database_stats_endpoint():
+    """Totals across all users (fanned out over every shard in sharded mode)"""
+    return await run_in_threadpool(storage.get_database_stats)
+
 @app.post("/api/store-token")
 async def store_token(payload: TokenPayload):
     """Store token and initialize user sync metadata if needed"""
     print(f"Received token for {payload.user_email}")
     
     # Initialize user sync metadata if doesn't exist
-    sync_metadata = get_user_sync_metadata(str(payload.user_email))
+    sync_metadata = storage.get_user_sync_metadata(str(payload.user_email))
     if not sync_metadata:
-        update_user_sync_metadata(
+        storage.update_user_sync_metadata(
             user_email=str(payload.user_email),
             sync_status="never_synced",
             latest_50_synced=False
@@ -381,10 +321,20 @@ async def store_token(payload: TokenPayload):
     return {"message": "Token received successfully!", "email": payload.user_email}
 
 @app.get("/api/sync-status/{user_email}")
-async def get_sync_status(user_email: str) -> SyncStatusResponse:
-    """Get synchronization status for a user"""
-    sync_metadata = get_user_sync_metadata(user_email)
-    local_email_count = get_user_email_count(user_email)
+async def get_sync_status(
+    user_email: str,
+    request: Request,
+    response: Response,
+    wait: int = Query(0, ge=0, le=60, description="Long-poll up to this many seconds when If-None-Match is current")
+) -> SyncStatusResponse:
+    """Get synchronization status for a user (supports If-None-Match and long-polling)"""
+    etag, not_modified = await check_not_modified(request, user_email, ("sync-status",), wait)
+    if not_modified:
+        return not_modified
+    response.headers["ETag"] = etag
+    
+    sync_metadata = storage.get_user_sync_metadata(user_email)
+    local_email_count = storage.get_user_email_count(user_email)
     
     if not sync_metadata:
         return SyncStatusResponse(
@@ -415,10 +365,11 @@ async def sync_latest_emails_endpoint(payload: TokenPayload, count: int = Query(
     
     try:
         # Update sync status to 'syncing'
-        update_user_sync_metadata(
+        storage.update_user_sync_metadata(
             user_email=str(payload.user_email),
             sync_status="syncing"
         )
+        event_bus.publish(str(payload.user_email), "sync_status", {"status": "syncing"})
         
         # Sync latest emails from Gmail
         emails, next_page_token = sync_latest_emails(
@@ -428,12 +379,10 @@ async def sync_latest_emails_endpoint(payload: TokenPayload, count: int = Query(
         )
         
         # Store emails in database
-        for email_data in emails:
-            email_data = process_email_with_ai(email_data)
-            insert_email_enhanced(email_data, str(payload.user_email))
+        await run_in_threadpool(store_synced_emails, emails, str(payload.user_email), "latest")
         
         # Update sync metadata
-        update_user_sync_metadata(
+        storage.update_user_sync_metadata(
             user_email=str(payload.user_email),
             total_emails_count=len(emails),
             last_sync_timestamp=int(time.time()),
@@ -441,6 +390,7 @@ async def sync_latest_emails_endpoint(payload: TokenPayload, count: int = Query(
             latest_50_synced=True,
             next_page_token=next_page_token
         )
+        event_bus.publish(str(payload.user_email), "sync_status", {"status": "completed", "emails_synced": len(emails)})
         
         print(f"✅ Successfully synced {len(emails)} emails for {payload.user_email}")
         
@@ -453,19 +403,86 @@ async def sync_latest_emails_endpoint(payload: TokenPayload, count: int = Query(
         
     except Exception as e:
         print(f"❌ Error syncing emails for {payload.user_email}: {e}")
-        update_user_sync_metadata(
+        storage.update_user_sync_metadata(
             user_email=str(payload.user_email),
             sync_status="error"
         )
+        event_bus.publish(str(payload.user_email), "sync_status", {"status": "error", "error": str(e)})
         raise HTTPException(status_code=500, detail=f"Failed to sync emails: {str(e)}")
 
+def load_email_list(user_email: str, limit: int, offset: int, sender: str | None, label: str | None) -> dict:
+    """One page of a user's stored emails, shared by the POST and GET list endpoints"""
+    # Get emails from database
+    def load_email_page():
+        # Rows come back already in the response shape, without bodies
+        normalized_emails = storage.get_emails(
+            user_email=user_email,
+            limit=limit,
+            offset=offset,
+            sender=sender,
+            label=label,
+            shaped=True
+        )
+        
+        # Get total count for pagination
+        total_count = storage.get_user_email_count(user_email)
+        
+        return {
+            "emails": normalized_emails,
+            "total_count": total_count,
+            "offset": offset,
+            "limit": limit,
+            "has_more": len(normalized_emails) == limit,
+            "message": f"Retrieved {len(normalized_emails)} emails"
+        }
+    
+    try:
+        # Only the first page of each view is hot enough to be worth caching
+        if offset == 0:
+            return email_cache.get_or_load(user_email, ("list", limit, sender, label), load_email_page)
+        return load_email_page()
+        
+    except Exception as e:
+        print(f"❌ Database query failed: {e}")
+        return {
+            "emails": [],
+            "total_count": 0,
+            "offset": offset,
+            "limit": limit,
+            "has_more": False,
+            "message": "Failed to retrieve emails from database"
+        }
+
+@app.get("/api/emails/{user_email}")
+async def list_emails(
+    user_email: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(10, description="Maximum number of emails to return"),
+    offset: int = Query(0, description="Number of emails to skip for pagination"),
+    sender: str | None = Query(None, description="Only return emails from this sender address"),
+    label: str | None = Query(None, description="Only return emails carrying this Gmail label ID"),
+    wait: int = Query(0, ge=0, le=60, description="Long-poll up to this many seconds when If-None-Match is current")
+):
+    """List stored emails for a user (supports If-None-Match and long-polling)"""
+    etag, not_modified = await check_not_modified(
+        request, user_email, ("emails", limit, offset, sender, label), wait
+    )
+    if not_modified:
+        return not_modified
+    response.headers["ETag"] = etag
+
+    return load_email_list(user_email, limit, offset, sender, label)
+
 @app.post("/api/read-emails")
 async def read_emails_simplified(
     payload: TokenPayload,
     email_id: str | None = Query(None, description="Optional email ID to fetch a specific email"),
     fetch_new: bool = Query(False, description="Whether to fetch new emails from Gmail"),
     limit: int = Query(10, description="Maximum number of emails to return"),
-    offset: int = Query(0, description="Number of emails to skip for pagination")
+    offset: int = Query(0, description="Number of emails to skip for pagination"),
+    sender: str | None = Query(None, description="Only return emails from this sender address"),
+    label: str | None = Query(None, description="Only return emails carrying this Gmail label ID")
 ):
     """Simplified email reading focused on display reliability"""
     print(f"🔄 Processing /api/read-emails: email_id={email_id}, fetch_new={fetch_new}")
@@ -478,18 +495,21 @@ async def read_emails_simplified(
         if email_id:
             print(f"📧 Fetching specific email ID: {email_id}")
             
-            # Always check database first
-            db_email = None
+            # Always check the cache/database first
+            def load_email_detail():
+                db_emails = storage.get_emails(user_email=str(payload.user_email), email_id=email_id)
+                return normalize_email_fields(db_emails[0]) if db_emails else None
+            
+            normalized_email = None
             try:
-                db_emails = get_emails_from_db_enhanced(user_email=str(payload.user_email), email_id=email_id)
-                if db_emails:
-                    db_email = db_emails[0]
+                normalized_email = email_cache.get_or_load(str(payload.user_email), ("detail", email_id), load_email_detail)
+                if normalized_email:
                     print(f"✅ Found email in database: {email_id}")
             except Exception as e:
                 print(f"⚠️ Database lookup failed: {e}")
 
             # Only fetch from Gmail if specifically requested AND not in database
-            if not db_email and fetch_new:
+            if not normalized_email and fetch_new:
                 print(f"🔍 Fetching email {email_id} from Gmail...")
                 try:
                     gmail_emails = get_gmail_messages(
@@ -503,11 +523,12 @@ async def read_emails_simplified(
                         email_data['user_email'] = str(payload.user_email)
                         
                         # Try AI processing but don't let it block
-                        email_data = process_email_with_ai(email_data)
+                        email_data = process_email_with_ai(email_data, str(payload.user_email))
                         
                         # Save to database
-                        insert_email_enhanced(email_data, str(payload.user_email))
-                        db_email = email_data
+                        storage.insert_email(email_data, str(payload.user_email))
+                        event_bus.publish(str(payload.user_email), "email_stored", email_event_data(email_data))
+                        normalized_email = normalize_email_fields(email_data)
                         print(f"✅ Email {email_id} saved to database")
                     else:
                         print(f"❌ Email {email_id} not found in Gmail")
@@ -515,9 +536,14 @@ async def read_emails_simplified(
                 except Exception as e:
                     print(f"❌ Gmail fetch failed: {e}")
 
+            # First open of a complaint that is still waiting for its reply draft
+            if normalized_email and is_reply_eligible(normalized_email):
+                normalized_email = await run_in_threadpool(
+                    reply_drafter.draft_on_open, str(payload.user_email), normalized_email
+                )
+
             # Return email if we have it, otherwise 404
-            if db_email:
-                normalized_email = normalize_email_fields(db_email)
+            if normalized_email:
                 print(f"✅ Returning email: {normalized_email.get('id')}")
                 return {
                     "email": normalized_email,
@@ -529,40 +555,7 @@ async def read_emails_simplified(
         # Handle list request (no specific email_id)
         else:
             print(f"📋 Fetching email list: limit={limit}, offset={offset}")
-            
-            # Get emails from database
-            try:
-                db_emails = get_emails_from_db_enhanced(
-                    user_email=str(payload.user_email),
-                    limit=limit,
-                    offset=offset
-                )
-                
-                # Normalize field names for all emails
-                normalized_emails = [normalize_email_fields(email) for email in db_emails]
-                
-                # Get total count for pagination
-                total_count = get_user_email_count(str(payload.user_email))
-                
-                return {
-                    "emails": normalized_emails,
-                    "total_count": total_count,
-                    "offset": offset,
-                    "limit": limit,
-                    "has_more": len(normalized_emails) == limit,
-                    "message": f"Retrieved {len(normalized_emails)} emails"
-                }
-                
-            except Exception as e:
-                print(f"❌ Database query failed: {e}")
-                return {
-                    "emails": [],
-                    "total_count": 0,
-                    "offset": offset,
-                    "limit": limit,
-                    "has_more": False,
-                    "message": "Failed to retrieve emails from database"
-                }
+            return load_email_list(str(payload.user_email), limit, offset, sender, label)
 
     except HTTPException:
         raise
@@ -619,34 +612,29 @@ async def send_email_with_headers(payload: EmailHeaders):
         print(f"❌ Error sending email with headers: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
-@app.post("/api/generate-email-body")
-async def generate_email_body(payload: GenerateEmailBodyRequest):
-    """Generate email body using Groq AI"""
-    print(f"🤖 Generating email body for {payload.user_email}")
-    
-    if not groq_client:
-        raise HTTPException(status_code=500, detail="Groq client is not configured.")
-    
-    try:
-        # Create context-aware system prompt based on reply type
-        if payload.reply_type == "reply":
-            system_prompt = """You are a professional email assistant. Draft a direct reply to the original sender. 
-            Be concise, professional, and address their specific points. Match their tone while maintaining professionalism."""
-            
-        elif payload.reply_type == "reply-all":
-            system_prompt = """You are a professional email assistant. Draft a reply that will go to all recipients. 
-            Be mindful that multiple people will see this response. Keep it professional and inclusive."""
-            
-        elif payload.reply_type == "forward":
-            system_prompt = """You are a professional email assistant. Draft a forwarding message that introduces 
-            the forwarded content. Explain why you're sharing this and what action (if any) is needed."""
-            
-        else:
-            system_prompt = """You are a professional email assistant. Draft a clear, professional email response 
-            based on the user's instructions."""
+EMAIL_BODY_CLOSINGS = ['best regards', 'sincerely', 'thank you', 'thanks']
 
-        # Build user prompt with full context
-        user_prompt = f"""
+def email_body_messages(payload: GenerateEmailBodyRequest) -> List[dict]:
+    """Chat messages for generating an email body, shared by the blocking and streaming endpoints"""
+    # Create context-aware system prompt based on reply type
+    if payload.reply_type == "reply":
+        system_prompt = """You are a professional email assistant. Draft a direct reply to the original sender. 
+        Be concise, professional, and address their specific points. Match their tone while maintaining professionalism."""
+        
+    elif payload.reply_type == "reply-all":
+        system_prompt = """You are a professional email assistant. Draft a reply that will go to all recipients. 
+        Be mindful that multiple people will see this response. Keep it professional and inclusive."""
+        
+    elif payload.reply_type == "forward":
+        system_prompt = """You are a professional email assistant. Draft a forwarding message that introduces 
+        the forwarded content. Explain why you're sharing this and what action (if any) is needed."""
+        
+    else:
+        system_prompt = """You are a professional email assistant. Draft a clear, professional email response 
+        based on the user's instructions."""
+
+    # Build user prompt with full context
+    user_prompt = f"""
 Context/Instructions: {payload.context}
 
 Original Email Details:
@@ -657,21 +645,73 @@ Original Email Details:
 Please draft a {payload.reply_type} that follows the user's instructions. 
 Make it professional, appropriate, and actionable."""
 
-        completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            model="llama3-8b-8192",
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def add_closing_signature(generated_body: str) -> str:
+    """Add signature/closing if not present"""
+    if not any(closing in generated_body.lower() for closing in EMAIL_BODY_CLOSINGS):
+        generated_body += "\n\nBest regards"
+    return generated_body
+
+async def relay_completion_text(**completion_kwargs):
+    """Text deltas of a streamed chat completion, read on a worker thread.
+
+    When the consumer stops (client disconnect cancels the response), the worker
+    closes the upstream stream at the next chunk, which aborts the generation.
+    """
+    loop = asyncio.get_running_loop()
+    deltas: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def read_stream():
+        try:
+            stream = llm_client.chat.completions.create(stream=True, **completion_kwargs)
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        print("🛑 Client went away; aborting streamed completion")
+                        break
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        loop.call_soon_threadsafe(deltas.put_nowait, text)
+            finally:
+                stream.close()
+            loop.call_soon_threadsafe(deltas.put_nowait, None)
+        except Exception as e:
+            loop.call_soon_threadsafe(deltas.put_nowait, e)
+
+    loop.run_in_executor(None, read_stream)
+    try:
+        while True:
+            item = await deltas.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+
+@app.post("/api/generate-email-body")
+async def generate_email_body(payload: GenerateEmailBodyRequest):
+    """Generate email body using the configured LLM"""
+    print(f"🤖 Generating email body for {payload.user_email}")
+    
+    if not llm_client:
+        raise HTTPException(status_code=500, detail="LLM client is not configured.")
+    
+    try:
+        completion = llm_client.chat.completions.create(
+            messages=email_body_messages(payload),
+            model=LLM_MODEL,
             temperature=0.7,
             max_tokens=500
         )
         
-        generated_body = completion.choices[0].message.content.strip()
-        
-        # Add signature/closing if not present
-        if not any(closing in generated_body.lower() for closing in ['best regards', 'sincerely', 'thank you', 'thanks']):
-            generated_body += "\n\nBest regards"
+        generated_body = add_closing_signature(completion.choices[0].message.content.strip())
         
         return {
             "success": True,
@@ -683,6 +723,56 @@ Make it professional, appropriate, and actionable."""
         print(f"❌ Error generating email body: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate email body: {str(e)}")
 
+@app.post("/api/generate-email-body/stream")
+async def generate_email_body_stream(payload: GenerateEmailBodyRequest):
+    """Server-sent events variant of /api/generate-email-body: "token" events as the model
+    writes, then "done" with the final body (signature applied) or "error".
+
+    The "done" body is authoritative; the tokens are for progressive display only.
+    Closing the connection aborts the upstream generation.
+    """
+    print(f"🤖 Streaming email body for {payload.user_email}")
+    
+    if not llm_client:
+        raise HTTPException(status_code=500, detail="LLM client is not configured.")
+
+    async def email_body_events():
+        started_at = time.perf_counter()
+        parts = []
+        try:
+            async for text in relay_completion_text(
+                messages=email_body_messages(payload),
+                model=LLM_MODEL,
+                temperature=0.7,
+                max_tokens=500
+            ):
+                if not parts:
+                    stage_metrics.observe("email_body_first_token", (time.perf_counter() - started_at) * 1000)
+                parts.append(text)
+                yield format_sse({"id": len(parts), "type": "token", "data": {"text": text}})
+            
+            generated_body = "".join(parts).strip()
+            final_body = add_closing_signature(generated_body)
+            stage_metrics.observe("email_body_complete", (time.perf_counter() - started_at) * 1000)
+            yield format_sse({"id": len(parts) + 1, "type": "done", "data": {
+                "success": True,
+                "generated_body": final_body,
+                "signature": final_body[len(generated_body):],
+                "reply_type": payload.reply_type
+            }})
+        except Exception as e:
+            print(f"❌ Error streaming email body: {e}")
+            yield format_sse({"id": len(parts) + 1, "type": "error", "data": {
+                "success": False,
+                "detail": f"Failed to generate email body: {str(e)}"
+            }})
+
+    return StreamingResponse(
+        email_body_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.put("/api/update-email-status")
 async def update_email_status_endpoint(
     payload: UpdateEmailStatusPayload,
@@ -692,7 +782,7 @@ async def update_email_status_endpoint(
     print(f"Updating email status for {payload.email_id} (user: {user_email})")
     
     try:
-        success = update_email_status(
+        success = storage.update_email_status(
             email_id=payload.email_id,
             user_email=user_email,
             is_read=payload.is_read,
@@ -701,6 +791,12 @@ async def update_email_status_endpoint(
         )
         
         if success:
+            event_bus.publish(user_email, "email_updated", {
+                "id": payload.email_id,
+                "is_read": payload.is_read,
+                "is_replied": payload.is_replied,
+                "reply_status": payload.reply_status
+            })
             return {"message": "Email status updated successfully"}
         else:
             raise HTTPException(status_code=404, detail="Email not found or no update needed.")
@@ -748,7 +844,7 @@ async def load_older_emails(
     
     try:
         # Get current sync metadata to find next page token
-        sync_metadata = get_user_sync_metadata(str(payload.user_email))
+        sync_metadata = storage.get_user_sync_metadata(str(payload.user_email))
         if not sync_metadata or not sync_metadata.get("next_page_token"):
             return {
                 "message": "No more emails to load",
@@ -764,12 +860,10 @@ async def load_older_emails(
         )
         
         # Store emails in database
-        for email_data in emails:
-            email_data = process_email_with_ai(email_data)
-            insert_email_enhanced(email_data, str(payload.user_email))
+        await run_in_threadpool(store_synced_emails, emails, str(payload.user_email), "older")
         
         # Update sync metadata with new page token
-        update_user_sync_metadata(
+        storage.update_user_sync_metadata(
             user_email=str(payload.user_email),
             next_page_token=next_page_token,
             last_sync_timestamp=int(time.time())
@@ -809,7 +903,8 @@ async def get_email_thread(
 async def mark_email_important(
     email_id: str = Query(..., description="Email ID to mark as important"),
     access_token: str = Query(..., description="Gmail access token"),
-    important: bool = Query(True, description="Mark as important or remove importance")
+    important: bool = Query(True, description="Mark as important or remove importance"),
+    user_email: str | None = Query(None, description="Also update the locally stored labels for this user")
 ):
     """Mark email as important/unimportant in Gmail"""
     print(f"⭐ Marking email {email_id} as {'important' if important else 'not important'}")
@@ -822,6 +917,14 @@ async def mark_email_important(
             remove_labels=[] if important else ["IMPORTANT"]
         )
         
+        if user_email and storage.apply_label_changes(
+            user_email=user_email,
+            email_id=email_id,
+            added=["IMPORTANT"] if important else [],
+            removed=[] if important else ["IMPORTANT"]
+        ):
+            event_bus.publish(user_email, "labels_updated", {"id": email_id, "important": important})
+        
         return {
             "success": True,
             "message": f"Email marked as {'important' if important else 'not important'}",
@@ -833,48 +936,19 @@ async def mark_email_important(
         raise HTTPException(status_code=500, detail=f"Failed to update email importance: {str(e)}")
 
 @app.get("/api/email-analytics/{user_email}")
-async def get_email_analytics(
+async def get_email_analytics_endpoint(
     user_email: str,
-    days: int = Query(30, description="Number of days to analyze")
+    days: int = Query(30, ge=0, description="Number of days to analyze (0 = whole mailbox)"),
+    bucket: str = Query("day", pattern="^(day|week)$", description="Timeline bucket size")
 ):
     """Get email analytics for the user"""
     print(f"📊 Getting email analytics for {user_email} (last {days} days)")
     
     try:
-        # Get emails from database for analytics
-        emails = get_emails_from_db_enhanced(user_email=user_email, limit=1000)
-        
-        # Calculate analytics
-        total_emails = len(emails)
-        replied_emails = sum(1 for email in emails if email.get('is_replied', 0) == 1)
-        negative_sentiment = sum(1 for email in emails if email.get('sentiment') == 'NEGATIVE')
-        positive_sentiment = sum(1 for email in emails if email.get('sentiment') == 'POSITIVE')
-        
-        reply_rate = (replied_emails / total_emails * 100) if total_emails > 0 else 0
-        negative_rate = (negative_sentiment / total_emails * 100) if total_emails > 0 else 0
-        
-        # Group by sender for top senders
-        sender_counts = {}
-        for email in emails:
-            sender = email.get('from_address', 'Unknown')
-            sender_counts[sender] = sender_counts.get(sender, 0) + 1
-        
-        top_senders = sorted(sender_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-        
+        analytics = storage.get_email_analytics(user_email=user_email, days=days, bucket=bucket)
         return {
             "success": True,
-            "analytics": {
-                "total_emails": total_emails,
-                "replied_emails": replied_emails,
-                "reply_rate": round(reply_rate, 2),
-                "sentiment_breakdown": {
-                    "positive": positive_sentiment,
-                    "negative": negative_sentiment,
-                    "neutral": total_emails - positive_sentiment - negative_sentiment
-                },
-                "negative_rate": round(negative_rate, 2),
-                "top_senders": top_senders
-            },
+            "analytics": analytics,
             "period_days": days
         }
         
@@ -882,24 +956,64 @@ async def get_email_analytics(
         print(f"❌ Error getting email analytics: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
 
+@app.get("/api/senders/{user_email}")
+async def get_senders_endpoint(
+    user_email: str,
+    limit: int = Query(10, ge=1, le=100, description="Number of senders/domains to return"),
+    domain: str | None = Query(None, description="Only list senders from this domain")
+):
+    """Top senders and the sender domains producing the most high-priority mail"""
+    print(f"👤 Getting sender breakdown for {user_email}")
+    
+    try:
+        return {
+            "success": True,
+            "senders": storage.get_top_senders(user_email, limit=limit, domain=domain),
+            "domains": storage.get_priority_by_domain(user_email, limit=limit)
+        }
+    except Exception as e:
+        print(f"❌ Error getting senders: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get senders: {str(e)}")
+
+@app.get("/api/search-emails/{user_email}")
+async def search_emails_endpoint(
+    user_email: str,
+    q: str = Query(..., min_length=1, description="Search text"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    cursor: str | None = Query(None, description="next_cursor from the previous page")
+):
+    """Full-text search over the user's stored emails"""
+    print(f"🔎 Searching emails for {user_email}: '{q}'")
+    
+    try:
+        result = storage.search_emails(user_email=user_email, query=q, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error searching emails: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to search emails: {str(e)}")
+    
+    return {
+        "emails": [
+            {**normalize_email_fields(row), "match_snippet": row["match_snippet"], "score": row["score"]}
+            for row in result["results"]
+        ],
+        "next_cursor": result["next_cursor"],
+        "has_more": result["has_more"],
+        "query": q
+    }
+
 @app.delete("/api/reset-user-data/{user_email}")
-async def reset_user_data(user_email: str):
+async def reset_user_data(user_email: str, background: bool = Query(False)):
     """Reset all data for a user (for development/testing)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Delete user emails
-        cursor.execute("DELETE FROM emails WHERE user_email = ?", (user_email,))
-        emails_deleted = cursor.rowcount
-        
-        # Delete user sync metadata
-        cursor.execute("DELETE FROM user_sync_metadata WHERE user_email = ?", (user_email,))
-        metadata_deleted = cursor.rowcount
-        
-        conn.commit()
-        conn.close()
+        result = await run_in_threadpool(storage.reset_user_data, user_email, background)
+        thread_summaries.delete_user(user_email)
+        if "job" in result:
+            return {"message": f"Reset started for user {user_email}", "job": result["job"]}
         
+        emails_deleted = result["emails_deleted"]
+        metadata_deleted = result["metadata_deleted"]
         print(f"🗑️ Reset data for user: {user_email} - {emails_deleted} emails, {metadata_deleted} metadata records")
         return {
             "message": f"All data reset for user {user_email}",
@@ -911,13 +1025,52 @@ async def reset_user_data(user_email: str):
         print(f"❌ Error resetting user data: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to reset user data: {str(e)}")
 
+@app.post("/api/maintenance/cleanup")
+async def cleanup_emails_endpoint(days_old: int = Query(30, ge=1), background: bool = Query(True)):
+    """Delete replied emails older than days_old in batches, then vacuum incrementally"""
+    if background:
+        return storage.cleanup_old_emails(days_old, background=True)
+    return await run_in_threadpool(storage.cleanup_old_emails, days_old)
+
+@app.post("/api/maintenance/rescore-priorities")
+async def rescore_priorities_endpoint():
+    """Re-apply the age factor to priorities now instead of waiting for the periodic run"""
+    result = await run_in_threadpool(priority_rescorer.run_once)
+    return {"updated": result["updated"], "users": len(result["users"])}
+
+@app.get("/api/maintenance/jobs")
+async def list_maintenance_jobs_endpoint():
+    """Progress and throughput of recent maintenance jobs"""
+    return {"jobs": storage.list_maintenance_jobs()}
+
+@app.get("/api/maintenance/jobs/{job_id}")
+async def get_maintenance_job_endpoint(job_id: str):
+    """Progress and throughput of one maintenance job"""
+    job = storage.get_maintenance_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Maintenance job not found")
+    return job
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "timestamp": int(time.time()),
-        "groq_client_available": groq_client is not None
+        "groq_client_available": llm_client is not None,
+        "llm_provider": LLM_PROVIDER,
+        "llm_model": LLM_MODEL,
+        "storage_backend": storage.name,
+        "email_cache": email_cache.stats(),
+        "classification_cache": classification_cache.stats(),
+        "analysis": analysis_executor.stats(),
+        "classification_tiers": classification_tiers.stats(),
+        "thread_summaries": thread_summaries.stats(),
+        "reply_drafts": reply_drafter.stats(),
+        "priority_rescoring": priority_rescorer.stats(),
+        "events": event_bus.stats(),
+        "startup": startup_info,
+        "migrations": storage.get_migration_status()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+# priority_scoring.py - Priority levels that follow email age without re-analysis
+#
+# calculate_email_priority_score adds factors fixed at analysis time (category,
+# sender, urgency and response keywords) to one that changes as the email ages
+# (time_factor). The fixed part is stored on the emails row as priority_static,
+# in integer tenths of a level, and the age as priority_bucket, an index into
+# AGE_BUCKETS. The storage backends' rescore_priorities() recomputes the level
+# for every row in one set-based UPDATE from those two columns and
+# internalDate, writing only the rows whose bucket moved; the LLM and keyword
+# scan never run again. Rows in SETTLED_BUCKET are too old to move and drop out
+# of the partial index the job scans, so a run costs O(recent emails).
+#
+# Levels are computed in integer tenths with ties rounding half to even (the
+# rule of Python's round()), so analysis time and the SQL job always agree.
+
+from typing import Dict, Optional
+import os
+import threading
+import time
+
+HOUR_MS = 3600 * 1000
+
+# (emails younger than, time factor in tenths of a level)
+AGE_BUCKETS = ((2 * HOUR_MS, -5), (24 * HOUR_MS, -2))
+SETTLED_BUCKET = len(AGE_BUCKETS)
+
+PRIORITY_RESCORE_INTERVAL_SECONDS = float(os.getenv("PRIORITY_RESCORE_INTERVAL_SECONDS", "300"))
+
+# Priority levels for better organization
+PRIORITY_LEVELS = {
+    1: {"name": "Critical", "color": "text-red-600", "urgent": True},
+    2: {"name": "High", "color": "text-orange-600", "urgent": True},
+    3: {"name": "Medium", "color": "text-blue-600", "urgent": False},
+    4: {"name": "Low", "color": "text-green-600", "urgent": False},
+    5: {"name": "Very Low", "color": "text-gray-600", "urgent": False}
+}
+
+def age_bucket(internal_date, now_ms: Optional[int] = None) -> int:
+    """AGE_BUCKETS index for an email date in ms; SETTLED_BUCKET without a date"""
+    if not internal_date:
+        return SETTLED_BUCKET
+    age = (now_ms if now_ms is not None else int(time.time() * 1000)) - int(internal_date)
+    for bucket, (max_age, _) in enumerate(AGE_BUCKETS):
+        if age < max_age:
+            return bucket
+    return SETTLED_BUCKET
+
+def time_factor(bucket: int) -> float:
+    return AGE_BUCKETS[bucket][1] / 10 if bucket < SETTLED_BUCKET else 0
+
+def bucket_for_time_factor(value: float) -> int:
+    """The bucket an email was scored in, from the time_factor stored in its analysis_details"""
+    tenths = round(value * 10)
+    for bucket, (_, factor) in enumerate(AGE_BUCKETS):
+        if factor == tenths:
+            return bucket
+    return SETTLED_BUCKET
+
+def static_score_tenths(priority_factors: Dict) -> int:
+    """Every priority factor but time_factor, in tenths, as calculate_email_priority_score sums them
+    (the sentiment priority is both the base and a factor)"""
+    fixed = sum(value for name, value in priority_factors.items() if name != "time_factor")
+    return round((priority_factors["sentiment_priority"] + fixed) * 10)
+
+def level_for_score(static_tenths: int, bucket: int) -> int:
+    total = static_tenths + round(time_factor(bucket) * 10)
+    level, remainder = divmod(total, 10)
+    if remainder > 5 or (remainder == 5 and level % 2 == 1):
+        level += 1
+    return max(1, min(5, level))
+
+# --- The same arithmetic as SQL (SQLite and PostgreSQL) ---
+
+def age_bucket_sql(date_column: str, now_param: str) -> str:
+    whens = " ".join(f"WHEN {now_param} - {date_column} < {max_age} THEN {bucket}"
+                     for bucket, (max_age, _) in enumerate(AGE_BUCKETS))
+    return f"CASE WHEN {date_column} IS NULL THEN {SETTLED_BUCKET} {whens} ELSE {SETTLED_BUCKET} END"
+
+def priority_level_sql(static_column: str, bucket_column: str) -> str:
+    factors = " ".join(f"WHEN {bucket} THEN {tenths}" for bucket, (_, tenths) in enumerate(AGE_BUCKETS))
+    total = f"({static_column} + CASE {bucket_column} {factors} ELSE 0 END)"
+    # Integer division truncates in both engines; totals below 15 clamp to 1 either way
+    rounded = (f"CASE WHEN {total} % 10 = 5 THEN {total} / 10 + ({total} / 10) % 2 "
+               f"ELSE ({total} + 5) / 10 END")
+    return f"CASE WHEN {rounded} < 1 THEN 1 WHEN {rounded} > 5 THEN 5 ELSE {rounded} END"
+
+def priority_name_sql(level_column: str) -> str:
+    whens = " ".join(f"WHEN {level} THEN '{info['name']}'" for level, info in PRIORITY_LEVELS.items())
+    return f"CASE {level_column} {whens} END"
+
+class PriorityRescorer:
+    """Runs storage.rescore_priorities() every interval seconds on a daemon thread"""
+
+    def __init__(self, storage, interval: float = PRIORITY_RESCORE_INTERVAL_SECONDS, on_updated=None):
+        self.storage = storage
+        self.interval = interval
+        self.on_updated = on_updated
+        self._worker = None
+        self.metrics = {"runs": 0, "rows_updated": 0, "failed": 0, "last_run_ms": None, "last_updated": None}
+
+    def start(self) -> Optional[threading.Thread]:
+        if self.interval <= 0 or self._worker is not None:
+            return None
+        self._worker = threading.Thread(target=self._run, name="priority-rescore", daemon=True)
+        self._worker.start()
+        return self._worker
+
+    def run_once(self, now_ms: Optional[int] = None) -> Dict:
+        """One pass; returns {"updated": rows, "users": {user_email: rows}}"""
+        started_at = time.perf_counter()
+        result = self.storage.rescore_priorities(now_ms)
+        self.metrics["runs"] += 1
+        self.metrics["rows_updated"] += result["updated"]
+        self.metrics["last_updated"] = result["updated"]
+        self.metrics["last_run_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+        if result["updated"] and self.on_updated:
+            self.on_updated(result)
+        return result
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Priority re-scoring failed: {e}")
+                self.metrics["failed"] += 1
+
+    def stats(self) -> Dict:
+        return {**self.metrics, "interval_seconds": self.interval}
@@ -0,0 +1,116 @@
+# reply_drafts.py - Reply drafts generated when they are needed, not during sync
+#
+# Analysis only marks high-priority complaints as reply eligible
+# (REPLY_ELIGIBLE_STATUS, no suggested_reply_body yet); sync never waits on a
+# draft. The draft is generated the first time the email is opened, or by one
+# low-priority background worker that drains the emails queued during sync,
+# pausing between drafts so foreground requests keep most of the LLM rate
+# budget. The draft is stored in suggested_reply_body, so each email is drafted
+# once. Eligible emails still queued at shutdown are drafted on first open.
+
+from typing import Dict, Optional
+import os
+import queue
+import threading
+import time
+
+from analysis_executor import ANALYSIS_TIMEOUT_SECONDS
+from enhanced_sentiment_system import REPLY_DRAFTED_STATUS, generate_reply_draft, is_reply_eligible
+from events import event_bus
+
+BACKGROUND_REPLY_DRAFTS = os.getenv("BACKGROUND_REPLY_DRAFTS", "1") == "1"
+REPLY_DRAFT_QUEUE_SIZE = int(os.getenv("REPLY_DRAFT_QUEUE_SIZE", "1000"))
+REPLY_DRAFT_INTERVAL_SECONDS = float(os.getenv("REPLY_DRAFT_INTERVAL_SECONDS", "2"))
+
+class ReplyDrafter:
+    """Drafts replies on first open or from a background queue and stores them through storage"""
+
+    def __init__(self, storage, groq_client, background: bool = BACKGROUND_REPLY_DRAFTS,
+                 queue_size: int = REPLY_DRAFT_QUEUE_SIZE, interval: float = REPLY_DRAFT_INTERVAL_SECONDS):
+        self.storage = storage
+        self.groq_client = groq_client
+        self.background = background
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._queued = set()
+        self._in_flight: Dict[tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self.metrics = {"drafted_on_open": 0, "drafted_in_background": 0, "skipped": 0, "failed": 0, "dropped": 0}
+
+    def enqueue(self, user_email: str, email_id: str):
+        """Queue an eligible email for a background draft; never blocks the caller"""
+        if not self.background or not self.groq_client:
+            return
+        key = (user_email, email_id)
+        with self._lock:
+            if key in self._queued:
+                return
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                # It will be drafted when someone opens it
+                self.metrics["dropped"] += 1
+                return
+            self._queued.add(key)
+            if self._worker is None:
+                # Started lazily so importing or constructing never spawns a thread
+                self._worker = threading.Thread(target=self._run, name="reply-drafts", daemon=True)
+                self._worker.start()
+
+    def draft_on_open(self, user_email: str, email_data: Dict) -> Dict:
+        """email_data with its reply draft, generating and storing it on the first open"""
+        if not is_reply_eligible(email_data):
+            return email_data
+        return self._draft(user_email, email_data, "drafted_on_open") or email_data
+
+    def _run(self):
+        while True:
+            user_email, email_id = self._queue.get()
+            with self._lock:
+                self._queued.discard((user_email, email_id))
+            try:
+                # Re-read: the email may have been opened (and drafted) since it was queued
+                rows = self.storage.get_emails(user_email=user_email, email_id=email_id)
+                if rows and is_reply_eligible(rows[0]):
+                    self._draft(user_email, rows[0], "drafted_in_background")
+                else:
+                    self.metrics["skipped"] += 1
+            except Exception as e:
+                print(f"⚠️ Background reply draft failed for {email_id}: {e}")
+                self.metrics["failed"] += 1
+            time.sleep(self.interval)
+
+    def _draft(self, user_email: str, email_data: Dict, trigger: str) -> Optional[Dict]:
+        key = (user_email, email_data["id"])
+        with self._lock:
+            running = self._in_flight.get(key)
+            if running is None:
+                self._in_flight[key] = threading.Event()
+        if running is not None:
+            # The other path is drafting this email already; wait and read its result back
+            running.wait(ANALYSIS_TIMEOUT_SECONDS)
+            rows = self.storage.get_emails(user_email=user_email, email_id=email_data["id"])
+            if rows and rows[0].get("suggested_reply_body"):
+                return {**email_data, "reply_status": rows[0]["reply_status"],
+                        "suggested_reply_body": rows[0]["suggested_reply_body"]}
+            return None
+        try:
+            draft = generate_reply_draft(email_data, self.groq_client)
+            if not draft or not self.storage.update_email_status(
+                    email_data["id"], user_email, reply_status=REPLY_DRAFTED_STATUS, suggested_reply_body=draft):
+                self.metrics["failed"] += 1
+                return None
+            self.metrics[trigger] += 1
+            event_bus.publish(user_email, "reply_drafted", {
+                "id": email_data["id"],
+                "reply_status": REPLY_DRAFTED_STATUS,
+                "suggested_reply_body": draft
+            })
+            return {**email_data, "reply_status": REPLY_DRAFTED_STATUS, "suggested_reply_body": draft}
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def stats(self) -> Dict:
+        return {**self.metrics, "queued": self._queue.qsize(), "background": self.background}
@@ -0,0 +1,160 @@
+# repository.py - Typed email rows and the single write path for the emails table
+#
+# EmailRecord is the one mapping from the dicts the Gmail reader and the
+# analysis pipeline produce to emails columns. Both backends build their
+# upsert from EMAIL_UPSERT_COLUMNS, so a column added here is written
+# everywhere, and tests/test_storage.py round-trips every one of them.
+#
+# Write rule: a field that is None keeps the stored value on update and gets
+# the column default on first insert. A re-sync that carries no analysis
+# therefore never wipes the analysis of an earlier run.
+
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional
+import json
+
+@dataclass
+class EmailRecord:
+    """One emails row as written by the ingest path"""
+
+    id: str
+    user_email: str
+    threadId: Optional[str] = None
+    historyId: Optional[str] = None
+    from_address: Optional[str] = None
+    subject: Optional[str] = None
+    snippet: Optional[str] = None
+    internalDate: Optional[int] = None
+    sentiment: Optional[str] = None
+    sentiment_display: Optional[str] = None
+    priority_level: Optional[int] = None
+    priority_name: Optional[str] = None
+    confidence: Optional[int] = None
+    requires_immediate_attention: Optional[int] = None
+    auto_reply_suggested: Optional[int] = None
+    # Re-scoring inputs, see priority_scoring.py (None for unanalyzed emails)
+    priority_static: Optional[int] = None
+    priority_bucket: Optional[int] = None
+    reply_status: Optional[str] = None
+    suggested_reply_body: Optional[str] = None
+    is_read: Optional[int] = None
+    is_replied: Optional[int] = None
+    # Stored outside the emails row (email_bodies / email_labels on SQLite)
+    full_body: Optional[str] = None
+    analysis_details: Optional[str] = None
+    labels: Optional[List[str]] = None
+
+    @classmethod
+    def from_email_data(cls, email_data: Dict, user_email: str) -> "EmailRecord":
+        labels = email_data.get('labels')
+        if isinstance(labels, str):
+            labels = json.loads(labels) if labels else []
+        analysis_details = email_data.get('analysis_details')
+        if isinstance(analysis_details, dict):
+            analysis_details = json.dumps(analysis_details)
+        return cls(
+            id=email_data['id'],
+            user_email=user_email,
+            threadId=email_data.get('threadId'),
+            historyId=email_data.get('historyId'),
+            from_address=email_data.get('from', email_data.get('from_address')),
+            subject=email_data.get('subject'),
+            snippet=email_data.get('snippet'),
+            internalDate=email_data.get('internalDate'),
+            sentiment=email_data.get('sentiment'),
+            sentiment_display=email_data.get('sentiment_display'),
+            priority_level=_optional_int(email_data.get('priority_level')),
+            priority_name=email_data.get('priority_name'),
+            confidence=_optional_int(email_data.get('confidence')),
+            requires_immediate_attention=_optional_int(email_data.get('requires_immediate_attention')),
+            auto_reply_suggested=_optional_int(email_data.get('auto_reply_suggested')),
+            priority_static=_optional_int(email_data.get('priority_static')),
+            priority_bucket=_optional_int(email_data.get('priority_bucket')),
+            reply_status=email_data.get('reply_status'),
+            suggested_reply_body=email_data.get('suggested_reply_body'),
+            is_read=_optional_int(email_data.get('is_read')),
+            is_replied=_optional_int(email_data.get('is_replied')),
+            full_body=email_data.get('full_body'),
+            analysis_details=analysis_details,
+            labels=list(labels) if labels is not None else None
+        )
+
+    def column_values(self) -> Dict:
+        """Values of EMAIL_UPSERT_COLUMNS, keyed by column name"""
+        return {column: getattr(self, column) for column in EMAIL_UPSERT_COLUMNS}
+
+def _optional_int(value) -> Optional[int]:
+    return int(value) if value is not None else None
+
+EMAIL_KEY_COLUMNS = ("id", "user_email")
+
+# Payload fields that do not live on the emails row itself
+EMAIL_SIDE_FIELDS = ("full_body", "analysis_details", "labels")
+
+# Every emails column the ingest path writes, in a fixed order
+EMAIL_UPSERT_COLUMNS = tuple(
+    field.name for field in fields(EmailRecord)
+    if field.name not in EMAIL_KEY_COLUMNS + EMAIL_SIDE_FIELDS
+)
+
+# Values used on first insert when a field is None; mirrors the table DEFAULTs
+EMAIL_COLUMN_DEFAULTS = {
+    "from_address": "",
+    "subject": "",
+    "snippet": "",
+    "sentiment": "N/A",
+    "sentiment_display": "N/A",
+    "priority_level": 5,
+    "priority_name": "Very Low",
+    "confidence": 0,
+    "requires_immediate_attention": 0,
+    "auto_reply_suggested": 0,
+    "reply_status": "Not Replied",
+    "is_read": 0,
+    "is_replied": 0
+}
+
+# reply_status values the analysis writes. Any other stored status came from a
+# reply draft or the user (e.g. "AI Reply Suggested", "User Replied") and is
+# kept when the email is synced and analyzed again.
+ANALYSIS_REPLY_STATUSES = ("Not Replied", "Reply Needed")
+
+def upsert_update_sql(column: str, new: str, stored: str) -> str:
+    """The ON CONFLICT value of one EMAIL_UPSERT_COLUMNS column (shared by both backends)"""
+    if column == "reply_status":
+        statuses = ", ".join(sql_literal(status) for status in ANALYSIS_REPLY_STATUSES)
+        return f"CASE WHEN {stored} IS NULL OR {stored} IN ({statuses}) THEN COALESCE({new}, {stored}) ELSE {stored} END"
+    return f"COALESCE({new}, {stored})"
+
+def sqlite_upsert_sql() -> str:
+    """INSERT ... ON CONFLICT for one EmailRecord, bound with named parameters
+    (column_values() plus id, user_email and sender_id).
+
+    Rows owned by another user are left alone (rowcount 0).
+    """
+    columns = EMAIL_KEY_COLUMNS + ("sender_id",) + EMAIL_UPSERT_COLUMNS
+    values = [f":{column}" for column in EMAIL_KEY_COLUMNS + ("sender_id",)]
+    for column in EMAIL_UPSERT_COLUMNS:
+        if column in EMAIL_COLUMN_DEFAULTS:
+            values.append(f"COALESCE(:{column}, {sql_literal(EMAIL_COLUMN_DEFAULTS[column])})")
+        else:
+            values.append(f":{column}")
+    updates = [f"{column} = {upsert_update_sql(column, f':{column}', f'emails.{column}')}"
+               for column in EMAIL_UPSERT_COLUMNS]
+    return f"""
+        INSERT INTO emails ({', '.join(columns)})
+        VALUES ({', '.join(values)})
+        ON CONFLICT(id) DO UPDATE SET
+            {', '.join(updates)},
+            sender_id = COALESCE(excluded.sender_id, emails.sender_id),
+            full_body = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE emails.user_email = excluded.user_email
+    """
+
+def sql_literal(value) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+EMAIL_UPSERT_SQL = sqlite_upsert_sql()
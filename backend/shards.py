@@ -0,0 +1,373 @@
+# shards.py - Route each user's mail to its own SQLite shard file
+#
+# With STORAGE_BACKEND=sharded every user_email is mapped onto one of
+# SHARD_COUNT files in SHARD_DIRECTORY through a consistent-hash ring, or onto
+# a file of its own when SHARD_COUNT=0. Separate files mean separate write
+# locks, so one account's backfill no longer blocks every other account.
+#
+# Routing works by setting database.active_database for the current context,
+# so all of database.py follows along unchanged. ShardRoutingMiddleware does
+# that for each request that names a user (path, ?user_email= or JSON body);
+# requests without one use the default DATABASE_URL file.
+
+from typing import Dict, List, Optional
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import database
+from storage import EmailStorage, SQLiteStorage
+
+SHARD_DIRECTORY = os.getenv("SHARD_DIRECTORY", "shards")
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "8"))
+SHARD_VIRTUAL_NODES = 64
+MAX_IDLE_CONNECTIONS = 4
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """Consistent-hash ring; adding a shard only moves about 1/N of the users"""
+
+    def __init__(self, shards: List[str], virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self._ring = sorted(
+            (_hash(f"{shard}#{replica}"), shard)
+            for shard in shards for replica in range(virtual_nodes)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    def shard_for(self, key: str) -> str:
+        index = bisect.bisect(self._keys, _hash(key.lower())) % len(self._ring)
+        return self._ring[index][1]
+
+class PooledConnection:
+    """sqlite3 connection whose close() rolls back and returns it to the cache"""
+
+    def __init__(self, conn: sqlite3.Connection, cache: "ConnectionCache", database_url: str):
+        self._conn = conn
+        self._cache = cache
+        self._database_url = database_url
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._cache.release(self._database_url, conn)
+
+class ConnectionCache:
+    """Per-thread idle connections for each shard file.
+
+    Connections never cross threads, and nested get_db_connection() calls
+    each get their own connection, so one caller's close() cannot roll back
+    another caller's open transaction.
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self.stats = {"opened": 0, "reused": 0}
+
+    def _idle(self, database_url: str) -> list:
+        if not hasattr(self._local, "idle"):
+            self._local.idle = {}
+        return self._local.idle.setdefault(database_url, [])
+
+    def acquire(self, database_url: str) -> PooledConnection:
+        idle = self._idle(database_url)
+        if idle:
+            self.stats["reused"] += 1
+            conn = idle.pop()
+        else:
+            self.stats["opened"] += 1
+            conn = database.open_db_connection(database_url)
+        return PooledConnection(conn, self, database_url)
+
+    def release(self, database_url: str, conn: sqlite3.Connection):
+        conn.rollback()
+        idle = self._idle(database_url)
+        if len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+class ShardRouter:
+    """Maps user_email to a shard file and activates it for the current context"""
+
+    def __init__(self, directory: str = SHARD_DIRECTORY, shard_count: int = SHARD_COUNT):
+        self.directory = directory
+        self.shard_count = shard_count
+        self.ring = HashRing([f"shard_{i:02d}" for i in range(shard_count)]) if shard_count > 0 else None
+        self._initialized = set()
+        self._init_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def shard_for(self, user_email: str) -> str:
+        if self.ring is None:
+            # One file per user
+            return f"user_{hashlib.sha1(user_email.lower().encode('utf-8')).hexdigest()[:16]}"
+        return self.ring.shard_for(user_email)
+
+    def path_for(self, shard: str) -> str:
+        return os.path.join(self.directory, f"{shard}.db")
+
+    def shard_paths(self) -> List[str]:
+        """Every shard file that exists (per-user files included)"""
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.endswith(".db")
+        )
+
+    def ensure_schema(self, path: str):
+        """Run the schema setup once per shard file per process"""
+        if path in self._initialized:
+            return
+        with self._init_lock:
+            if path in self._initialized:
+                return
+            token = database.active_database.set(path)
+            try:
+                database.initialize_database()
+            finally:
+                database.active_database.reset(token)
+            self._initialized.add(path)
+
+    def path_for_user(self, user_email: str) -> str:
+        return self.path_for(self.shard_for(user_email))
+
+    def has_schema(self, path: str) -> bool:
+        return path in self._initialized
+
+    def activate(self, user_email: str):
+        """Route database.get_db_connection() to the user's shard; returns a reset token"""
+        path = self.path_for_user(user_email)
+        self.ensure_schema(path)
+        return database.active_database.set(path)
+
+    @contextlib.contextmanager
+    def use(self, user_email: str):
+        token = self.activate(user_email)
+        try:
+            yield
+        finally:
+            database.active_database.reset(token)
+
+    @contextlib.contextmanager
+    def use_path(self, path: str):
+        token = database.active_database.set(path)
+        try:
+            yield
+        finally:
+            database.active_database.reset(token)
+
+class ShardedSQLiteStorage(EmailStorage):
+    """SQLiteStorage spread over shard files, with fan-out for cross-user reads"""
+
+    name = "sharded"
+
+    def __init__(self, router: ShardRouter = None):
+        self.router = router or ShardRouter()
+        self.shard = SQLiteStorage()
+        self.migration_status: Dict[str, str] = {}
+        self.connection_cache = ConnectionCache()
+        self._previous_connection_cache = None
+
+    def initialize(self) -> Dict:
+        started_at = time.perf_counter()
+        self._previous_connection_cache = database.connection_cache
+        database.connection_cache = self.connection_cache
+        # Requests that name no user still use the default file
+        self.router.ensure_schema(database.DATABASE_URL)
+        if self.router.ring is not None:
+            for i in range(self.router.shard_count):
+                self.router.ensure_schema(self.router.path_for(f"shard_{i:02d}"))
+        for path in self.router.shard_paths():
+            self.router.ensure_schema(path)
+        threading.Thread(target=self._run_migrations, name="shard-migrations", daemon=True).start()
+        return {"schema_setup_ms": round((time.perf_counter() - started_at) * 1000, 2),
+                "shards": len(self.router.shard_paths())}
+
+    def close(self):
+        if database.connection_cache is self.connection_cache:
+            database.connection_cache = self._previous_connection_cache
+
+    def _run_migrations(self):
+        # One shard at a time keeps the background load to a single writer
+        for path in self.router.shard_paths():
+            with self.router.use_path(path):
+                self.migration_status[path] = "running"
+                ok = database.run_data_migrations(database.get_pending_data_migrations())
+                self.migration_status[path] = "completed" if ok else "failed"
+
+    def _fan_out(self, fn) -> list:
+        results = []
+        for path in self.router.shard_paths():
+            with self.router.use_path(path):
+                results.append(fn())
+        return results
+
+    def insert_email(self, email_data: Dict, user_email: str) -> None:
+        with self.router.use(user_email):
+            self.shard.insert_email(email_data, user_email)
+
+    def insert_emails_bulk(self, emails: List[Dict], user_email: str) -> int:
+        with self.router.use(user_email):
+            return self.shard.insert_emails_bulk(emails, user_email)
+
+    def get_emails(self, user_email: str = None, limit: int = 10, offset: int = 0, **filters) -> List[Dict]:
+        if user_email:
+            with self.router.use(user_email):
+                return self.shard.get_emails(user_email=user_email, limit=limit, offset=offset, **filters)
+        # No user: merge the newest rows of every shard
+        rows = [row for shard_rows in self._fan_out(
+                    lambda: self.shard.get_emails(limit=limit + offset, offset=0, **filters))
+                for row in shard_rows]
+        rows.sort(key=lambda row: row.get("internalDate") or 0, reverse=True)
+        return rows if filters.get("email_id") else rows[offset:offset + limit]
+
+    def search_emails(self, user_email: str, query: str, limit: int = 20, cursor: str = None) -> Dict:
+        with self.router.use(user_email):
+            return self.shard.search_emails(user_email, query, limit=limit, cursor=cursor)
+
+    def apply_label_changes(self, user_email: str, email_id: str, added: List[str] = None,
+                            removed: List[str] = None) -> bool:
+        with self.router.use(user_email):
+            return self.shard.apply_label_changes(user_email, email_id, added=added, removed=removed)
+
+    def get_top_senders(self, user_email: str, limit: int = 10, domain: str = None) -> List[Dict]:
+        with self.router.use(user_email):
+            return self.shard.get_top_senders(user_email, limit=limit, domain=domain)
+
+    def get_priority_by_domain(self, user_email: str, limit: int = 10) -> List[Dict]:
+        with self.router.use(user_email):
+            return self.shard.get_priority_by_domain(user_email, limit=limit)
+
+    def update_email_status(self, email_id: str, user_email: str, **changes) -> bool:
+        with self.router.use(user_email):
+            return self.shard.update_email_status(email_id, user_email, **changes)
+
+    def rescore_priorities(self, now_ms: int = None) -> Dict:
+        result = {"updated": 0, "users": {}}
+        # Users never span shards, so the per-shard results merge without overlap
+        for shard_result in self._fan_out(lambda: self.shard.rescore_priorities(now_ms)):
+            result["updated"] += shard_result["updated"]
+            result["users"].update(shard_result["users"])
+        return result
+
+    def get_user_email_count(self, user_email: str) -> int:
+        with self.router.use(user_email):
+            return self.shard.get_user_email_count(user_email)
+
+    def delete_user_emails(self, user_email: str) -> int:
+        with self.router.use(user_email):
+            return self.shard.delete_user_emails(user_email)
+
+    def get_user_sync_metadata(self, user_email: str) -> Optional[Dict]:
+        with self.router.use(user_email):
+            return self.shard.get_user_sync_metadata(user_email)
+
+    def update_user_sync_metadata(self, user_email: str, **fields) -> None:
+        with self.router.use(user_email):
+            self.shard.update_user_sync_metadata(user_email, **fields)
+
+    def delete_user_sync_metadata(self, user_email: str) -> bool:
+        with self.router.use(user_email):
+            return self.shard.delete_user_sync_metadata(user_email)
+
+    def get_email_analytics(self, user_email: str, days: int = 30, bucket: str = "day", top_senders: int = 10) -> Dict:
+        with self.router.use(user_email):
+            return self.shard.get_email_analytics(user_email, days=days, bucket=bucket, top_senders=top_senders)
+
+    def reset_user_data(self, user_email: str, background: bool = False) -> Dict:
+        with self.router.use(user_email):
+            return self.shard.reset_user_data(user_email, background=background)
+
+    def cleanup_old_emails(self, days_old: int = 30, background: bool = False) -> Dict:
+        results = self._fan_out(lambda: self.shard.cleanup_old_emails(days_old, background))
+        if background:
+            # One batched job per shard file, each on its own thread
+            return {"jobs": [result["job"] for result in results]}
+        return {"deleted": sum(result["deleted"] for result in results)}
+
+    def get_migration_status(self) -> Dict:
+        states = set(self.migration_status.values())
+        state = "failed" if "failed" in states else "running" if "running" in states else "completed"
+        return {"state": state, "shards": self.migration_status}
+
+    def get_database_stats(self) -> Dict:
+        stats = {"total_emails": 0, "unique_users": 0, "sentiment_breakdown": {},
+                 "reply_status_breakdown": {}, "shards": {}}
+        for path, shard_stats in zip(self.router.shard_paths(), self._fan_out(database.get_database_stats)):
+            # Users never span shards, so per-shard user counts simply add up
+            stats["total_emails"] += shard_stats.get("total_emails", 0)
+            stats["unique_users"] += shard_stats.get("unique_users", 0)
+            for key in ("sentiment_breakdown", "reply_status_breakdown"):
+                for bucket, count in shard_stats.get(key, {}).items():
+                    stats[key][bucket] = stats[key].get(bucket, 0) + count
+            stats["shards"][os.path.basename(path)] = shard_stats.get("total_emails", 0)
+        return stats
+
+_USER_PATH_RE = re.compile(r"/([^/?#]+@[^/?#]+)")
+
+def _user_email_from_scope(scope) -> Optional[str]:
+    from urllib.parse import parse_qs, unquote
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("user_email"):
+        return query["user_email"][0]
+    match = _USER_PATH_RE.search(unquote(scope.get("path", "")))
+    return match.group(1) if match else None
+
+class ShardRoutingMiddleware:
+    """ASGI middleware that activates the shard of the user a request is about"""
+
+    def __init__(self, app, router: ShardRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        user_email = _user_email_from_scope(scope)
+        headers = dict(scope.get("headers") or [])
+        if user_email is None and b"application/json" in headers.get(b"content-type", b""):
+            # Buffer the JSON body to read user_email, then replay it to the app
+            messages, body = [], b""
+            while True:
+                message = await receive()
+                messages.append(message)
+                body += message.get("body", b"")
+                if message["type"] != "http.request" or not message.get("more_body"):
+                    break
+            try:
+                payload = json.loads(body or b"{}")
+                user_email = payload.get("user_email") if isinstance(payload, dict) else None
+            except ValueError:
+                user_email = None
+
+            async def replay():
+                return messages.pop(0) if messages else await receive()
+            receive = replay
+
+        if not user_email:
+            await self.app(scope, receive, send)
+            return
+        path = self.router.path_for_user(str(user_email))
+        if not self.router.has_schema(path):
+            # First request for a new shard file: set its schema up off the event loop
+            await asyncio.to_thread(self.router.ensure_schema, path)
+        token = self.router.activate(str(user_email))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            database.active_database.reset(token)
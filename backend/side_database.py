@@ -0,0 +1,37 @@
+# side_database.py - Small SQLite files kept beside the email database
+#
+# The classification cache and the thread digests each live in a file of their
+# own, shared by every user and by every storage backend. SideDatabase holds
+# what they have in common: one connection opened on first use (WAL, relaxed
+# fsync, autocommit) that callers share under self._lock, and counters that
+# stats() reports.
+
+from typing import Dict, Iterable
+import sqlite3
+import threading
+
+class SideDatabase:
+    """One lazily opened SQLite file; subclasses create their tables in _setup()"""
+
+    def __init__(self, path: str, metrics: Iterable[str]):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self.metrics = {name: 0 for name in metrics}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so importing a module never touches the disk
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._setup(conn)
+            self._conn = conn
+        return self._conn
+
+    def _setup(self, conn: sqlite3.Connection):
+        """Create the tables (runs once, when the file is first opened)"""
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self.metrics, "path": self.path}
@@ -0,0 +1,38 @@
+# test_analysis.py - Analysis results reach the emails row intact
+
+import time
+
+import pytest
+
+from enhanced_sentiment_system import process_email_with_enhanced_ai, process_emails_with_enhanced_ai
+from repository import EMAIL_UPSERT_COLUMNS
+
+# Columns filled by the Gmail sync or later user actions rather than the analysis
+NON_ANALYSIS_COLUMNS = {"threadId", "historyId", "from_address", "subject", "snippet", "internalDate",
+                        "suggested_reply_body", "is_read", "is_replied"}
+ANALYSIS_COLUMNS = [column for column in EMAIL_UPSERT_COLUMNS if column not in NON_ANALYSIS_COLUMNS]
+
+def complaint(email_id: str) -> dict:
+    return {'id': email_id, 'threadId': f'thread-{email_id}', 'from': 'Pat <pat@customer.example>',
+            'subject': 'Order 1182', 'snippet': 'The parcel arrived damaged and support has not answered.',
+            'internalDate': int(time.time() * 1000) - 60_000}
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_every_analysis_column_is_stored(storage, user_email, analysis_stores, fake_llm, batched):
+    if batched:
+        llm = fake_llm('[{"id": 1, "category": "URGENT_COMPLAINT", "confidence": 93, "reasoning": "damaged"}]')
+        analyzed = process_emails_with_enhanced_ai([complaint("an-1")], llm, user_email)[0]
+    else:
+        llm = fake_llm('{"category": "URGENT_COMPLAINT", "confidence": 93, "reasoning": "damaged"}')
+        analyzed = process_email_with_enhanced_ai(complaint("an-1"), llm, user_email)
+    assert llm.requests, "the fake LLM should have classified the email"
+
+    missing = [column for column in ANALYSIS_COLUMNS if analyzed.get(column) is None]
+    assert not missing, f"analysis did not set {missing}"
+    # An urgent complaint exercises the truthy flags, not just the defaults
+    assert analyzed["auto_reply_suggested"] and analyzed["requires_immediate_attention"]
+
+    storage.insert_email(analyzed, user_email)
+    stored = storage.get_emails(user_email=user_email, email_id="an-1")[0]
+    assert {column: stored[column] for column in ANALYSIS_COLUMNS} == \
+        {column: analyzed[column] for column in ANALYSIS_COLUMNS}
@@ -0,0 +1,57 @@
+# test_analysis_executor.py - LLM requests made under AnalysisExecutor.map stop at its deadline
+
+import time
+
+from analysis_executor import AnalysisExecutor, RateLimitedClient, RateLimiter, StageMetrics
+
+class RecordingClient:
+    """Records the timeout of every request; raises `error` instead of answering when set"""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.timeouts = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, timeout: float = None, **request):
+        self.timeouts.append(timeout)
+        if self.error:
+            raise self.error
+        return "ok"
+
+class RateLimitError(Exception):
+    status_code = 429
+
+def limited(client) -> RateLimitedClient:
+    return RateLimitedClient(client, RateLimiter(0, 0), StageMetrics(), timeout=20)
+
+def test_requests_in_map_get_the_time_left_as_their_timeout():
+    client = RecordingClient()
+    executor = AnalysisExecutor(concurrency=2, metrics=StageMetrics())
+    results = executor.map("test", lambda item: limited(client).chat.completions.create(messages=[]), [1, 2], timeout=5)
+    assert results == ["ok", "ok"]
+    assert len(client.timeouts) == 2 and all(0 < timeout <= 5 for timeout in client.timeouts)
+
+def test_requests_outside_map_keep_the_client_timeout():
+    client = RecordingClient()
+    limited(client).chat.completions.create(messages=[])
+    assert client.timeouts == [20]
+
+def test_rate_limit_backoff_stops_at_the_deadline():
+    client = RecordingClient(RateLimitError("rate limited"))
+    executor = AnalysisExecutor(concurrency=1, metrics=StageMetrics())
+    finished = []
+
+    def classify(item):
+        try:
+            return limited(client).chat.completions.create(messages=[])
+        finally:
+            finished.append(time.monotonic())
+
+    started_at = time.monotonic()
+    assert executor.map("test", classify, [1], timeout=0.5, fallback=lambda item: "fallback") == ["fallback"]
+    # Without the deadline the worker would keep backing off for several seconds
+    deadline = time.monotonic() + 2
+    while not finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert finished and finished[0] - started_at < 1.5
@@ -0,0 +1,79 @@
+# test_classification_cache.py - Cache keys follow the prompt inputs; eviction drops the least recently used
+
+import pytest
+
+import classification_cache
+from classification_cache import ClassificationCache, classification_key
+
+EMAIL = {'id': 'c-1', 'from': 'News <news@example.com>', 'subject': 'Weekly digest',
+         'snippet': 'Top stories this week', 'internalDate': 1_700_000_000_000}
+
+def test_key_is_stable_and_ignores_fields_outside_the_prompt():
+    key = classification_key(EMAIL, "model-a", 1)
+    assert classification_key(dict(EMAIL), "model-a", 1) == key
+    assert classification_key({**EMAIL, 'id': 'c-2', 'internalDate': 1}, "model-a", 1) == key
+
+@pytest.mark.parametrize("change", [
+    {'from': 'Other <other@example.com>'},
+    {'subject': 'Monthly digest'},
+    {'snippet': 'Top stories this month'},
+    {'thread_context': '- News (2024-01-01): last week'},
+])
+def test_key_changes_with_every_prompt_input(change):
+    assert classification_key({**EMAIL, **change}, "model-a", 1) != classification_key(EMAIL, "model-a", 1)
+
+def test_key_changes_with_model_and_prompt_version():
+    key = classification_key(EMAIL, "model-a", 1)
+    assert classification_key(EMAIL, "model-b", 1) != key
+    assert classification_key(EMAIL, "model-a", 2) != key
+
+def test_key_ignores_snippet_text_the_prompt_truncates():
+    long_email = {**EMAIL, 'snippet': 'x' * 500}
+    assert classification_key({**long_email, 'snippet': 'x' * 500 + ' more'}, "model-a", 1) == \
+        classification_key(long_email, "model-a", 1)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Drives the time.time() seen by classification_cache"""
+    now = [1000.0]
+    monkeypatch.setattr(classification_cache.time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture
+def cache(tmp_path):
+    return ClassificationCache(str(tmp_path / "classification_cache.db"), max_entries=10)
+
+def result(n: int) -> dict:
+    return {"category": "INFORMATIONAL", "confidence": n, "reasoning": f"entry {n}"}
+
+def test_get_returns_what_put_stored(cache):
+    assert cache.get("missing") is None
+    cache.put("k", "model-a", 1, result(1))
+    cache.put("k", "model-a", 1, result(2))
+    assert cache.get("k") == result(2)
+    assert cache.stats()["entries"] == 1
+    assert (cache.metrics["hits"], cache.metrics["misses"]) == (1, 1)
+
+def test_overflow_trims_to_ninety_percent_least_recently_used_first(cache, clock):
+    for n in range(10):
+        clock[0] = 1000.0 + n
+        cache.put(f"k{n}", "model-a", 1, result(n))
+    # A hit after the touch interval makes k0 recently used again
+    clock[0] = 1000.0 + 10 + classification_cache.TOUCH_INTERVAL_SECONDS
+    assert cache.get("k0") == result(0)
+
+    clock[0] += 1
+    cache.put("k10", "model-a", 1, result(10))
+    assert cache.stats()["entries"] == 9 and cache.metrics["evictions"] == 2
+    assert cache.get("k1") is None and cache.get("k2") is None
+    assert all(cache.get(f"k{n}") == result(n) for n in (0, 3, 9, 10))
+
+def test_hits_inside_the_touch_interval_do_not_refresh_last_used(cache, clock):
+    for n in range(10):
+        clock[0] = 1000.0 + n
+        cache.put(f"k{n}", "model-a", 1, result(n))
+    clock[0] = 1010.0
+    assert cache.get("k0") == result(0)
+
+    cache.put("k10", "model-a", 1, result(10))
+    assert cache.get("k0") is None and cache.get("k1") is None
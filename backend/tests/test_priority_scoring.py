@@ -0,0 +1,95 @@
+# test_priority_scoring.py - Re-scoring in SQL agrees with the priority computed at analysis time
+
+from fractions import Fraction
+import sqlite3
+import time
+
+import pytest
+
+from enhanced_sentiment_system import build_analysis_result, calculate_email_priority_score
+from priority_scoring import (
+    AGE_BUCKETS, HOUR_MS, PRIORITY_LEVELS, SETTLED_BUCKET, age_bucket, level_for_score,
+    priority_level_sql, priority_name_sql, time_factor
+)
+
+# Static scores well past both clamps, every bucket
+SCORES = [(static, bucket) for static in range(-80, 101) for bucket in range(SETTLED_BUCKET + 1)]
+
+def test_level_for_score_rounds_half_to_even_and_clamps():
+    for static, bucket in SCORES:
+        exact = Fraction(static, 10) + Fraction(AGE_BUCKETS[bucket][1] if bucket < SETTLED_BUCKET else 0, 10)
+        assert level_for_score(static, bucket) == max(1, min(5, round(exact))), (static, bucket)
+
+def sql_levels(conn) -> dict:
+    rows = conn.execute(f"""
+        SELECT static, bucket, {priority_level_sql('static', 'bucket')} AS level
+        FROM scores
+    """).fetchall()
+    return {(row["static"], row["bucket"]): row["level"] for row in rows}
+
+@pytest.mark.parametrize("engine", ["sqlite", "postgres"])
+def test_priority_level_sql_matches_level_for_score(request, engine):
+    expected = {(static, bucket): level_for_score(static, bucket) for static, bucket in SCORES}
+    if engine == "sqlite":
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        conn.execute("CREATE TABLE scores (static INTEGER, bucket INTEGER)")
+        conn.executemany("INSERT INTO scores VALUES (?, ?)", SCORES)
+        assert sql_levels(conn) == expected
+        return
+    storage = request.getfixturevalue("postgres_storage")
+    with storage.pool.connection() as conn:
+        with conn.transaction(force_rollback=True):
+            conn.execute("CREATE TEMP TABLE scores (static INTEGER, bucket INTEGER)")
+            with conn.cursor().copy("COPY scores (static, bucket) FROM STDIN") as copy:
+                for row in SCORES:
+                    copy.write_row(row)
+            assert sql_levels(conn) == expected
+
+def test_priority_name_sql_covers_every_level():
+    conn = sqlite3.connect(":memory:")
+    names = [conn.execute(f"SELECT {priority_name_sql(str(level))}").fetchone()[0] for level in PRIORITY_LEVELS]
+    assert names == [info["name"] for info in PRIORITY_LEVELS.values()]
+
+def test_age_bucket_edges():
+    now_ms = 1_700_000_000_000
+    assert age_bucket(None, now_ms) == SETTLED_BUCKET
+    assert [age_bucket(now_ms - age, now_ms) for age in (0, 2 * HOUR_MS - 1, 2 * HOUR_MS, 24 * HOUR_MS)] == \
+        [0, 0, 1, SETTLED_BUCKET]
+    assert [time_factor(bucket) for bucket in range(SETTLED_BUCKET + 1)] == [-0.5, -0.2, 0]
+
+# Fixed factors (priority_static) chosen so levels move between buckets, hit a
+# half-way tie in each bucket and reach both clamps
+AGING_EMAILS = [
+    ("URGENT_COMPLAINT", {'from': 'Ops <ops@gmail.com>', 'subject': 'URGENT outage', 'snippet': 'critical, asap'}),  # 7: 1 1 1
+    ("COMPLAINT", {'from': 'Pat <pat@customer.example>', 'subject': 'Urgent: broken export', 'snippet': 'It fails.'}),  # 30: 2 3 3
+    ("COMPLAINT", {'from': 'Sam <sam@gmail.com>', 'subject': 'Urgent: broken export', 'snippet': 'It fails.'}),  # 27: 2 2 3
+    ("COMPLAINT", {'from': 'Pat <pat@customer.example>', 'subject': 'Broken export', 'snippet': 'Please reply.'}),  # 35: 3 3 4
+    ("QUESTION", {'from': 'Lee <lee@gmail.com>', 'subject': 'Urgent pricing question', 'snippet': 'How much?'}),  # 47: 4 4 5
+    ("REQUEST", {'from': 'Kim <kim@corp.example>', 'subject': 'Deadline today', 'snippet': 'Please send it'}),  # 50: 4 5 5
+    ("INFORMATIONAL", {'from': 'News <news@example.com>', 'subject': 'Weekly digest', 'snippet': 'Top stories'}),  # 100: 5 5 5
+]
+
+def test_rescoring_matches_a_fresh_analysis(storage, user_email):
+    now_ms = int(time.time() * 1000)
+    received_ms = now_ms - HOUR_MS
+    for n, (category, fields) in enumerate(AGING_EMAILS):
+        email_data = {'id': f'age-{n}', 'internalDate': received_ms, **fields}
+        result = build_analysis_result(email_data, (category, 90, "test"), "test")
+        assert result["priority_bucket"] == 0
+        storage.insert_email({**email_data, 'sentiment': category, **{
+            key: result[key] for key in ("priority_level", "priority_name", "requires_immediate_attention",
+                                         "priority_static", "priority_bucket")
+        }}, user_email)
+
+    # Walk the emails through every bucket: the stored level must equal what
+    # analysis would compute if it ran at that moment
+    for later_ms in (now_ms, now_ms + 2 * HOUR_MS, now_ms + 30 * HOUR_MS):
+        storage.rescore_priorities(later_ms)
+        for n, (category, fields) in enumerate(AGING_EMAILS):
+            email_data = {'id': f'age-{n}', 'internalDate': received_ms, **fields}
+            level, _ = calculate_email_priority_score(email_data, category, later_ms)
+            stored = storage.get_emails(user_email=user_email, email_id=f'age-{n}')[0]
+            assert (stored["priority_level"], stored["priority_name"], stored["requires_immediate_attention"]) == \
+                (level, PRIORITY_LEVELS[level]["name"], int(level <= 2)), (category, later_ms)
+            assert stored["priority_bucket"] == age_bucket(received_ms, later_ms)
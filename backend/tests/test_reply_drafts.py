@@ -0,0 +1,81 @@
+# test_reply_drafts.py - Reply drafts are generated once and survive re-analysis
+
+import threading
+import time
+
+import pytest
+
+from enhanced_sentiment_system import REPLY_DRAFTED_STATUS, REPLY_ELIGIBLE_STATUS, is_reply_eligible
+from reply_drafts import ReplyDrafter
+
+def eligible_complaint(email_id: str = "rd-1") -> dict:
+    return {'id': email_id, 'from': 'Pat <pat@customer.example>', 'subject': 'Damaged parcel',
+            'snippet': 'The parcel arrived damaged.', 'internalDate': int(time.time() * 1000),
+            'sentiment': 'COMPLAINT', 'priority_level': 2, 'reply_status': REPLY_ELIGIBLE_STATUS}
+
+@pytest.mark.parametrize("kept_status", [REPLY_DRAFTED_STATUS, "User Replied"])
+def test_reanalysis_keeps_a_drafted_or_replied_status(storage, user_email, kept_status):
+    storage.insert_email(eligible_complaint(), user_email)
+    storage.update_email_status("rd-1", user_email, reply_status=kept_status, suggested_reply_body="On its way.")
+
+    # The next sync analyzes the email again and marks it reply eligible
+    storage.insert_email(eligible_complaint(), user_email)
+    stored = storage.get_emails(user_email=user_email, email_id="rd-1")[0]
+    assert (stored["reply_status"], stored["suggested_reply_body"]) == (kept_status, "On its way.")
+    assert not is_reply_eligible(stored)
+
+def test_reanalysis_still_moves_between_analysis_statuses(storage, user_email):
+    storage.insert_email(eligible_complaint(), user_email)
+    storage.insert_email({**eligible_complaint(), 'reply_status': 'Not Replied'}, user_email)
+    assert storage.get_emails(user_email=user_email, email_id="rd-1")[0]["reply_status"] == "Not Replied"
+    storage.insert_email(eligible_complaint(), user_email)
+    assert storage.get_emails(user_email=user_email, email_id="rd-1")[0]["reply_status"] == REPLY_ELIGIBLE_STATUS
+
+@pytest.fixture
+def gated_llm(fake_llm):
+    """A fake LLM whose completions wait until the test opens the gate"""
+    llm = fake_llm("Sorry about the parcel, a replacement ships today.")
+    llm.gate, llm.entered = threading.Event(), threading.Event()
+    create = llm.chat.completions.create
+
+    def gated_create(**request):
+        llm.entered.set()
+        llm.gate.wait(5)
+        return create(**request)
+
+    llm.chat.completions.create = gated_create
+    return llm
+
+def test_concurrent_opens_draft_once(storage, user_email, gated_llm):
+    storage.insert_email(eligible_complaint(), user_email)
+    drafter = ReplyDrafter(storage, gated_llm, background=False)
+    email_data = storage.get_emails(user_email=user_email, email_id="rd-1")[0]
+    results = []
+    openers = [threading.Thread(target=lambda: results.append(drafter.draft_on_open(user_email, email_data)))
+               for _ in range(3)]
+    openers[0].start()
+    assert gated_llm.entered.wait(5)
+    for opener in openers[1:]:
+        opener.start()
+    time.sleep(0.1)
+    gated_llm.gate.set()
+    for opener in openers:
+        opener.join(5)
+
+    assert len(gated_llm.requests) == 1
+    assert [result["suggested_reply_body"] for result in results] == [gated_llm.reply] * 3
+    assert drafter.stats()["drafted_on_open"] == 1
+    stored = storage.get_emails(user_email=user_email, email_id="rd-1")[0]
+    assert (stored["reply_status"], stored["suggested_reply_body"]) == (REPLY_DRAFTED_STATUS, gated_llm.reply)
+
+def test_a_drafted_email_is_not_drafted_again(storage, user_email, fake_llm):
+    llm = fake_llm("Sorry about the parcel.")
+    storage.insert_email(eligible_complaint(), user_email)
+    drafter = ReplyDrafter(storage, llm, background=False)
+    drafter.draft_on_open(user_email, storage.get_emails(user_email=user_email, email_id="rd-1")[0])
+
+    # Re-synced and re-analyzed, then opened again
+    storage.insert_email(eligible_complaint(), user_email)
+    reopened = drafter.draft_on_open(user_email, storage.get_emails(user_email=user_email, email_id="rd-1")[0])
+    assert len(llm.requests) == 1
+    assert reopened["suggested_reply_body"] == "Sorry about the parcel."
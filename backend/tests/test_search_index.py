@@ -0,0 +1,39 @@
+# test_search_index.py - Upgrading a SQLite search index built before user_email was stored in it
+
+import database
+from conftest import wait_for_migrations
+from storage import SQLiteStorage
+
+OLD_SEARCH_INDEX = """
+    CREATE VIRTUAL TABLE emails_fts USING fts5(
+        subject, sender, snippet, body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+def test_old_search_index_is_recreated_and_refilled(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", str(tmp_path / "emails.db"))
+    monkeypatch.setattr(database, "connection_cache", None)
+    monkeypatch.setattr(database, "user_change_listeners", [])
+    storage = SQLiteStorage()
+    storage.initialize()
+    wait_for_migrations()
+    for user in ("a@example.com", "b@example.com"):
+        storage.insert_email({'id': f'{user}-1', 'from': 'Alice <alice@example.com>',
+                              'subject': 'Invoice due', 'internalDate': 1}, user)
+
+    # Put the index back the way it was before user_email was added
+    conn = database.get_db_connection()
+    conn.execute("DROP TABLE emails_fts")
+    conn.execute(OLD_SEARCH_INDEX)
+    conn.execute("INSERT INTO emails_fts(rowid, subject, sender, snippet, body) "
+                 "SELECT rowid, subject, from_address, snippet, '' FROM emails")
+    conn.execute("DELETE FROM schema_migrations WHERE name = 'search_user_email_v1'")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    storage.initialize()
+    wait_for_migrations()
+    assert [row["id"] for row in storage.search_emails("a@example.com", "invoice")["results"]] == ["a@example.com-1"]
+    assert [row["id"] for row in storage.search_emails("b@example.com", "invoice")["results"]] == ["b@example.com-1"]
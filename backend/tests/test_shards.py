@@ -0,0 +1,44 @@
+# test_shards.py - Shard routing: the connection cache and schema setup of new shard files
+
+import asyncio
+import threading
+
+import database
+from shards import ShardRouter, ShardRoutingMiddleware, ShardedSQLiteStorage
+
+def test_connection_cache_is_installed_on_initialize_and_restored_on_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", str(tmp_path / "emails.db"))
+    monkeypatch.setattr(database, "connection_cache", None)
+    storage = ShardedSQLiteStorage(ShardRouter(str(tmp_path / "shards"), shard_count=2))
+    assert database.connection_cache is None
+    storage.initialize()
+    assert database.connection_cache is storage.connection_cache
+    storage.close()
+    assert database.connection_cache is None
+
+def test_middleware_sets_up_a_new_shard_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", str(tmp_path / "emails.db"))
+    monkeypatch.setattr(database, "connection_cache", None)
+    # One file per user, so a new user means a new shard file
+    router = ShardRouter(str(tmp_path / "shards"), shard_count=0)
+    schema_threads, routed = [], []
+    initialize_database = database.initialize_database
+
+    def recording_initialize_database():
+        schema_threads.append(threading.current_thread())
+        return initialize_database()
+    monkeypatch.setattr(database, "initialize_database", recording_initialize_database)
+
+    async def app(scope, receive, send):
+        routed.append(database.active_database.get())
+
+    async def request():
+        middleware = ShardRoutingMiddleware(app, router)
+        scope = {"type": "http", "path": "/api/sync-status/new-user@example.com", "headers": []}
+        await middleware(scope, None, None)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(request())
+    path = router.path_for_user("new-user@example.com")
+    assert routed == [path] and router.has_schema(path)
+    assert len(schema_threads) == 1 and schema_threads[0] is not loop_thread
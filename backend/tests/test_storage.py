@@ -0,0 +1,215 @@
+# test_storage.py - The EmailStorage contract, run against every backend (see conftest.py)
+
+import json
+import time
+
+import pytest
+
+import database
+from repository import EMAIL_UPSERT_COLUMNS
+
+HOUR_MS = 3600 * 1000
+
+@pytest.fixture
+def now_ms():
+    return int(time.time() * 1000)
+
+@pytest.fixture
+def seeded(storage, user_email, now_ms):
+    """One analyzed email from alice@example.com and 25 bulk ones from three corp.example senders"""
+    storage.insert_email({
+        'id': 'conf-1', 'threadId': 't1', 'from': 'Alice <Alice@Example.com>', 'subject': 'Invoice due',
+        'snippet': 'Please pay', 'full_body': '<p>Pay the invoice</p>', 'internalDate': now_ms - 1000,
+        'labels': '["INBOX", "UNREAD"]', 'sentiment': 'URGENT', 'analysis_details': {'keywords': ['invoice']}
+    }, user_email)
+    storage.insert_emails_bulk([
+        {'id': f'conf-bulk-{i}', 'from': f'Bob {i} <bob{i % 3}@corp.example>', 'subject': f'Update {i}',
+         'snippet': 'weekly', 'internalDate': now_ms - 10_000 - i, 'labels': ['INBOX'], 'is_replied': i % 2}
+        for i in range(25)
+    ], user_email)
+    return storage
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+def test_single_and_bulk_inserts_are_listed_newest_first(seeded, user_email):
+    assert seeded.get_user_email_count(user_email) == 26
+    page = seeded.get_emails(user_email=user_email, limit=5)
+    assert len(page) == 5 and page[0]["id"] == "conf-1"
+    assert "full_body" not in page[0]
+    assert set(json.loads(page[0]["labels"])) == {"INBOX", "UNREAD"}
+
+def test_detail_returns_body_and_analysis(seeded, user_email):
+    detail = seeded.get_emails(user_email=user_email, email_id="conf-1")
+    assert len(detail) == 1
+    assert detail[0]["full_body"] == "<p>Pay the invoice</p>"
+    assert json.loads(detail[0]["analysis_details"]) == {"keywords": ["invoice"]}
+
+def test_list_filters(seeded, user_email):
+    assert len(seeded.get_emails(user_email=user_email, sender="bob1@corp.example", limit=50)) == 8
+    assert ids(seeded.get_emails(user_email=user_email, label="UNREAD")) == ["conf-1"]
+    assert len(seeded.get_emails(user_email=user_email, sentiment="urgent")) == 1
+
+def test_shaped_rows_use_the_response_columns(seeded, user_email):
+    shaped = seeded.get_emails(user_email=user_email, limit=1, shaped=True)
+    assert list(shaped[0]) == [name for name, _ in database.EMAIL_RESPONSE_COLUMNS]
+    assert shaped[0]["from"] == "Alice <Alice@Example.com>"
+
+def test_search_matches_words_and_prefixes(seeded, user_email):
+    hits = seeded.search_emails(user_email, "invoice")
+    assert ids(hits["results"]) == ["conf-1"]
+    assert "<mark>" in hits["results"][0]["match_snippet"]
+    assert ids(seeded.search_emails(user_email, "invo")["results"]) == ["conf-1"]
+    assert seeded.search_emails(user_email, "  ")["results"] == []
+
+def test_search_only_returns_the_users_own_emails(seeded, user_email, now_ms):
+    other_user = f"other-{user_email}"
+    seeded.insert_email({'id': 'other-1', 'from': 'Alice <alice@example.com>', 'subject': 'Invoice overdue',
+                         'snippet': 'Please pay', 'internalDate': now_ms}, other_user)
+    try:
+        assert ids(seeded.search_emails(user_email, "invoice")["results"]) == ["conf-1"]
+        assert ids(seeded.search_emails(other_user, "invoice")["results"]) == ["other-1"]
+    finally:
+        seeded.reset_user_data(other_user)
+
+def test_search_pages_with_a_keyset_cursor(seeded, user_email):
+    first = seeded.search_emails(user_email, "weekly", limit=10)
+    second = seeded.search_emails(user_email, "weekly", limit=20, cursor=first["next_cursor"])
+    assert first["has_more"] and len(first["results"]) == 10
+    assert len(second["results"]) == 15 and not second["has_more"] and second["next_cursor"] is None
+    assert not set(ids(first["results"])) & set(ids(second["results"]))
+    with pytest.raises(ValueError):
+        seeded.search_emails(user_email, "weekly", cursor="not-a-cursor")
+
+def test_senders_and_domains(seeded, user_email):
+    senders = seeded.get_top_senders(user_email, limit=3)
+    assert (senders[0]["address"], senders[0]["message_count"], senders[0]["domain"]) == \
+        ("bob0@corp.example", 9, "corp.example")
+    assert {row["address"] for row in seeded.get_top_senders(user_email, domain="example.com")} == {"alice@example.com"}
+    domains = {row["domain"]: row for row in seeded.get_priority_by_domain(user_email)}
+    assert domains["corp.example"]["count"] == 25
+
+def test_status_updates(seeded, user_email):
+    assert seeded.update_email_status("conf-1", user_email, is_read=True)
+    assert not seeded.update_email_status("missing", user_email, is_read=True)
+    assert seeded.update_email_status("conf-1", user_email, reply_status="AI Reply Suggested",
+                                      suggested_reply_body="Sorry about that.")
+    assert seeded.get_emails(user_email=user_email, email_id="conf-1")[0]["suggested_reply_body"] == "Sorry about that."
+    # Marking read drops the UNREAD label
+    assert seeded.get_emails(user_email=user_email, label="UNREAD") == []
+    assert ids(seeded.get_emails(user_email=user_email, is_read=True)) == ["conf-1"]
+
+def test_label_changes(seeded, user_email):
+    assert seeded.apply_label_changes(user_email, "conf-bulk-0", added=["STARRED", "UNREAD"], removed=["INBOX"])
+    assert not seeded.apply_label_changes(user_email, "missing", added=["X"])
+    relabeled = seeded.get_emails(user_email=user_email, label="STARRED")
+    assert ids(relabeled) == ["conf-bulk-0"]
+    assert set(json.loads(relabeled[0]["labels"])) == {"STARRED", "UNREAD"}
+    assert not relabeled[0]["is_read"]
+
+def test_reinsert_updates_in_place_and_keeps_the_analysis(seeded, user_email, now_ms):
+    seeded.insert_email({'id': 'conf-1', 'from': 'Alice <alice@example.com>', 'subject': 'Invoice due (updated)',
+                         'internalDate': now_ms - 1000, 'full_body': 'v2'}, user_email)
+    detail = seeded.get_emails(user_email=user_email, email_id="conf-1")[0]
+    assert seeded.get_user_email_count(user_email) == 26
+    assert detail["subject"] == "Invoice due (updated)"
+    assert json.loads(detail["analysis_details"]) == {"keywords": ["invoice"]}
+
+def test_sync_metadata_partial_updates_keep_other_fields(storage, user_email):
+    storage.update_user_sync_metadata(user_email, total_emails_count=26, sync_status="synced")
+    storage.update_user_sync_metadata(user_email, next_page_token="page-2")
+    metadata = storage.get_user_sync_metadata(user_email)
+    assert (metadata["total_emails_count"], metadata["sync_status"], metadata["next_page_token"]) == \
+        (26, "synced", "page-2")
+
+def test_analytics(seeded, user_email):
+    analytics = seeded.get_email_analytics(user_email, days=7)
+    assert (analytics["total_emails"], analytics["replied_emails"]) == (26, 12)
+    assert analytics["top_senders"][0][1] == 9
+    assert sum(row["total"] for row in analytics["timeline"]) == 26
+    # Unanalyzed rows are reported under the same key whatever the range
+    all_time = seeded.get_email_analytics(user_email, days=0)
+    assert all_time["priority_breakdown"] == analytics["priority_breakdown"]
+    assert all_time["category_breakdown"] == analytics["category_breakdown"]
+
+def test_rescoring_follows_email_age(storage, user_email, now_ms):
+    # 30 tenths scored in the first 2h (-5) is High, after 2h (-2) Medium;
+    # past 24h the bucket settles and the level stays put
+    storage.insert_email({'id': 'conf-aging', 'from': 'Dan <dan@example.com>', 'subject': 'Broken export',
+                          'internalDate': now_ms - 3 * HOUR_MS, 'sentiment': 'COMPLAINT', 'priority_level': 2,
+                          'priority_name': 'High', 'requires_immediate_attention': 1,
+                          'priority_static': 30, 'priority_bucket': 0}, user_email)
+    assert storage.rescore_priorities(now_ms)["users"].get(user_email) == 1
+    aged = storage.get_emails(user_email=user_email, email_id="conf-aging")[0]
+    assert (aged["priority_level"], aged["priority_name"], aged["requires_immediate_attention"],
+            aged["priority_bucket"]) == (3, "Medium", 0, 1)
+    assert user_email not in storage.rescore_priorities(now_ms)["users"]
+
+    assert storage.rescore_priorities(now_ms + 24 * HOUR_MS)["users"].get(user_email) == 1
+    aged = storage.get_emails(user_email=user_email, email_id="conf-aging")[0]
+    assert (aged["priority_level"], aged["priority_bucket"]) == (3, 2)
+    assert user_email not in storage.rescore_priorities(now_ms + 48 * HOUR_MS)["users"]
+
+def test_every_upsert_column_round_trips(storage, user_email, now_ms):
+    analyzed = {
+        'threadId': 't9', 'historyId': 'h9', 'from_address': 'Carol <carol@example.com>', 'subject': 'Contract',
+        'snippet': 'Signed copy', 'internalDate': now_ms, 'sentiment': 'OPPORTUNITY',
+        'sentiment_display': 'Opportunity', 'priority_level': 2, 'priority_name': 'High', 'confidence': 91,
+        'requires_immediate_attention': 1, 'auto_reply_suggested': 1, 'priority_static': 31, 'priority_bucket': 0,
+        'reply_status': 'Needs Reply', 'suggested_reply_body': 'Thanks, received.', 'is_read': 1, 'is_replied': 1
+    }
+    assert set(analyzed) == set(EMAIL_UPSERT_COLUMNS)
+    storage.insert_email({'id': 'conf-rt', 'from': analyzed['from_address'],
+                          **{k: v for k, v in analyzed.items() if k != 'from_address'}}, user_email)
+    stored = storage.get_emails(user_email=user_email, email_id="conf-rt")[0]
+    assert {column: stored[column] for column in EMAIL_UPSERT_COLUMNS} == analyzed
+
+    # A re-sync that carries no analysis keeps every stored column
+    storage.insert_email({'id': 'conf-rt', 'from': 'Carol <carol@example.com>', 'subject': 'Contract (re-synced)',
+                          'internalDate': now_ms}, user_email)
+    stored = storage.get_emails(user_email=user_email, email_id="conf-rt")[0]
+    assert {column: stored[column] for column in EMAIL_UPSERT_COLUMNS} == {**analyzed, 'subject': 'Contract (re-synced)'}
+
+    # Re-analysis overwrites the analysis columns
+    storage.insert_email({'id': 'conf-rt', 'from': 'Carol <carol@example.com>', 'priority_level': 4,
+                          'priority_name': 'Low', 'confidence': 40}, user_email)
+    stored = storage.get_emails(user_email=user_email, email_id="conf-rt")[0]
+    assert (stored["priority_level"], stored["priority_name"], stored["confidence"]) == (4, "Low", 40)
+
+def wait_for_jobs(jobs, timeout: float = 10):
+    deadline = time.time() + timeout
+    while time.time() < deadline and any(job["state"] in ("pending", "running") for job in jobs):
+        time.sleep(0.05)
+
+def test_cleanup_deletes_only_old_replied_emails(storage, user_email, now_ms):
+    for email_id, replied in (("conf-old", 1), ("conf-old-open", 0)):
+        storage.insert_email({'id': email_id, 'from': 'Eve <eve@example.com>', 'subject': 'Old thread',
+                              'internalDate': now_ms - 40 * 24 * HOUR_MS, 'is_replied': replied}, user_email)
+    storage.insert_email({'id': 'conf-recent', 'from': 'Eve <eve@example.com>', 'subject': 'New thread',
+                          'internalDate': now_ms, 'is_replied': 1}, user_email)
+    assert storage.cleanup_old_emails(days_old=30)["deleted"] >= 1
+    assert storage.get_emails(user_email=user_email, email_id="conf-old") == []
+    assert len(storage.get_emails(user_email=user_email, email_id="conf-old-open")) == 1
+    assert len(storage.get_emails(user_email=user_email, email_id="conf-recent")) == 1
+
+def test_background_cleanup_reports_its_jobs(storage, user_email, now_ms):
+    storage.insert_email({'id': 'conf-old', 'from': 'Eve <eve@example.com>', 'subject': 'Old thread',
+                          'internalDate': now_ms - 40 * 24 * HOUR_MS, 'is_replied': 1}, user_email)
+    started = storage.cleanup_old_emails(days_old=30, background=True)
+    jobs = started["jobs"] if "jobs" in started else [started["job"]]
+    wait_for_jobs(jobs)
+    assert [job["state"] for job in jobs] == ["completed"] * len(jobs)
+    assert all(storage.get_maintenance_job(job["id"]) is job for job in jobs)
+    assert storage.get_emails(user_email=user_email, email_id="conf-old") == []
+
+@pytest.mark.parametrize("background", [False, True])
+def test_reset_removes_emails_and_metadata(seeded, user_email, background):
+    seeded.update_user_sync_metadata(user_email, total_emails_count=26, sync_status="synced")
+    result = seeded.reset_user_data(user_email, background=background)
+    if background:
+        wait_for_jobs([result["job"]])
+        assert (result["job"]["state"], result["job"]["deleted"]) == ("completed", 26)
+    else:
+        assert (result["emails_deleted"], result["metadata_deleted"]) == (26, 1)
+    assert seeded.get_user_email_count(user_email) == 0
+    assert seeded.get_user_sync_metadata(user_email) is None
@@ -0,0 +1,68 @@
+# test_thread_summaries.py - Thread digests merge messages and give each one only its earlier context
+
+import thread_summaries
+from thread_summaries import (
+    THREAD_SUMMARY_MAX_ENTRIES, attach_thread_context, merge_entries, remember_thread_messages,
+    summary_entry, thread_context
+)
+
+DAY_MS = 24 * 3600 * 1000
+START_MS = 1_700_000_000_000
+
+def message(n: int, thread_id: str = "t1", snippet: str = None) -> dict:
+    return {'id': f'm{n}', 'threadId': thread_id, 'from': f'Sender {n} <sender{n}@example.com>',
+            'snippet': snippet or f'message number {n}', 'internalDate': START_MS + n * DAY_MS}
+
+def test_summary_entry_keeps_name_day_and_snippet_start():
+    entry = summary_entry({**message(0), 'snippet': 'word ' * 100})
+    assert entry["line"].startswith("Sender 0 (2023-11-14): word word")
+    assert entry["line"].endswith("…") and len(entry["line"]) < 200
+
+def test_merge_keeps_the_newest_entries_in_date_order():
+    count = THREAD_SUMMARY_MAX_ENTRIES + 3
+    summary = merge_entries(None, [message(n) for n in reversed(range(count))])
+    assert [entry["id"] for entry in summary["entries"]] == [f"m{n}" for n in range(3, count)]
+    assert summary["omitted"] == 3
+
+    # Older messages loaded later count as omitted too
+    summary = merge_entries(summary, [message(-1)])
+    assert len(summary["entries"]) == THREAD_SUMMARY_MAX_ENTRIES and summary["omitted"] == 4
+
+def test_merging_a_known_message_replaces_its_line():
+    summary = merge_entries(None, [message(0), message(1)])
+    summary = merge_entries(summary, [message(1, snippet="edited text")])
+    assert [entry["id"] for entry in summary["entries"]] == ["m0", "m1"]
+    assert summary["entries"][1]["line"].endswith("edited text") and summary["omitted"] == 0
+
+def test_context_holds_only_earlier_messages():
+    summary = merge_entries(None, [message(n) for n in range(3)])
+    assert thread_context(summary, message(0)) is None
+    context = thread_context(summary, message(1))
+    assert context.splitlines() == [f"- {summary['entries'][0]['line']}"]
+    assert "message number 2" not in thread_context(summary, message(2))
+    assert thread_context(None, message(1)) is None
+
+def test_context_trims_the_oldest_lines_and_counts_them():
+    summary = merge_entries(None, [message(n) for n in range(THREAD_SUMMARY_MAX_ENTRIES + 2)])
+    newest = message(THREAD_SUMMARY_MAX_ENTRIES + 2)
+    line_length = len(summary["entries"][-1]["line"])
+    lines = thread_context(summary, newest, max_chars=line_length * 2).splitlines()
+    # Two lines fit: the other digest lines plus the two messages the digest dropped are counted
+    assert lines[0] == f"({THREAD_SUMMARY_MAX_ENTRIES} earlier messages not shown)"
+    assert lines[1:] == [f"- {entry['line']}" for entry in summary["entries"][-2:]]
+
+def test_batch_and_stored_digests_feed_the_context(analysis_stores):
+    batch = [message(2), message(1), message(0), message(5, thread_id="t2")]
+    assert attach_thread_context(batch, "user@example.com") == 2
+    assert "thread_context" not in batch[2] and "thread_context" not in batch[3]
+    assert "message number 0" in batch[1]["thread_context"]
+    assert "message number 1" in batch[0]["thread_context"] and "message number 2" not in batch[0]["thread_context"]
+
+    remember_thread_messages(batch, "user@example.com")
+    later = [message(3)]
+    assert attach_thread_context(later, "user@example.com") == 1
+    assert [line.rsplit(": ", 1)[1] for line in later[0]["thread_context"].splitlines()] == \
+        ["message number 0", "message number 1", "message number 2"]
+    # Digests are per user
+    assert attach_thread_context([message(3)], "other@example.com") == 0
+    assert thread_summaries.thread_summaries.delete_user("user@example.com") == 2
@@ -0,0 +1,171 @@
+# thread_summaries.py - Compact rolling context per Gmail thread for classification
+#
+# Instead of sending whole threads (gmail_utils.get_conversation_context) with
+# every classification, each thread keeps a short digest: one line per earlier
+# message (sender, date, start of the snippet), capped at
+# THREAD_SUMMARY_MAX_ENTRIES lines. New messages are merged into the digest as
+# they are analyzed, so the thread is never re-read. A message is classified
+# with the digest lines older than itself, trimmed to THREAD_CONTEXT_MAX_CHARS
+# (about 150 tokens), which works for newest-first and load-older syncs alike.
+#
+# Digests live in their own SQLite file keyed by (user_email, threadId), shared
+# by every storage backend, like the classification cache.
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import json
+import os
+import re
+import sqlite3
+import time
+
+from side_database import SideDatabase
+
+THREAD_SUMMARY_PATH = os.getenv("THREAD_SUMMARY_PATH", "thread_summaries.db")
+THREAD_SUMMARY_MAX_ENTRIES = int(os.getenv("THREAD_SUMMARY_MAX_ENTRIES", "8"))
+THREAD_CONTEXT_MAX_CHARS = int(os.getenv("THREAD_CONTEXT_MAX_CHARS", "600"))
+SUMMARY_SNIPPET_CHARS = 140
+
+def message_date(email_data: Dict) -> int:
+    try:
+        return int(email_data.get("internalDate") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def summary_entry(email_data: Dict) -> Dict:
+    """One digest line for a message: sender name, day and the start of the snippet"""
+    sender = email_data.get("from") or email_data.get("from_address") or ""
+    name = re.sub(r"\s*<[^>]*>", "", sender).strip().strip('"') or sender
+    date = message_date(email_data)
+    day = datetime.fromtimestamp(date / 1000, tz=timezone.utc).strftime("%Y-%m-%d") if date else "unknown date"
+    snippet = " ".join((email_data.get("snippet") or "").split())
+    if len(snippet) > SUMMARY_SNIPPET_CHARS:
+        snippet = snippet[:SUMMARY_SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+    return {"id": email_data.get("id"), "date": date, "line": f"{name} ({day}): {snippet}"}
+
+def merge_entries(summary: Optional[Dict], emails: List[Dict]) -> Dict:
+    """Add messages to a digest, keeping the newest THREAD_SUMMARY_MAX_ENTRIES lines"""
+    summary = summary or {"entries": [], "omitted": 0}
+    entries = {entry["id"]: entry for entry in summary["entries"]}
+    for email_data in emails:
+        entries[email_data.get("id")] = summary_entry(email_data)
+    ordered = sorted(entries.values(), key=lambda entry: entry["date"])
+    dropped = max(0, len(ordered) - THREAD_SUMMARY_MAX_ENTRIES)
+    return {"entries": ordered[dropped:], "omitted": summary["omitted"] + dropped}
+
+def thread_context(summary: Optional[Dict], email_data: Dict, max_chars: int = THREAD_CONTEXT_MAX_CHARS) -> Optional[str]:
+    """Digest lines older than email_data, newest kept first when trimming; None without history"""
+    if not summary:
+        return None
+    date = message_date(email_data)
+    earlier = [entry for entry in summary["entries"]
+               if entry["date"] < date and entry["id"] != email_data.get("id")]
+    lines, used = [], 0
+    for entry in reversed(earlier):
+        if used + len(entry["line"]) > max_chars:
+            break
+        lines.insert(0, f"- {entry['line']}")
+        used += len(entry["line"])
+    if not lines:
+        return None
+    # Lines trimmed here, plus lines dropped from the digest (all older than its oldest entry)
+    older = len(earlier) - len(lines) + (summary["omitted"] if earlier[0] is summary["entries"][0] else 0)
+    if older:
+        lines.insert(0, f"({older} earlier messages not shown)")
+    return "\n".join(lines)
+
+class ThreadSummaryStore(SideDatabase):
+    """SQLite-backed digests keyed by (user_email, threadId)"""
+
+    def __init__(self, path: str = THREAD_SUMMARY_PATH):
+        super().__init__(path, ("hits", "misses", "updates", "errors"))
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS thread_summaries (
+                user_email TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_email, thread_id)
+            ) WITHOUT ROWID
+        """)
+
+    def get_many(self, user_email: str, thread_ids: List[str]) -> Dict[str, Dict]:
+        """Digests for the given threads (threads without one are omitted)"""
+        thread_ids = list(set(filter(None, thread_ids)))
+        if not thread_ids:
+            return {}
+        with self._lock:
+            try:
+                placeholders = ", ".join("?" for _ in thread_ids)
+                rows = self._connect().execute(
+                    f"SELECT thread_id, summary FROM thread_summaries WHERE user_email = ? AND thread_id IN ({placeholders})",
+                    [user_email, *thread_ids]
+                ).fetchall()
+            except sqlite3.Error as e:
+                # Missing context only costs accuracy; never fail the analysis over it
+                self.metrics["errors"] += 1
+                print(f"⚠️ Thread summary read failed: {e}")
+                return {}
+            self.metrics["hits"] += len(rows)
+            self.metrics["misses"] += len(thread_ids) - len(rows)
+            return {thread_id: json.loads(summary) for thread_id, summary in rows}
+
+    def put_many(self, user_email: str, summaries: Dict[str, Dict]):
+        if not summaries:
+            return
+        with self._lock:
+            try:
+                now = time.time()
+                self._connect().executemany("""
+                    INSERT INTO thread_summaries (user_email, thread_id, summary, message_count, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_email, thread_id) DO UPDATE SET
+                        summary = excluded.summary, message_count = excluded.message_count, updated_at = excluded.updated_at
+                """, [
+                    (user_email, thread_id, json.dumps(summary), len(summary["entries"]) + summary["omitted"], now)
+                    for thread_id, summary in summaries.items()
+                ])
+                self.metrics["updates"] += len(summaries)
+            except sqlite3.Error as e:
+                self.metrics["errors"] += 1
+                print(f"⚠️ Thread summary write failed: {e}")
+
+    def delete_user(self, user_email: str) -> int:
+        with self._lock:
+            return self._connect().execute("DELETE FROM thread_summaries WHERE user_email = ?",
+                                           (user_email,)).rowcount
+
+thread_summaries = ThreadSummaryStore()
+
+def attach_thread_context(emails: List[Dict], user_email: str) -> int:
+    """Set email_data['thread_context'] from stored digests plus earlier messages of the same
+    batch; returns how many emails got context"""
+    stored = thread_summaries.get_many(user_email, [email_data.get("threadId") for email_data in emails])
+    by_thread: Dict[str, List[Dict]] = {}
+    for email_data in emails:
+        if email_data.get("threadId"):
+            by_thread.setdefault(email_data["threadId"], []).append(email_data)
+    attached = 0
+    for thread_id, thread_emails in by_thread.items():
+        summary = merge_entries(stored.get(thread_id), thread_emails) if len(thread_emails) > 1 else stored.get(thread_id)
+        for email_data in thread_emails:
+            context = thread_context(summary, email_data)
+            if context:
+                email_data["thread_context"] = context
+                attached += 1
+    return attached
+
+def remember_thread_messages(emails: List[Dict], user_email: str):
+    """Merge analyzed messages into their thread digests"""
+    by_thread: Dict[str, List[Dict]] = {}
+    for email_data in emails:
+        if email_data.get("threadId"):
+            by_thread.setdefault(email_data["threadId"], []).append(email_data)
+    stored = thread_summaries.get_many(user_email, list(by_thread))
+    thread_summaries.put_many(user_email, {
+        thread_id: merge_entries(stored.get(thread_id), thread_emails)
+        for thread_id, thread_emails in by_thread.items()
+    })
@@ -0,0 +1,77 @@
+# versions.py - Per-user change versions for ETags and long-polling
+#
+# Every committed write to a user's emails or sync metadata reports itself
+# through database.notify_user_changed, which bumps that user's version here.
+# Endpoints turn the version into an ETag, so a request carrying a matching
+# If-None-Match can be answered with 304 before any database work, or parked
+# until the version moves (long-poll).
+#
+# Versions live in process memory; the epoch in every ETag keeps tags from a
+# previous process from ever matching after a restart.
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import threading
+import time
+
+import database
+
+class ChangeVersions:
+    """Monotonic per-user write counters with async waiters"""
+
+    def __init__(self):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self._versions: Dict[str, int] = {}
+        self._global_version = 0
+        self._waiters: Dict[Optional[str], List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._lock = threading.Lock()
+
+    def version(self, user_email: str) -> str:
+        return f"{self._global_version}.{self._versions.get(user_email, 0)}"
+
+    def etag(self, version: str, view: tuple) -> str:
+        """Weak ETag for one view (request parameters) of a user's data at `version`"""
+        view_hash = hashlib.sha1(repr(view).encode("utf-8")).hexdigest()[:10]
+        return f'W/"{self.epoch}.{version}.{view_hash}"'
+
+    def bump(self, user_email: Optional[str]):
+        """Record a write for one user, or for every user when user_email is None"""
+        with self._lock:
+            if user_email is None:
+                self._global_version += 1
+                waiters = [waiter for user_waiters in self._waiters.values() for waiter in user_waiters]
+                self._waiters.clear()
+            else:
+                self._versions[user_email] = self._versions.get(user_email, 0) + 1
+                waiters = self._waiters.pop(user_email, [])
+        # Writes happen on worker threads; wake each waiter on its own event loop
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait_for_change(self, user_email: str, seen_version: str, timeout: float) -> bool:
+        """Wait until the user's version differs from seen_version; False on timeout"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.version(user_email) != seen_version:
+                return True
+            self._waiters.setdefault(user_email, []).append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            with self._lock:
+                user_waiters = self._waiters.get(user_email, [])
+                if (loop, future) in user_waiters:
+                    user_waiters.remove((loop, future))
+                if not user_waiters:
+                    self._waiters.pop(user_email, None)
+            return False
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+change_versions = ChangeVersions()
+database.user_change_listeners.append(change_versions.bump)